@@ -0,0 +1,705 @@
+"""
+Author: Ricardo Bonna
+Creation date: 18/oct/2026
+Module description: This module provides the throughput and latency analysis
+of SDF graphs built with SDF.Actor, given the execution time of each actor.
+One iteration of the graph is executed symbolically in max-plus algebra,
+which gives the matrix that maps the production times of the initial tokens
+of an iteration to those of the next one. The maximum cycle mean of this
+matrix is the iteration period of the self-timed execution, and its critical
+cycle shows the actors and channels that limit the throughput. SADF graphs
+are analysed in the same way, with one matrix per detector state.
+"""
+
+from SDF import *
+from SADF import Kernel, Detector
+import numpy as np
+import random
+
+NEG = -np.inf   # Max-plus zero: the token does not depend on that entry
+
+
+def tokenCount(tokens):
+    """
+    Returns the number of initial tokens given as a list of tokens (as in
+    the SDF module) or as a number (as in the SADF module).
+    """
+    if isinstance(tokens, int):
+        return tokens
+    return len(tokens)
+
+
+class _Token(object):
+    # Symbolic token: time[j] is the delay from the initial token j (j = N is
+    # the arrival of the graph inputs of the iteration) to its production
+    __slots__ = ('time', 'firing', 'index')
+
+    def __init__(self, time, firing = None, index = None):
+        self.time = time        # Max-plus vector of N + 1 entries
+        self.firing = firing    # (actor, input tokens) of the producing firing
+        self.index = index      # Index of the initial token, or None
+
+
+def _execute(nodes, queues, firings):
+    # Executes the firings of the nodes in max-plus algebra. queues lists the
+    # token queues as (description, producer, consumer, initial tokens,
+    # produced at the start of the firings), where producer and consumer are
+    # node indexes or None for the inputs and outputs of the graph.
+    # firings[k] is the list of firings of nodes[k], in order, given as
+    # (consumed [(queue, n)], produced [(queue, n)], execution time)
+    tokens = [(desc, i) for (desc, src, dst, d, early) in queues for i in range(d)]
+    n = len(tokens)
+    fifos = []
+    j = 0
+    for (desc, src, dst, d, early) in queues:
+        fifo = deque()
+        for i in range(d):
+            time = np.full(n + 1, NEG)
+            time[j] = 0.0
+            fifo.append(_Token(time, index = j))
+            j += 1
+        fifos.append(fifo)
+    arrival = np.full(n + 1, NEG)
+    arrival[n] = 0.0
+    last = np.full(n + 1, NEG)      # Time of the last output of the iteration
+    done = [0] * len(nodes)
+    fired = True
+    while fired:
+        fired = False
+        for k, node in enumerate(nodes):
+            while done[k] < len(firings[k]):
+                (cons, prod, execTime) = firings[k][done[k]]
+                if not all(queues[i][1] is None or len(fifos[i]) >= c for (i, c) in cons):
+                    break
+                start = np.full(n + 1, NEG)
+                consumed = []
+                for (i, c) in cons:
+                    if queues[i][1] is None:
+                        np.maximum(start, arrival, out = start)
+                        continue
+                    for m in range(c):
+                        token = fifos[i].popleft()
+                        np.maximum(start, token.time, out = start)
+                        consumed.append(token)
+                end = _Token(start + execTime, (node, consumed))
+                for (i, p) in prod:
+                    if queues[i][2] is None:
+                        np.maximum(last, end.time, out = last)
+                    elif queues[i][4]:
+                        fifos[i].extend([_Token(start, (node, consumed))] * p)
+                    else:
+                        fifos[i].extend([end] * p)
+                done[k] += 1
+                fired = True
+    if any(done[k] < len(firings[k]) for k in range(len(nodes))):
+        raise Exception('Deadlock: not enough initial tokens to complete one iteration')
+    # The tokens left in the channels are the initial tokens of the next
+    # iteration, in the same positions
+    for fifo, (desc, src, dst, d, early) in zip(fifos, queues):
+        if src is not None and dst is not None and len(fifo) != d:
+            raise Exception('The iteration does not restore the initial tokens of the channels')
+    final = [token for fifo, (desc, src, dst, d, early) in zip(fifos, queues) if src is not None and dst is not None \
+        for token in fifo]
+    G = np.array([token.time[:n] for token in final]).reshape(n, n)
+    B = np.array([token.time[n] for token in final])
+
+    def paths(i, j):
+        # Follows the inputs that give the production time of token i
+        nodesOnPath = []
+        token = final[i]
+        while token.firing is not None and token.firing[1]:
+            (node, consumed) = token.firing
+            nodesOnPath.append(node)
+            token = max(consumed, key = lambda t: t.time[j])
+        if token.firing is not None:
+            nodesOnPath.append(token.firing[0])
+        return nodesOnPath[::-1]
+    return (G, B, last[:n], last[n], tokens, paths)
+
+
+def _queues(nodes, rates, delays, capacities):
+    # Lists the token queues of a graph given the rates[ch] = (producer, p,
+    # consumer, c) of its channels: the channels, the free places of the
+    # bounded channels, which are freed when the consumer starts (nodes read
+    # their inputs before firing), and the implicit self-loop of each node,
+    # which makes its firings sequential (or up to replicas at once).
+    # Returns the queues and the index of each queue by channel
+    queues = []
+    index = {}
+    for ch, (src, p, dst, c) in rates.items():
+        index[ch] = len(queues)
+        queues.append((ch, src, dst, tokenCount(delays.get(ch, 0)) if src is not None else 0, False))
+        if ch in capacities and src is not None and dst is not None and src != dst:
+            space = capacities[ch] - tokenCount(delays.get(ch, 0))
+            if space < 0:
+                raise Exception('Channel capacity smaller than its initial tokens')
+            index[('space', ch)] = len(queues)
+            queues.append((('space', ch), dst, src, space, True))
+    for k, node in enumerate(nodes):
+        index[('self', node)] = len(queues)
+        queues.append((('self', node), k, k, max(1, getattr(node, 'replicas', 0)), False))
+    return (queues, index)
+
+
+def _firing(node, index, inps, c, outs, p, execTime):
+    # Tokens consumed and produced by one firing of node
+    cons = [(index[ch], r) for ch, r in zip(inps, c)] + [(index[('self', node)], 1)]
+    prod = [(index[ch], r) for ch, r in zip(outs, p)] + [(index[('self', node)], 1)]
+    cons += [(index[('space', ch)], r) for ch, r in zip(outs, p) if ('space', ch) in index]
+    prod += [(index[('space', ch)], r) for ch, r in zip(inps, c) if ('space', ch) in index]
+    return (cons, prod, execTime)
+
+
+def maxPlusMatrix(actors, times, delays = None, capacities = None):
+    """
+    Executes one iteration of the SDF graph formed by the list actors in
+    max-plus algebra. Each firing starts when its input tokens (and the
+    previous firing of the actor) are available and produces its tokens
+    times[actor] later. Inputs of the graph are available when the iteration
+    starts.
+
+    Parameters
+    ----------
+    actors : [Actor]
+        List of SDF actors.
+    times : {Actor: float}
+        Execution time of each actor, e.g. its worst case.
+    delays : {Queue: [Tokens] or int} (default = None)
+        Initial tokens of the internal channels.
+    capacities : {Queue: int} (default = None)
+        Maximum number of tokens in the internal channels.
+
+    Returns
+    ----------
+    G : np.ndarray
+        N x N matrix. G[i, j] is the delay from the initial token j of an
+        iteration to the initial token i of the next one (-inf when i does
+        not depend on j).
+    B : np.ndarray
+        Delay from the inputs of an iteration to the initial tokens of the
+        next one.
+    C : np.ndarray
+        Delay from the initial tokens of an iteration to its last output.
+    D : float
+        Delay from the inputs of an iteration to its last output.
+    tokens : [(channel, int)]
+        Channel and position of each initial token. Channels are tuples
+        ('space', ch) for the free places of bounded channels and
+        ('self', actor) for the sequential firing of the actors.
+    paths : function
+        paths(i, j) returns the list of actors on the longest path from the
+        initial token j to the next initial token i.
+    """
+    delays = delays or {}
+    capacities = capacities or {}
+    for a in actors:
+        if a not in times:
+            raise Exception('Missing execution time of actor ' + a.name)
+    q = repetitionVector(actors)
+    (queues, index) = _queues(actors, graphChannels(actors), delays, capacities)
+    firings = [[_firing(a, index, a.inps, a.c, a.outs, a.p, times[a])] * q[k] for k, a in enumerate(actors)]
+    return _execute(actors, queues, firings)
+
+
+def maxCycleMean(G):
+    """
+    Computes the maximum cycle mean of the max-plus matrix G with Karp's
+    algorithm, where G[i, j] is the weight of the edge from j to i.
+
+    Parameters
+    ----------
+    G : np.ndarray
+        N x N max-plus matrix.
+
+    Returns
+    ----------
+    mcm : float
+        Maximum cycle mean (-inf when the graph of G has no cycles).
+    cycle : [int]
+        Nodes of a critical cycle, in the order of its edges.
+    """
+    n = G.shape[0]
+    if n == 0:
+        return (NEG, [])
+    # D[k, v] is the weight of the heaviest walk with k edges ending in v
+    D = np.full((n + 1, n), NEG)
+    P = np.zeros((n + 1, n), dtype = int)
+    D[0, :] = 0.0
+    for k in range(1, n + 1):
+        W = G + D[k - 1][np.newaxis, :]
+        P[k] = np.argmax(W, axis = 1)
+        D[k] = W[np.arange(n), P[k]]
+    best = NEG
+    end = None
+    with np.errstate(invalid = 'ignore'):
+        for v in range(n):
+            if D[n, v] == NEG:
+                continue
+            means = [(D[n, v] - D[k, v]) / (n - k) for k in range(n) if D[k, v] != NEG]
+            if min(means) > best:
+                best = min(means)
+                end = v
+    if end is None:
+        return (NEG, [])
+    # The heaviest walk to end contains a critical cycle
+    walk = [end]
+    for k in range(n, 0, -1):
+        walk.append(P[k, walk[-1]])
+    walk = walk[::-1]
+    cycle = []
+    cycleMean = NEG
+    seen = {}
+    for pos, v in enumerate(walk):
+        if v in seen:
+            nodes = walk[seen[v]:pos]
+            weight = sum(G[nodes[(i + 1) % len(nodes)], nodes[i]] for i in range(len(nodes)))
+            if weight / len(nodes) > cycleMean:
+                cycleMean = weight / len(nodes)
+                cycle = nodes
+        seen[v] = pos
+    return (best, cycle)
+
+
+def _name(desc):
+    if isinstance(desc, tuple):
+        return desc[0] + ':' + (desc[1].name if desc[0] == 'self' else _name(desc[1]))
+    return 'channel ' + str(id(desc))
+
+
+def analyze(actors, times, delays = None, capacities = None, names = None):
+    """
+    Computes the throughput and the latency of the self-timed execution of
+    the SDF graph formed by the list actors, where each actor fires as soon
+    as its inputs are available.
+
+    Parameters
+    ----------
+    actors : [Actor]
+        List of SDF actors.
+    times : {Actor: float}
+        Execution time of each actor, e.g. its measured worst case.
+    delays : {Queue: [Tokens] or int} (default = None)
+        Initial tokens of the internal channels.
+    capacities : {Queue: int} (default = None)
+        Maximum number of tokens in the internal channels.
+    names : {Queue: str} (default = None)
+        Names of the channels, used in the critical cycle.
+
+    Returns
+    ----------
+    result : dict
+        'q': repetition vector;
+        'period': time of one iteration in the periodic regime (maximum
+        cycle mean);
+        'throughput': iterations per time unit;
+        'firingRates': firings per time unit of each actor;
+        'critical': actors on the critical cycle;
+        'criticalTokens': channels of the initial tokens on the critical
+        cycle, where ('space', ch) is the free space of a bounded channel
+        and ('self', actor) the sequential firing of an actor;
+        'iterationLatency': time from the start of the graph until the last
+        output of the first iteration;
+        'latency': time from the arrival of the inputs of an iteration to
+        its last output, when inputs arrive once per period.
+    """
+    names = names or {}
+    q = repetitionVector(actors)
+    (G, B, C, D, tokens, paths) = maxPlusMatrix(actors, times, delays, capacities)
+    (period, cycle) = maxCycleMean(G)
+    period = max(period, 0.0)
+    critical = []
+    for i in range(len(cycle)):
+        for a in paths(cycle[(i + 1) % len(cycle)], cycle[i]):
+            if a not in critical:
+                critical.append(a)
+    criticalTokens = []
+    for v in cycle:
+        desc = tokens[v][0]
+        label = names.get(desc, desc) if not isinstance(desc, tuple) else desc
+        if label not in criticalTokens:
+            criticalTokens.append(label)
+    # Latency: the inputs of iteration k arrive at k * period. The second
+    # half of the iterations is taken as the periodic regime
+    n = G.shape[0]
+    x = np.zeros(n)
+    steps = min(2 * n + 20, 2000)
+    lags = []
+    for k in range(steps):
+        u = k * period
+        lags.append(max(np.max(C + x), D + u) - u)
+        x = np.maximum(np.max(G + x[np.newaxis, :], axis = 1), B + u)
+    iterationLatency = float(lags[0])
+    latency = float(max(lags[steps // 2:]))
+    if latency == NEG:
+        # The graph has no outputs
+        iterationLatency = latency = None
+    return {'q': q, 'period': float(period), 'throughput': 1 / period if period > 0 else float('inf'), \
+        'firingRates': {a: q[k] / period if period > 0 else float('inf') for k, a in enumerate(actors)}, \
+        'critical': critical, 'criticalTokens': criticalTokens, 'iterationLatency': iterationLatency, \
+        'latency': latency}
+
+
+def sensitivity(actors, times, delays = None, capacities = None):
+    """
+    Computes how the iteration period changes when one initial token or one
+    place of capacity is added to each internal channel. Channels whose
+    extra token or place shortens the period are the ones worth enlarging.
+
+    Parameters
+    ----------
+    actors : [Actor]
+        List of SDF actors.
+    times : {Actor: float}
+        Execution time of each actor.
+    delays : {Queue: [Tokens] or int} (default = None)
+        Initial tokens of the internal channels.
+    capacities : {Queue: int} (default = None)
+        Maximum number of tokens in the internal channels.
+
+    Returns
+    ----------
+    changes : {Queue: (float, float)}
+        For each internal channel, the period with one more initial token
+        and the period with one more place (None for unbounded channels).
+        Periods are None when the change deadlocks the graph.
+    """
+    delays = {ch: tokenCount(d) for ch, d in (delays or {}).items()}
+    capacities = capacities or {}
+    def period(d, cap):
+        try:
+            (G, B, C, D, tokens, paths) = maxPlusMatrix(actors, times, d, cap)
+        except Exception:
+            return None
+        return float(max(maxCycleMean(G)[0], 0.0))
+    changes = {}
+    for ch, (src, p, dst, c) in graphChannels(actors).items():
+        if src is None or dst is None:
+            continue
+        d = dict(delays)
+        d[ch] = d.get(ch, 0) + 1
+        cap = dict(capacities)
+        withPlace = None
+        if ch in cap:
+            cap[ch] += 1
+            withPlace = period(delays, cap)
+        # The extra token takes a place too
+        changes[ch] = (period(d, cap), withPlace)
+    return changes
+
+
+def measuredTimes(traces, actors, worst = True):
+    """
+    Extracts the execution time of each actor from the traces of a network
+    (see Network(trace = True)), matching actors and traces by name.
+
+    Parameters
+    ----------
+    traces : [dict]
+        Traces of a network run.
+    actors : [Actor]
+        List of SDF actors.
+    worst : bool (default = True)
+        Returns the longest firing when True, or the mean firing otherwise.
+
+    Returns
+    ----------
+    times : {Actor: float}
+        Execution time of each traced actor.
+    """
+    byName = {}
+    for t in traces:
+        for r in t['records']:
+            byName.setdefault(r[0] or t['name'], []).append(r[3] - r[2])
+    times = {}
+    for a in actors:
+        if a.name in byName:
+            values = byName[a.name]
+            times[a] = max(values) if worst else sum(values) / len(values)
+    return times
+
+
+def detectorStates(detector, alphabet, maxStates = 10000):
+    """
+    Enumerates the states that the detector reaches from its current state
+    when it reads the input values in alphabet.
+
+    Parameters
+    ----------
+    detector : Detector
+        SADF detector.
+    alphabet : [[[Tokens]]]
+        Possible inputs of one firing of the detector, each a list of token
+        lists as passed to its next state function.
+    maxStates : int (default = 10000)
+        Maximum number of states.
+
+    Returns
+    ----------
+    states : [State]
+        Reachable states, starting with the current state.
+    transitions : [[int]]
+        transitions[i] lists the indexes of the states that follow state i.
+    """
+    states = [detector.state]
+    transitions = []
+    i = 0
+    while i < len(states):
+        successors = []
+        for inputs in alphabet:
+            s = detector.f(states[i], inputs)
+            if s not in states:
+                if len(states) >= maxStates:
+                    raise Exception('The detector has more than ' + str(maxStates) + ' reachable states')
+                states.append(s)
+            j = states.index(s)
+            if j not in successors:
+                successors.append(j)
+        transitions.append(successors)
+        i += 1
+    return (states, transitions)
+
+
+def _nodeTime(times, node, arg):
+    # Execution time of a firing: a number, a dictionary indexed by scenario
+    # function, or a function of the control token (kernels) or of the
+    # state (detectors)
+    t = times.get(node)
+    if t is None:
+        if isinstance(node, Fork):
+            return 0.0
+        raise Exception('Missing execution time of node ' + node.name)
+    if callable(t):
+        return t(arg)
+    if isinstance(t, dict):
+        return t[arg[2]]
+    return t
+
+
+def scenarioMatrix(nodes, state, times, delays = None, capacities = None):
+    """
+    Executes in max-plus algebra the iteration of the SADF graph formed by
+    the list nodes in which its detector is in state: the detector fires
+    once and the kernels fire with the control tokens it emits. Forks and
+    SDF actors fire as often as their inputs allow.
+
+    Parameters
+    ----------
+    nodes : [Kernel, Detector, Fork, Actor]
+        List of processes of the graph, with a single detector.
+    state : State
+        State of the detector.
+    times : {Node: float, dict or function}
+        Execution time of the nodes. A kernel time can be a dictionary
+        indexed by scenario function or a function of the control token,
+        and a detector time a function of the state. Forks default to 0.
+    delays : {Queue: [Tokens] or int} (default = None)
+        Initial tokens of the internal channels.
+    capacities : {Queue: int} (default = None)
+        Maximum number of tokens in the internal channels.
+
+    Returns
+    ----------
+    The same values as maxPlusMatrix.
+    """
+    delays = delays or {}
+    capacities = capacities or {}
+    detectors = [d for d in nodes if isinstance(d, Detector)]
+    if len(detectors) != 1:
+        raise Exception('The analysis supports graphs with exactly one detector')
+    detector = detectors[0]
+    ctrl = dict(zip(detector.outs, detector.g(state)))
+    # Firing rates of every node in this scenario
+    specs = {}      # Node: [(inps, c, outs, p, time)]
+    specs[detector] = [(detector.inps, detector.c, detector.outs, [len(ctrl[ch]) for ch in detector.outs], \
+        _nodeTime(times, detector, state))]
+    for node in nodes:
+        if isinstance(node, Kernel):
+            firings = []
+            for token in ctrl.get(node.ctrl, []):
+                ((c, p, f), label, n) = node.decode(token)
+                # The control token is read by the first firing of a run
+                firings.append(([node.ctrl] + list(node.inps), [1] + list(c), node.outs, p, \
+                    _nodeTime(times, node, (c, p, f))))
+                firings += [(node.inps, c, node.outs, p, _nodeTime(times, node, (c, p, f)))] * (n - 1)
+            specs[node] = firings
+    # Forks and actors fire with the tokens produced for them, once the
+    # firings of their producers are known
+    producer = {ch: m for m in nodes for ch in m.outputChannels()}
+    pending = [n for n in nodes if n not in specs]
+    while pending:
+        produced = {}
+        for spec in specs.values():
+            for (inps, c, outs, p, t) in spec:
+                for ch, r in zip(outs, p):
+                    produced[ch] = produced.get(ch, 0) + r
+        ready = [n for n in pending if all(ch not in producer or producer[ch] in specs for ch in n.inputChannels())]
+        if not ready:
+            raise Exception('Cyclic dependency between Forks and SDF actors')
+        for node in ready:
+            ch = node.inputChannels()[0]
+            if isinstance(node, Fork):
+                count = produced.get(ch, 0)
+                specs[node] = [([node.inp], [1], node.outs, [1] * len(node.outs), _nodeTime(times, node, None))] * count
+            else:
+                count = produced.get(ch, 0) // node.c[0]
+                specs[node] = [(node.inps, node.c, node.outs, node.p, _nodeTime(times, node, None))] * count
+            pending.remove(node)
+    ends = {}       # Producer and consumer of each channel (rates are unused)
+    for k, node in enumerate(nodes):
+        for ch in node.outputChannels():
+            ends[ch] = (k, 0, None, 0)
+    for k, node in enumerate(nodes):
+        for ch in node.inputChannels():
+            ends[ch] = (ends.get(ch, (None,))[0], 0, k, 0)
+    (queues, index) = _queues(nodes, ends, delays, capacities)
+    firings = [[_firing(node, index, inps, c, outs, p, t) for (inps, c, outs, p, t) in specs[node]] for node in nodes]
+    return _execute(nodes, queues, firings)
+
+
+def _markovNext(i, transitions, states, probabilities, rng):
+    # Draws the state after state i
+    succ = transitions[i]
+    if probabilities is None:
+        return rng.choice(succ)
+    weights = probabilities
+    if all(isinstance(p, dict) for p in probabilities.values()):
+        weights = probabilities.get(states[i], {})
+    w = [weights.get(states[j], 0.0) for j in succ]
+    if sum(w) == 0:
+        raise Exception('No probability for the successors of state ' + str(states[i]))
+    return rng.choices(succ, w)[0]
+
+
+def analyzeScenarios(nodes, alphabet, times, delays = None, capacities = None, probabilities = None, \
+    iterations = 10000, seed = 0):
+    """
+    Computes the worst-case and the long-run average throughput of the SADF
+    graph formed by the list nodes. The reachable states of its detector are
+    enumerated and each gives a max-plus matrix (see scenarioMatrix). The
+    worst case is the maximum cycle mean of the graph that chains the
+    matrices along the transitions of the detector. The average case is
+    estimated by executing iterations scenarios drawn from a Markov chain
+    over the states.
+
+    Parameters
+    ----------
+    nodes : [Kernel, Detector, Fork, Actor]
+        List of processes of the graph, with a single detector.
+    alphabet : [[[Tokens]]]
+        Possible inputs of one firing of the detector (see detectorStates).
+    times : {Node: float, dict or function}
+        Execution time of the nodes (see scenarioMatrix).
+    delays : {Queue: [Tokens] or int} (default = None)
+        Initial tokens of the internal channels.
+    capacities : {Queue: int} (default = None)
+        Maximum number of tokens in the internal channels.
+    probabilities : dict (default = None)
+        Probabilities of the next state: {state: {next state: p}} for a
+        Markov chain, or {state: p} for states drawn independently. Only
+        the successors of each state are drawn. When None, successors are
+        equally likely.
+    iterations : int (default = 10000)
+        Number of scenarios executed for the average case.
+    seed : int (default = 0)
+        Seed of the random scenario sequence.
+
+    Returns
+    ----------
+    result : dict
+        'states': reachable detector states;
+        'transitions': indexes of the successors of each state;
+        'periods': period of each state, when repeated forever;
+        'worstPeriod' and 'worstThroughput': worst case over all scenario
+        sequences, in time per iteration and iterations per time unit;
+        'worstCycle': states of a scenario sequence that attains it;
+        'averagePeriod' and 'averageThroughput': long-run average case.
+    """
+    detector = [d for d in nodes if isinstance(d, Detector)][0]
+    (states, transitions) = detectorStates(detector, alphabet)
+    matrices = [scenarioMatrix(nodes, s, times, delays, capacities)[0] for s in states]
+    n = matrices[0].shape[0]
+    periods = [float(max(maxCycleMean(G)[0], 0.0)) for G in matrices]
+    # Worst case: node (state, token), with the edges of the matrix of the
+    # next state between consecutive states
+    big = np.full((len(states) * n, len(states) * n), NEG)
+    for i in range(len(states)):
+        for j in transitions[i]:
+            big[j * n:(j + 1) * n, i * n:(i + 1) * n] = matrices[j]
+    (worst, cycle) = maxCycleMean(big)
+    worst = float(max(worst, 0.0))
+    worstCycle = []
+    for v in cycle:
+        if not worstCycle or worstCycle[-1] != states[v // n]:
+            worstCycle.append(states[v // n])
+    # Average case: x(k+1) = G(s_k+1) x(k), renormalized to avoid overflow
+    rng = random.Random(seed)
+    x = np.zeros(n)
+    i = 0
+    growth = 0.0
+    for k in range(iterations):
+        i = _markovNext(i, transitions, states, probabilities, rng)
+        x = np.max(matrices[i] + x[np.newaxis, :], axis = 1)
+        top = np.max(x)
+        growth += top
+        x -= top
+    average = float(max(growth / iterations, 0.0)) if iterations else None
+    return {'states': states, 'transitions': transitions, 'periods': periods, 'worstPeriod': worst, \
+        'worstThroughput': 1 / worst if worst > 0 else float('inf'), 'worstCycle': worstCycle, \
+        'averagePeriod': average, 'averageThroughput': 1 / average if average else float('inf')}
+
+
+# Test of the module
+if __name__ == '__main__':
+    print("SDF analysis test model")
+
+    def f(a):
+        return a
+
+    # a -> b -> c with a feedback channel from c to a with 2 initial tokens
+    q1 = Queue()
+    q2 = Queue()
+    q3 = Queue()
+    a = Actor([1], [2], f, [q3], [q1], name = 'a')
+    b = Actor([1], [1], f, [q1], [q2], name = 'b')
+    c = Actor([2], [1], f, [q2], [q3], name = 'c')
+    times = {a: 1.0, b: 2.0, c: 1.0}
+    r = analyze([a, b, c], times, {q3: 2})
+    print(r['q'], r['period'], [x.name for x in r['critical']], r['iterationLatency'])
+
+    # Open chain: the slowest actor sets the period
+    q4 = Queue()
+    d = Actor([1], [1], f, [q4], [q1], name = 'd')
+    r = analyze([d, b], {d: 1.0, b: 3.0}, capacities = {q1: 1})
+    print(r['period'], r['latency'])
+    r = analyze([d, b], {d: 3.0, b: 3.0}, capacities = {q1: 1})
+    print(r['period'], r['latency'])
+    print([s for s in sensitivity([d, b], {d: 3.0, b: 3.0}, capacities = {q1: 1}).values()])
+
+    print("SADF analysis test model")
+
+    def next_state(s, inps):
+        return inps[0][0]
+
+    def func1(a):
+        return [[a[0][0] + a[1][0]]]
+
+    def func2(a):
+        return [[a[0][0] - 10]]
+
+    def out_decode(s):
+        if s == 1:
+            return [[([1,1], [1], func1)]]
+        return [[([1,0], [1], func2)]]
+
+    si = Queue()
+    so = Queue()
+    sfb = Queue()
+    sd = Queue()
+    sctrl = Queue()
+    sko = Queue()
+    kernel = Kernel(sctrl, [sfb, si], [sko])
+    fork = Fork(sko, [sfb, so])
+    detector = Detector([1], next_state, out_decode, 1, [sd], [sctrl])
+    r = analyzeScenarios([kernel, fork, detector], [[[1]], [[2]]], {kernel: {func1: 3.0, func2: 1.0}, detector: 0.5}, \
+        {sfb: 1}, probabilities = {1: 0.25, 2: 0.75})
+    print(r['states'], r['periods'], r['worstPeriod'], r['worstCycle'], round(r['averagePeriod'], 1))
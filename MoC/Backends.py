@@ -0,0 +1,467 @@
+"""
+Author: Ricardo Bonna
+Creation date: 18/oct/2026
+Module description: This module provides the execution backends that run the
+processes of a model (Actor, Kernel, Detector and Fork): one OS process per
+node, one thread per node, one asyncio coroutine per node, or a pool of warm
+worker processes that are reused by the nodes of successive networks.
+"""
+
+from multiprocessing import Process, util, resource_tracker
+from Channels import *
+import multiprocessing
+import traceback
+import threading
+import time
+import asyncio
+import os
+
+
+class ProcessBackend(object):
+    """
+    Runs each node in its own multiprocessing Process. Nodes communicate
+    through Queues or Channels.
+    """
+    name = 'process'
+
+    def start(self, node):
+        """
+        Starts the execution of node and returns its worker, an object with
+        the methods join, terminate and is_alive.
+        """
+        worker = Process(target = node.run, name = node.name)
+        worker.start()
+        return worker
+
+    def channel(self, capacity = 0):
+        """
+        Creates a channel suitable for the nodes of this backend.
+        """
+        return Channel(capacity)
+
+
+class ThreadWorker(threading.Thread):
+    """
+    Thread that runs a node. Threads can not be killed, so terminate asks the
+    node to stop before its next firing.
+    """
+    def __init__(self, node):
+        threading.Thread.__init__(self, target = node.run, name = node.name, daemon = True)
+        self.node = node
+
+    def terminate(self):
+        self.node.stopped = True
+
+
+class ThreadBackend(object):
+    """
+    Runs each node in a thread of the current process. Nodes communicate
+    through LocalChannels, or through Channels when connected to nodes of
+    other processes. It pays off when the node functions release the GIL
+    (e.g. NumPy) or are too light to justify a process.
+    """
+    name = 'thread'
+
+    def start(self, node):
+        """
+        Starts the execution of node and returns its worker.
+        """
+        worker = ThreadWorker(node)
+        worker.start()
+        return worker
+
+    def channel(self, capacity = 0):
+        """
+        Creates a channel suitable for the nodes of this backend.
+        """
+        return LocalChannel(capacity)
+
+
+class CoroutineWorker(object):
+    """
+    Handle of a node running as a coroutine in the event loop of an
+    AsyncioBackend.
+    """
+    def __init__(self, future):
+        self.future = future    # concurrent.futures.Future of the coroutine
+
+    def join(self, timeout = None):
+        try:
+            self.future.result(timeout)
+        except Exception:
+            pass
+
+    def terminate(self):
+        self.future.cancel()
+
+    def is_alive(self):
+        return not self.future.done()
+
+
+class AsyncioBackend(object):
+    """
+    Runs each node as a coroutine of a single asyncio event loop, executed by
+    a background thread. Nodes communicate through LocalChannels. Reading a
+    channel without the coroutine methods (e.g. a Queue) blocks a thread of
+    the default executor of the loop instead of the loop itself.
+    """
+    name = 'asyncio'
+
+    def __init__(self):
+        self.loop = None        # Event loop, created by the first start
+        self.thread = None      # Thread running the event loop
+
+    def start(self, node):
+        """
+        Starts the execution of node and returns its worker.
+        """
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+            self.thread = threading.Thread(target = self.loop.run_forever, name = 'asyncio-backend', daemon = True)
+            self.thread.start()
+        return CoroutineWorker(asyncio.run_coroutine_threadsafe(node.arun(), self.loop))
+
+    def channel(self, capacity = 0):
+        """
+        Creates a channel suitable for the nodes of this backend.
+        """
+        return LocalChannel(capacity)
+
+    def __getstate__(self):
+        raise Exception('Nodes of an AsyncioBackend can not be sent to other processes')
+
+
+################### Worker pool ####################
+
+_banks = {}     # Channel banks of the pools, by pool id, in the pool workers
+
+
+def _poolWorker(conn, bank, poolId, preload):
+    # Main loop of a pool worker: runs the nodes it receives, one at a time
+    _banks[poolId] = bank
+    for name in preload:
+        __import__(name)
+    conn.send(True)     # Ready
+    while 1:
+        try:
+            node = conn.recv()
+        except EOFError:
+            break
+        except Exception as e:
+            # The node can not be rebuilt here, e.g. its function was defined
+            # in __main__ after the worker was started
+            conn.send(type(e).__name__ + ': ' + str(e))
+            continue
+        if node is None:
+            break
+        conn.send(None)     # Received
+        try:
+            node.run()
+        except Exception:
+            traceback.print_exc()
+        conn.send(True)
+
+
+def _poolChannel(poolId, index, capacity, generation):
+    # Rebuilds a PoolChannel in a pool worker from its bank slot
+    if poolId not in _banks:
+        raise Exception('Channel of another pool sent to a pool worker')
+    ch = PoolChannel.__new__(PoolChannel)
+    ch.attach(_banks[poolId], poolId, index, generation)
+    ch.capacity = capacity
+    ch.free = ch.sem if capacity != 0 else None
+    return ch
+
+
+class _SlotQueue(object):
+    """
+    Queue of a bank slot as seen by one PoolChannel. Messages are tagged
+    with the generation of the channel, and the messages of earlier channels
+    of the slot, which may still be in flight in the feeder thread of a
+    worker when their channel is unlinked, are discarded.
+    """
+    def __init__(self, queue, generation):
+        self.queue = queue
+        self.generation = generation
+
+    def put(self, msg):
+        self.queue.put((self.generation, msg))
+
+    def get(self, block = True, timeout = None):
+        deadline = None if timeout is None else time.time() + timeout
+        while 1:
+            left = None if deadline is None else max(deadline - time.time(), 0)
+            (generation, msg) = self.queue.get(block, left)
+            if generation == self.generation:
+                return msg
+
+    def get_nowait(self):
+        return self.get(False)
+
+
+class PoolChannel(Channel):
+    """
+    Channel of a PoolBackend. Its queue and semaphore belong to the bank of
+    the pool, which was created before the workers and is inherited by them,
+    so the channel is sent to a worker as the index of its slot. unlink gives
+    the slot back to the pool. Each channel of a slot has a new generation,
+    which tags its messages (see _SlotQueue).
+    """
+    def __init__(self, pool, index, capacity = 0):
+        """
+        PoolChannel initializer.
+
+        Parameters
+        ----------
+        pool : PoolBackend
+            Pool that owns the channel.
+        index : int
+            Slot of the channel in the bank of the pool.
+        capacity : int (default = 0)
+            Maximum number of tokens in the channel. When capacity = 0, the
+            channel is unbounded.
+        """
+        self.pool = pool
+        pool.generation += 1
+        self.attach(pool.bank, pool.id, index, pool.generation)
+        self.setCapacity(capacity)
+
+    def attach(self, bank, poolId, index, generation):
+        (queue, self.sem) = bank[index]
+        self.queue = _SlotQueue(queue, generation)
+        self.poolId = poolId
+        self.index = index
+        self.generation = generation
+        self.buffer = deque()
+        self.capacity = 0
+        self.free = None
+        self.pending = 0
+
+    def setCapacity(self, capacity):
+        """
+        Sets the maximum number of tokens in the channel. It must be called
+        before the nodes that use the channel are started. The semaphore of
+        the slot is reused, so its value is set to the free places.
+        """
+        if capacity != 0 and capacity < self.pending:
+            raise Exception('Channel capacity smaller than the number of tokens already in the channel')
+        while self.sem.acquire(False):
+            pass
+        for j in range(capacity - self.pending if capacity != 0 else 0):
+            self.sem.release()
+        self.capacity = capacity
+        self.free = self.sem if capacity != 0 else None
+
+    def __reduce__(self):
+        return (_poolChannel, (self.poolId, self.index, self.capacity, self.generation))
+
+    def unlink(self):
+        """
+        Discards the tokens left in the channel and gives its slot back to
+        the pool. Must be called once the nodes that use it have stopped.
+        Messages that arrive later are discarded by the next channel of the
+        slot.
+        """
+        if self.index is None:
+            return
+        try:
+            while 1:
+                self.queue.queue.get_nowait()
+        except Empty:
+            pass
+        while self.sem.acquire(False):
+            pass
+        self.pool.slots.append(self.index)
+        self.index = None
+
+
+class PoolWorker(object):
+    """
+    Handle of a node running in a worker of a PoolBackend. When the node
+    stops, the worker goes back to the pool.
+    """
+    def __init__(self, pool, worker):
+        self.pool = pool
+        self.worker = worker    # (process, connection) of the pool worker
+        self.done = False
+
+    def _check(self, timeout):
+        (proc, conn) = self.worker
+        if self.done or not conn.poll(timeout):
+            return
+        self.done = True
+        try:
+            conn.recv()
+            self.pool.idle.append(self.worker)
+        except EOFError:
+            # The worker died with its node
+            self.pool.discard(self.worker)
+
+    def join(self, timeout = None):
+        self._check(timeout)
+
+    def terminate(self):
+        # The worker is killed and left out of the pool
+        if not self.done:
+            self.done = True
+            self.worker[0].terminate()
+            self.pool.discard(self.worker)
+
+    def is_alive(self):
+        self._check(0)
+        return not self.done
+
+
+class PoolBackend(object):
+    """
+    Runs each node in a worker process of a pool. The workers are started
+    once, by warmUp or by the first use of the pool, and run one node at a
+    time: a node is sent to an idle worker when it starts (a new worker is
+    created when none is idle), and the worker waits for the next node when
+    it stops. Starting a node only pickles it, and under the spawn and
+    forkserver start methods the modules are imported once per worker
+    instead of once per node.
+    Nodes communicate through the channels of the pool (see channel), which
+    are created in advance and inherited by the workers. Nodes must be
+    picklable, so Queues, Channels created elsewhere and Sources of
+    generators can not be used. Their functions must also be importable, or
+    defined before the workers are started: a worker forked earlier does not
+    know the functions defined afterwards in __main__.
+    """
+    name = 'pool'
+    count = 0   # Number of pools created, used for the pool ids
+
+    def __init__(self, size = None, channels = 128, preload = ('SDF', 'SADF')):
+        """
+        PoolBackend initializer.
+
+        Parameters
+        ----------
+        size : int (default = None)
+            Number of workers started by warmUp. When None, one per core.
+        channels : int (default = 128)
+            Number of channels of the pool.
+        preload : (str) (default = ('SDF', 'SADF'))
+            Modules imported by the workers before they are ready, so that
+            receiving the first node does not import them.
+        """
+        PoolBackend.count += 1
+        self.id = (os.getpid(), PoolBackend.count)
+        self.size = size or os.cpu_count()
+        self.nChannels = channels
+        self.preload = preload
+        self.bank = None        # (Queue, Semaphore) of each channel slot
+        self.generation = 0     # Generation of the last channel created
+        self.slots = []         # Free channel slots
+        self.idle = []          # (process, connection) of the idle workers
+        self.workers = []       # (process, connection) of every worker
+
+    def warmUp(self, n = None):
+        """
+        Creates the channel bank of the pool, if it was not done yet, and
+        starts workers until n of them (self.size when None) are idle.
+        Returns when the new workers are ready.
+        """
+        if self.bank is None:
+            self.bank = [(Queue(), Semaphore(0)) for i in range(self.nChannels)]
+            self.slots = list(range(self.nChannels))
+            util.Finalize(self, PoolBackend.close, args = (self,), exitpriority = 10)
+        new = [self._fork() for i in range((n or self.size) - len(self.idle))]
+        for (proc, conn) in new:
+            conn.recv()
+        self.idle += new
+
+    def _fork(self):
+        # Workers share the resource tracker of the parent, so that the shared
+        # memory blocks they attach are not reported as leaked when they exit
+        resource_tracker.ensure_running()
+        (conn, child) = multiprocessing.Pipe()
+        proc = Process(target = _poolWorker, args = (child, self.bank, self.id, self.preload), name = 'pool-worker')
+        proc.start()
+        child.close()
+        self.workers.append((proc, conn))
+        return (proc, conn)
+
+    def start(self, node):
+        """
+        Sends node to an idle worker and returns its handle.
+        """
+        if self.bank is None:
+            self.warmUp()
+        if self.idle:
+            worker = self.idle.pop()
+        else:
+            worker = self._fork()
+            worker[1].recv()
+        try:
+            worker[1].send(node)
+        except Exception as e:
+            self.idle.append(worker)
+            raise Exception('Node ' + node.name + ' can not be sent to a pool worker (' + str(e) + \
+                '). Its channels must be created by the pool')
+        try:
+            error = worker[1].recv()
+        except EOFError:
+            self.discard(worker)
+            raise Exception('The pool worker of node ' + node.name + ' stopped while receiving it')
+        if error is not None:
+            self.idle.append(worker)
+            raise Exception('Node ' + node.name + ' can not be received by a pool worker (' + error + \
+                '). Its functions must be importable or defined before warmUp')
+        return PoolWorker(self, worker)
+
+    def discard(self, worker):
+        """
+        Removes a dead or killed worker from the pool.
+        """
+        if worker in self.workers:
+            self.workers.remove(worker)
+        worker[0].join()
+
+    def channel(self, capacity = 0):
+        """
+        Creates a channel suitable for the nodes of this backend.
+        """
+        if self.bank is None:
+            self.warmUp()
+        if not self.slots:
+            raise Exception('No free channel in the pool (channels = ' + str(self.nChannels) + ')')
+        return PoolChannel(self, self.slots.pop(0), capacity)
+
+    def close(self):
+        """
+        Stops the idle workers and kills the busy ones.
+        """
+        for (proc, conn) in self.workers:
+            if (proc, conn) in self.idle:
+                try:
+                    conn.send(None)
+                except OSError:
+                    pass
+            else:
+                proc.terminate()
+        for (proc, conn) in self.workers:
+            proc.join()
+        self.workers = []
+        self.idle = []
+
+    def __reduce__(self):
+        # Nodes sent to the workers run there as plain processes
+        return (getBackend, ('process',))
+
+
+backends = {'process': ProcessBackend(), 'thread': ThreadBackend(), 'asyncio': AsyncioBackend(), \
+    'pool': PoolBackend()}
+
+def getBackend(backend = None):
+    """
+    Returns the backend given by name ('process', 'thread', 'asyncio' or
+    'pool') or the backend itself. When backend is None, returns the process backend.
+    """
+    if backend is None:
+        return backends['process']
+    if isinstance(backend, str):
+        if backend not in backends:
+            raise Exception('Unknown backend ' + backend)
+        return backends[backend]
+    return backend
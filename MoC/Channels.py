@@ -0,0 +1,685 @@
+"""
+Author: Ricardo Bonna
+Creation date: 18/oct/2026
+Module description: This module provides channel classes that can be used in
+place of multiprocessing Queues to connect the processes of a model.
+"""
+
+from multiprocessing import Queue, Lock, Semaphore, shared_memory
+from multiprocessing.connection import wait
+from collections import deque
+from queue import Empty
+import threading
+import asyncio
+import numpy as np
+
+
+class EndOfStream(Exception):
+    """
+    Exception raised when a node reads the end-of-stream token EOS.
+    """
+    pass
+
+
+class EOSToken(object):
+    """
+    Class of the end-of-stream token EOS. Writing EOS in a channel tells its
+    consumer that no more tokens will follow. Unpickling gives back the
+    single instance, so tokens can be compared with "is EOS".
+    """
+    def __repr__(self):
+        return 'EOS'
+
+    def __reduce__(self):
+        return (_eos, ())
+
+EOS = EOSToken()
+
+def _eos():
+    return EOS
+
+
+class MarkToken(object):
+    """
+    Class of the checkpoint marker MARK. A node that reads MARK takes its
+    snapshot, writes MARK in all its outputs and records the tokens that
+    arrive in its other inputs until their MARK (see Network.checkpoint).
+    As EOS, MARK is the last token of a channel. Unpickling gives back the
+    single instance.
+    """
+    def __repr__(self):
+        return 'MARK'
+
+    def __reduce__(self):
+        return (_mark, ())
+
+MARK = MarkToken()
+
+def _mark():
+    return MARK
+
+
+class MarkerReceived(Exception):
+    """
+    Exception raised when a node reads the checkpoint marker MARK. It holds
+    the list of (channel, tokens) read by the interrupted firing before the
+    marker, and the channel that delivered it (None for Sources).
+    """
+    def __init__(self, inputs, channel):
+        Exception.__init__(self, 'Checkpoint marker')
+        self.inputs = inputs
+        self.channel = channel
+
+
+def isLast(token):
+    """
+    Returns True when token is EOS or MARK, which end a channel.
+    """
+    return token is EOS or token is MARK
+
+
+def checkEOS(tokens):
+    """
+    Raises EndOfStream if the list tokens contains the token EOS.
+    """
+    for token in tokens:
+        if token is EOS:
+            raise EndOfStream
+
+
+class Channel(object):
+    """
+    The Channel class creates channels that move lists of tokens as single
+    messages. A producer that writes all the tokens of a firing with putMany
+    pays a single pickle and pipe write, and a consumer that reads them with
+    getMany gets them in a single pipe read. The token level methods put and
+    get are kept, so a Channel can be used anywhere a Queue is accepted.
+    A channel with a capacity blocks its producers while it holds capacity
+    tokens that were not read by the consumer.
+    """
+    def __init__(self, capacity = 0):
+        """
+        Channel initializer.
+
+        Parameters
+        ----------
+        capacity : int (default = 0)
+            Maximum number of tokens in the channel. When capacity = 0, the
+            channel is unbounded.
+        """
+        self.queue = Queue()    # Underlying queue. Each message is a list of tokens
+        self.buffer = deque()   # Tokens received by the consumer and not read yet
+        self.capacity = 0       # Maximum number of tokens (0 means inf)
+        self.free = None        # Number of free token places
+        self.pending = 0        # Tokens written minus tokens read by this process
+        self.setCapacity(capacity)
+
+    def setCapacity(self, capacity):
+        """
+        Sets the maximum number of tokens in the channel. It must be called
+        before the processes that use the channel are started, but it may be
+        called after initial tokens were written.
+
+        Parameters
+        ----------
+        capacity : int
+            Maximum number of tokens in the channel. When capacity = 0, the
+            channel is unbounded.
+        """
+        if capacity != 0 and capacity < self.pending:
+            raise Exception('Channel capacity smaller than the number of tokens already in the channel')
+        self.capacity = capacity
+        self.free = Semaphore(capacity - self.pending) if capacity != 0 else None
+
+    def _acquire(self, n):
+        # Waits for n free token places
+        if n > self.capacity:
+            raise Exception('Writing more tokens at once than the channel capacity')
+        for j in range(n):
+            self.free.acquire()
+
+    def _release(self, n):
+        for j in range(n):
+            self.free.release()
+
+    def put(self, token):
+        """
+        Writes a single token in the channel.
+
+        Parameters
+        ----------
+        token : Token
+            Token to be written.
+        """
+        if self.free is not None:
+            self._acquire(1)
+        self.pending += 1
+        self.queue.put([token])
+
+    def putMany(self, tokens):
+        """
+        Writes a list of tokens in the channel as a single message.
+
+        Parameters
+        ----------
+        tokens : [Token]
+            List of tokens to be written.
+        """
+        if len(tokens) > 0:
+            if self.free is not None:
+                self._acquire(len(tokens))
+            self.pending += len(tokens)
+            self.queue.put(list(tokens))
+
+    def get(self, block = True, timeout = None):
+        """
+        Reads a single token from the channel. The arguments have the same
+        meaning as in Queue.get.
+
+        Returns
+        ----------
+        token : Token
+            The oldest token in the channel.
+        """
+        if not self.buffer:
+            self.buffer.extend(self.queue.get(block, timeout))
+        self.pending -= 1
+        if self.free is not None:
+            self._release(1)
+        return self.buffer.popleft()
+
+    def getMany(self, n):
+        """
+        Reads n tokens from the channel, blocking until they are available.
+
+        Parameters
+        ----------
+        n : int
+            Number of tokens to be read.
+
+        Returns
+        ----------
+        tokens : [Token]
+            List with the n oldest tokens in the channel, or the tokens up
+            to an EOS or MARK token when the channel ends before.
+        """
+        if n == 0:
+            return []
+        if not self.buffer:
+            # Fast path: the message has exactly the tokens of one firing
+            msg = self.queue.get()
+            if len(msg) == n:
+                self.pending -= n
+                if self.free is not None:
+                    self._release(n)
+                return msg
+            self.buffer.extend(msg)
+        # Nothing follows EOS or MARK, so fewer tokens are returned
+        while len(self.buffer) < n and not isLast(self.buffer[-1]):
+            self.buffer.extend(self.queue.get())
+        n = min(n, len(self.buffer))
+        self.pending -= n
+        if self.free is not None:
+            self._release(n)
+        return [self.buffer.popleft() for j in range(n)]
+
+    def getBatch(self, n = 0):
+        """
+        Reads the tokens already received by the consumer, or blocks until
+        the next message arrives if there are none.
+
+        Parameters
+        ----------
+        n : int (default = 0)
+            Maximum number of tokens to be read. When n = 0, there is no limit.
+
+        Returns
+        ----------
+        tokens : [Token]
+            List of at least one token.
+        """
+        if not self.buffer:
+            self.buffer.extend(self.queue.get())
+        if n == 0 or len(self.buffer) <= n:
+            tokens = list(self.buffer)
+            self.buffer.clear()
+        else:
+            tokens = [self.buffer.popleft() for j in range(n)]
+        self.pending -= len(tokens)
+        if self.free is not None:
+            self._release(len(tokens))
+        return tokens
+
+    def available(self):
+        """
+        Receives the messages already in the channel, without blocking, and
+        returns the number of tokens that the consumer can read without
+        waiting.
+        """
+        try:
+            while 1:
+                self.buffer.extend(self.queue.get_nowait())
+        except Empty:
+            pass
+        return len(self.buffer)
+
+    def qsize(self):
+        """
+        Returns the number of tokens written minus the number of tokens read
+        by the current process. It is the number of tokens in the channel
+        before the processes that use it are started.
+        """
+        return self.pending
+
+
+class ShmChannel(object):
+    """
+    The ShmChannel class creates channels for streams of NumPy arrays with
+    fixed dtype and shape. The tokens are stored in a fixed capacity ring of
+    slots in shared memory, so they are never pickled: producers write them
+    in place and consumers read them without copies.
+    When copy = False, the consumer receives views of the slots. A view is
+    valid until the next read from the channel by the same process, so
+    functions that keep tokens between firings (e.g. in a state) must copy
+    them.
+    """
+    def __init__(self, shape, dtype, capacity, copy = True):
+        """
+        ShmChannel initializer.
+
+        Parameters
+        ----------
+        shape : (int)
+            Shape of every token.
+        dtype : dtype
+            NumPy data type of every token.
+        capacity : int
+            Number of slots in the ring. It must be at least the largest
+            consumption rate of the channel.
+        copy : bool (default = True)
+            When False, the consumer gets views of the shared memory slots.
+        """
+        if capacity < 1:
+            raise Exception('Channel capacity must be at least 1')
+        self.shape = tuple(shape)           # Shape of the tokens
+        self.dtype = np.dtype(dtype)        # Data type of the tokens
+        self.capacity = capacity            # Number of slots
+        self.copy = copy                    # Copy tokens on read
+        self.slotSize = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.shm = shared_memory.SharedMemory(create = True, size = 64 + (self.slotSize + 1) * capacity)
+        self.name = self.shm.name           # Shared memory block name
+        self.free = Semaphore(capacity)     # Number of empty slots
+        self.full = Semaphore(0)            # Number of written slots
+        self.putLock = Lock()               # Serializes the producers
+        self.getLock = Lock()               # Serializes the consumers
+        self.held = 0                       # Slots lent as views to the consumer
+        self._map()
+        self.index[:] = 0
+
+    def _map(self):
+        # Header with the write and read counters, followed by the slots
+        self.index = np.ndarray((2,), np.int64, self.shm.buf, 0)
+        self.slots = np.ndarray((self.capacity,) + self.shape, self.dtype, self.shm.buf, 64)
+        # Flags of the slots that hold EOS (1) or MARK (2) instead of an array
+        self.eos = np.ndarray((self.capacity,), np.uint8, self.shm.buf, 64 + self.slotSize * self.capacity)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['shm'], state['index'], state['slots'], state['eos']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        try:
+            self.shm = shared_memory.SharedMemory(name = self.name, track = False)
+        except TypeError:
+            self.shm = shared_memory.SharedMemory(name = self.name)
+        self._map()
+
+    def put(self, token):
+        """
+        Writes a single token in the channel, blocking while the ring is full.
+
+        Parameters
+        ----------
+        token : np.ndarray
+            Array with the shape of the channel, EOS or MARK.
+        """
+        if isLast(token):
+            self.free.acquire()
+            with self.putLock:
+                self.eos[self.index[0] % self.capacity] = 1 if token is EOS else 2
+                self.index[0] += 1
+            self.full.release()
+            return
+        token = np.asarray(token)
+        if token.shape != self.shape:
+            raise Exception('Token shape ' + str(token.shape) + ' does not match channel shape ' + str(self.shape))
+        self.free.acquire()
+        with self.putLock:
+            np.copyto(self.slots[self.index[0] % self.capacity], token, casting = 'same_kind')
+            self.index[0] += 1
+        self.full.release()
+
+    def putMany(self, tokens):
+        """
+        Writes a list of tokens in the channel.
+
+        Parameters
+        ----------
+        tokens : [np.ndarray]
+            List of arrays with the shape of the channel.
+        """
+        for token in tokens:
+            self.put(token)
+
+    def _release(self):
+        # Gives back to the producers the slots lent in the previous read
+        for i in range(self.held):
+            self.free.release()
+        self.held = 0
+
+    def _read(self):
+        with self.getLock:
+            k = self.index[1] % self.capacity
+            slot = self.slots[k]
+            self.index[1] += 1
+        if self.eos[k]:
+            token = EOS if self.eos[k] == 1 else MARK
+            self.eos[k] = 0
+            self.free.release()
+            return token
+        if self.copy:
+            token = slot.copy()
+            self.free.release()
+            return token
+        self.held += 1
+        return slot
+
+    def get(self, block = True, timeout = None):
+        """
+        Reads a single token from the channel. The arguments have the same
+        meaning as in Queue.get.
+
+        Returns
+        ----------
+        token : np.ndarray
+            The oldest token in the channel.
+        """
+        self._release()
+        if not self.full.acquire(block, timeout):
+            raise Empty
+        return self._read()
+
+    def getMany(self, n):
+        """
+        Reads n tokens from the channel, blocking until they are available.
+
+        Parameters
+        ----------
+        n : int
+            Number of tokens to be read.
+
+        Returns
+        ----------
+        tokens : [np.ndarray]
+            List with the n oldest tokens in the channel.
+        """
+        if n > self.capacity:
+            raise Exception('Consumption rate larger than the channel capacity')
+        self._release()
+        tokens = []
+        for j in range(n):
+            self.full.acquire()
+            tokens.append(self._read())
+            if isLast(tokens[-1]):
+                break
+        return tokens
+
+    def getBatch(self, n = 0):
+        """
+        Reads the tokens already written in the channel, blocking until there
+        is at least one.
+
+        Parameters
+        ----------
+        n : int (default = 0)
+            Maximum number of tokens to be read. When n = 0, there is no limit.
+
+        Returns
+        ----------
+        tokens : [np.ndarray]
+            List of at least one token.
+        """
+        self._release()
+        self.full.acquire()
+        tokens = [self._read()]
+        while (n == 0 or len(tokens) < n) and self.full.acquire(False):
+            tokens.append(self._read())
+        return tokens
+
+    def qsize(self):
+        """
+        Returns the number of tokens in the channel.
+        """
+        return int(self.index[0] - self.index[1])
+
+    def close(self):
+        """
+        Detaches the process from the shared memory block.
+        """
+        self.index = None
+        self.slots = None
+        self.eos = None
+        self.shm.close()
+
+    def unlink(self):
+        """
+        Frees the shared memory block. Must be called once, by the process
+        that created the channel, after every process has stopped using it.
+        """
+        self.close()
+        self.shm.unlink()
+
+
+class LocalChannel(object):
+    """
+    The LocalChannel class creates in-process channels, backed by a deque,
+    that connect nodes running in threads or as asyncio coroutines of the
+    same process. Besides the blocking methods of Channel, it provides the
+    coroutines agetMany and aputMany used by the asyncio nodes. It can not
+    be shared between processes.
+    """
+    def __init__(self, capacity = 0):
+        """
+        LocalChannel initializer.
+
+        Parameters
+        ----------
+        capacity : int (default = 0)
+            Maximum number of tokens in the channel. When capacity = 0, the
+            channel is unbounded.
+        """
+        self.tokens = deque()                   # Tokens in the channel
+        self.capacity = capacity                # Maximum number of tokens (0 means inf)
+        self.cond = threading.Condition()       # Wakes up blocked threads
+        self.waiters = []                       # Futures of blocked coroutines
+
+    def setCapacity(self, capacity):
+        """
+        Sets the maximum number of tokens in the channel.
+
+        Parameters
+        ----------
+        capacity : int
+            Maximum number of tokens in the channel. When capacity = 0, the
+            channel is unbounded.
+        """
+        self.capacity = capacity
+
+    def _fits(self, n):
+        if self.capacity != 0 and n > self.capacity:
+            raise Exception('Writing more tokens at once than the channel capacity')
+        return self.capacity == 0 or len(self.tokens) + n <= self.capacity
+
+    def _notify(self):
+        # Must be called with self.cond acquired
+        self.cond.notify_all()
+        for (loop, fut) in self.waiters:
+            loop.call_soon_threadsafe(_wakeUp, fut)
+        self.waiters = []
+
+    def put(self, token):
+        """
+        Writes a single token in the channel.
+        """
+        self.putMany([token])
+
+    def putMany(self, tokens):
+        """
+        Writes a list of tokens in the channel.
+        """
+        with self.cond:
+            while not self._fits(len(tokens)):
+                self.cond.wait()
+            self.tokens.extend(tokens)
+            self._notify()
+
+    def get(self, block = True, timeout = None):
+        """
+        Reads a single token from the channel. The arguments have the same
+        meaning as in Queue.get.
+        """
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.tokens, timeout if block else 0):
+                raise Empty
+            token = self.tokens.popleft()
+            self._notify()
+        return token
+
+    def getMany(self, n):
+        """
+        Reads n tokens from the channel, blocking until they are available.
+        """
+        with self.cond:
+            while len(self.tokens) < n and not (self.tokens and isLast(self.tokens[-1])):
+                self.cond.wait()
+            tokens = [self.tokens.popleft() for j in range(min(n, len(self.tokens)))]
+            self._notify()
+        return tokens
+
+    def getBatch(self, n = 0):
+        """
+        Reads the tokens in the channel, blocking until there is at least one.
+        When n > 0, at most n tokens are read.
+        """
+        with self.cond:
+            while not self.tokens:
+                self.cond.wait()
+            if n == 0 or len(self.tokens) <= n:
+                tokens = list(self.tokens)
+                self.tokens.clear()
+            else:
+                tokens = [self.tokens.popleft() for j in range(n)]
+            self._notify()
+        return tokens
+
+    def qsize(self):
+        """
+        Returns the number of tokens in the channel.
+        """
+        return len(self.tokens)
+
+    def _wait(self):
+        # Must be called with self.cond acquired. Returns a future that is
+        # set by the next change in the channel
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self.waiters.append((loop, fut))
+        return fut
+
+    async def agetMany(self, n):
+        """
+        Coroutine that reads n tokens from the channel.
+        """
+        while True:
+            with self.cond:
+                if len(self.tokens) >= n or (self.tokens and isLast(self.tokens[-1])):
+                    tokens = [self.tokens.popleft() for j in range(min(n, len(self.tokens)))]
+                    self._notify()
+                    return tokens
+                fut = self._wait()
+            await fut
+
+    async def aputMany(self, tokens):
+        """
+        Coroutine that writes a list of tokens in the channel.
+        """
+        while True:
+            with self.cond:
+                if self._fits(len(tokens)):
+                    self.tokens.extend(tokens)
+                    self._notify()
+                    return
+                fut = self._wait()
+            await fut
+
+
+def waitChannels(chans, timeout = None):
+    """
+    Waits until one of the channels in the list chans may have tokens to be
+    read, or until timeout seconds have passed. It waits on the pipes of
+    Queues and Channels, and returns at once if some channel has no pipe
+    (e.g. ShmChannel) or has tokens already received by the consumer, so
+    callers must poll the channels afterwards.
+
+    Parameters
+    ----------
+    chans : [Queue]
+        List of channels.
+    timeout : float (default = None)
+        Maximum waiting time in seconds. When None, waits indefinitely.
+
+    Returns
+    ----------
+    waited : bool
+        False when it returned at once, without waiting on the pipes.
+    """
+    readers = []
+    for ch in chans:
+        if getattr(ch, 'buffer', None):
+            return False
+        reader = getattr(getattr(ch, 'queue', ch), '_reader', None)
+        if reader is None:
+            return False
+        readers.append(reader)
+    wait(readers, timeout)
+    return True
+
+
+def _wakeUp(fut):
+    if not fut.done():
+        fut.set_result(None)
+
+
+# Test of the module
+if __name__ == '__main__':
+    print("Channels test model")
+    ch = Channel()
+    ch.putMany([1, 2, 3])
+    ch.put(4)
+    print(ch.get())
+    print(ch.getMany(3))
+    ch.putMany([5, 6, 7])
+    print(ch.getBatch(2))
+    print(ch.getBatch())
+    ch = Channel(4)
+    ch.putMany([1, 2, 3])
+    ch.put(4)
+    print(ch.getMany(2), ch.get(), ch.getBatch())
+    sch = ShmChannel((2, 2), int, 4, copy = False)
+    sch.put(np.eye(2, dtype = int))
+    sch.putMany([np.full((2, 2), 2), np.full((2, 2), 3)])
+    print(sch.get())
+    print(sch.getMany(2))
+    sch.unlink()
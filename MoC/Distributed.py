@@ -0,0 +1,618 @@
+"""
+Author: Ricardo Bonna
+Creation date: 18/oct/2026
+Module description: This module provides the execution of a model over
+several hosts. A SocketChannel connects a producer and a consumer through a
+TCP or Unix socket, and can be used anywhere a Queue is accepted. The
+launcher builds the same network on every host, replaces the channels
+between nodes placed on different hosts by SocketChannels and starts the
+nodes of its host, as given by a mapping file. Producers and consumers
+prove that they share a secret key (HMAC challenge and response, as in
+multiprocessing.connection) before any frame is sent, so that only trusted
+peers can have their data unpickled.
+
+Mapping file (JSON):
+    {
+        "model": "MPEG4:buildNetwork",      function that returns a Network
+        "path": ["../examples/MPEG4"],      added to sys.path, relative to the file
+        "args": {"fs": [32, 32], "bs": 8},  arguments of the function
+        "port": 47000,                      first TCP port of the channels
+        "outputs": "a",                     host that reads the sink channels
+        "hosts": {
+            "a": {"address": "127.0.0.1", "nodes": ["FD", "VLD"]},
+            "b": {"address": "unix:/tmp/moc-b", "nodes": ["IDCT"]}
+        }
+    }
+Channel k read by a node of a host with address A listens on (A, port + k),
+or on the Unix socket A-k.sock for addresses starting with "unix:". The
+address of a host defaults to 127.0.0.1, so channels only accept remote
+connections when a host is given a public address.
+
+The hosts share the key given in hexadecimal by the environment variable
+MOC_AUTHKEY. When every host runs locally, a random key is generated.
+
+Usage:
+    python Distributed.py mapping.json              runs every host locally
+    MOC_AUTHKEY=... python Distributed.py mapping.json --host NAME
+                                                    runs the nodes of a host
+"""
+
+from MoC_Core import *
+from multiprocessing import util, current_process, AuthenticationError
+import os
+import sys
+import json
+import time
+import pickle
+import hashlib
+import hmac
+import select
+import socket
+import struct
+import importlib
+import subprocess
+
+_header = struct.Struct('!QI')      # Pickle size and number of out-of-band buffers
+_size = struct.Struct('!Q')         # Size of an out-of-band buffer
+_maxIov = 512                       # Buffers per sendmsg call
+_CHALLENGE = b'#CHALLENGE#'         # Messages of the authentication handshake
+_WELCOME = b'#WELCOME#'
+_FAILURE = b'#FAILURE#'
+_nonceSize = 32                     # Random bytes of a challenge
+_handshakeTimeout = 10.0            # Maximum time of a handshake, in seconds
+
+
+def _family(address):
+    return socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+
+
+def encode(tokens):
+    """
+    Encodes a list of tokens as a frame: a header with the size of the pickle
+    and the number of out-of-band buffers, the buffer sizes, the pickle and
+    the buffers. The data of contiguous NumPy arrays is not copied: the
+    frame refers to it through memoryviews.
+    """
+    buffers = []
+    data = pickle.dumps(tokens, protocol = 5, buffer_callback = buffers.append)
+    views = [b.raw() for b in buffers]
+    header = _header.pack(len(data), len(views)) + b''.join(_size.pack(v.nbytes) for v in views)
+    return [header, data] + views
+
+
+def _sendAll(sock, views):
+    # Sends the memoryviews in order, resuming after partial writes
+    views = [memoryview(v).cast('B') for v in views if len(v)]
+    while views:
+        sent = sock.sendmsg(views[:_maxIov])
+        while sent:
+            if sent >= len(views[0]):
+                sent -= len(views[0])
+                views.pop(0)
+            else:
+                views[0] = views[0][sent:]
+                sent = 0
+
+
+def _recvInto(sock, buf):
+    # Fills the writable buffer buf, returning False on end of connection
+    view = memoryview(buf).cast('B')
+    while len(view):
+        n = sock.recv_into(view)
+        if n == 0:
+            return False
+        view = view[n:]
+    return True
+
+
+def deliverChallenge(sock, authkey):
+    """
+    Sends a random challenge to the peer on sock and checks that its answer
+    is the HMAC of the challenge with authkey. Raises AuthenticationError
+    otherwise.
+    """
+    nonce = os.urandom(_nonceSize)
+    sock.sendall(_CHALLENGE + nonce)
+    digest = bytearray(hashlib.sha256().digest_size)
+    expected = hmac.new(authkey, nonce, 'sha256').digest()
+    if not _recvInto(sock, digest) or not hmac.compare_digest(bytes(digest), expected):
+        try:
+            sock.sendall(_FAILURE)
+        except OSError:
+            pass
+        raise AuthenticationError('digest received was wrong')
+    sock.sendall(_WELCOME)
+
+
+def answerChallenge(sock, authkey):
+    """
+    Answers the challenge sent by deliverChallenge on sock. Raises
+    AuthenticationError when the peer rejects the answer.
+    """
+    message = bytearray(len(_CHALLENGE) + _nonceSize)
+    if not _recvInto(sock, message) or not message.startswith(_CHALLENGE):
+        raise AuthenticationError('message was not a challenge')
+    sock.sendall(hmac.new(authkey, bytes(message[len(_CHALLENGE):]), 'sha256').digest())
+    response = bytearray(len(_WELCOME))
+    if not _recvInto(sock, response) or bytes(response) != _WELCOME:
+        raise AuthenticationError('digest sent was rejected')
+
+
+def decode(sock):
+    """
+    Reads a frame written by encode from sock and returns its list of
+    tokens, or None when the connection is closed. NumPy arrays are backed by
+    the received buffers, without further copies.
+    """
+    header = bytearray(_header.size)
+    if not _recvInto(sock, header):
+        return None
+    (size, nBuffers) = _header.unpack(header)
+    sizes = bytearray(_size.size * nBuffers)
+    data = bytearray(size)
+    if not _recvInto(sock, sizes) or not _recvInto(sock, data):
+        return None
+    buffers = []
+    for k in range(nBuffers):
+        buf = bytearray(_size.unpack_from(sizes, k * _size.size)[0])
+        if not _recvInto(sock, buf):
+            return None
+        buffers.append(buf)
+    return pickle.loads(data, buffers = buffers)
+
+
+class _Sender(object):
+    """
+    Producer end of a SocketChannel. A feeder thread connects to the
+    consumer, retrying until it listens, and sends the pending messages,
+    all the frames available at once in a single sendmsg call. Pending
+    messages are sent before the process exits.
+    """
+    def __init__(self, address, timeout, authkey):
+        self.address = address
+        self.timeout = timeout
+        self.authkey = authkey
+        self.pending = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.error = None           # Error of the connection, raised by send
+        self.discard = False        # Set when the consumer closes the connection
+        self.thread = threading.Thread(target = self.feed, daemon = True)
+        self.thread.start()
+        util.Finalize(self, _Sender.close, args = (self,), exitpriority = 10)
+
+    def connect(self):
+        deadline = None if self.timeout is None else time.time() + self.timeout
+        while 1:
+            sock = socket.socket(_family(self.address), socket.SOCK_STREAM)
+            try:
+                sock.connect(self.address)
+            except OSError:
+                sock.close()
+                if deadline is not None and time.time() > deadline:
+                    raise
+                time.sleep(0.05)
+                continue
+            try:
+                # Both ends prove that they know the key, the consumer first
+                sock.settimeout(_handshakeTimeout)
+                answerChallenge(sock, self.authkey)
+                deliverChallenge(sock, self.authkey)
+                sock.settimeout(None)
+            except BaseException:
+                sock.close()
+                raise
+            if sock.family == socket.AF_INET:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            return sock
+
+    def feed(self):
+        try:
+            sock = self.connect()
+        except Exception as e:
+            self.error = e
+            return
+        while 1:
+            with self.cond:
+                while not self.pending and not self.closed:
+                    self.cond.wait()
+                if not self.pending:
+                    break
+                messages = list(self.pending)
+                self.pending.clear()
+            views = []
+            for tokens in messages:
+                views += encode(tokens)
+            try:
+                _sendAll(sock, views)
+            except OSError:
+                # The consumer stopped: as with a Queue that is no longer
+                # read, the tokens are discarded
+                with self.cond:
+                    self.pending.clear()
+                    self.discard = True
+        sock.close()
+
+    def send(self, tokens):
+        if self.error is not None:
+            raise Exception('SocketChannel ' + str(self.address) + ': ' + str(self.error))
+        with self.cond:
+            if self.discard:
+                return
+            self.pending.append(tokens)
+            self.cond.notify()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self.thread.join()
+
+
+class SocketChannel(object):
+    """
+    The SocketChannel class creates channels between processes that may run
+    on different hosts. The consumer listens on the channel address when it
+    first reads, and every process that writes the channel connects to it
+    and sends lists of tokens as length-prefixed frames. The data of NumPy
+    arrays is sent and received without copies. Tokens written before the
+    channel is copied to the consumer process (initial tokens) travel with
+    the copy. As with a Queue, the tokens of each producer keep their order
+    and writes do not block. Each connection starts with a handshake in
+    which both ends prove that they know the channel key, and the consumer
+    closes the connections that fail it before reading any frame.
+    """
+    def __init__(self, address, timeout = None, authkey = None):
+        """
+        SocketChannel initializer.
+
+        Parameters
+        ----------
+        address : (str, int), int or str
+            TCP address (host, port) or path of the Unix socket where the
+            consumer listens. A port alone listens on 127.0.0.1.
+        timeout : float (default = None)
+            Maximum time to wait for the consumer to listen, in seconds.
+            When None, producers wait indefinitely.
+        authkey : bytes (default = None)
+            Key shared by the producers and the consumer. When None, the
+            authkey of the current process is used, which is shared by the
+            processes it starts.
+        """
+        if isinstance(address, int):
+            address = ('127.0.0.1', address)
+        self.address = address if isinstance(address, str) else tuple(address)
+        self.timeout = timeout
+        self.authkey = bytes(current_process().authkey if authkey is None else authkey)
+        self.buffer = deque()       # Tokens received by the consumer and not read yet
+        self.sender = None          # Producer end, created by the first write
+        self.listener = None        # Consumer end, created by the first read
+        self.conns = []             # Connections of the producers
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['sender'] = None
+        state['listener'] = None
+        state['conns'] = []
+        return state
+
+    def put(self, token):
+        """
+        Writes a single token in the channel.
+        """
+        self.putMany([token])
+
+    def putMany(self, tokens):
+        """
+        Writes a list of tokens in the channel as a single frame.
+        """
+        if len(tokens) == 0:
+            return
+        if self.sender is None:
+            self.sender = _Sender(self.address, self.timeout, self.authkey)
+        self.sender.send(list(tokens))
+
+    def preload(self, tokens):
+        """
+        Adds tokens to the consumer end, as initial tokens.
+        """
+        self.buffer.extend(tokens)
+
+    def listen(self):
+        """
+        Starts listening on the channel address. It is called by the first
+        read, and can be called earlier so that producers connect at once.
+        """
+        if self.listener is not None:
+            return
+        sock = socket.socket(_family(self.address), socket.SOCK_STREAM)
+        if sock.family == socket.AF_UNIX:
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+        else:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(self.address)
+        sock.listen()
+        self.listener = sock
+
+    def _receive(self, timeout):
+        # Waits up to timeout seconds (None means inf) for the next frame
+        self.listen()
+        deadline = None if timeout is None else time.time() + timeout
+        while 1:
+            left = None if deadline is None else max(deadline - time.time(), 0)
+            (ready, _, _) = select.select([self.listener] + self.conns, [], [], left)
+            if not ready:
+                return False
+            for s in ready:
+                if s is self.listener:
+                    (conn, addr) = s.accept()
+                    try:
+                        conn.settimeout(_handshakeTimeout)
+                        deliverChallenge(conn, self.authkey)
+                        answerChallenge(conn, self.authkey)
+                        conn.settimeout(None)
+                    except (OSError, AuthenticationError):
+                        # Peers without the key are dropped before they send
+                        # any frame
+                        conn.close()
+                        continue
+                    if conn.family == socket.AF_INET:
+                        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    self.conns.append(conn)
+                    continue
+                tokens = decode(s)
+                if tokens is None:
+                    self.conns.remove(s)
+                    s.close()
+                    continue
+                self.buffer.extend(tokens)
+                return True
+
+    def get(self, block = True, timeout = None):
+        """
+        Reads a single token from the channel. The arguments have the same
+        meaning as in Queue.get.
+        """
+        while not self.buffer:
+            if not self._receive(timeout if block else 0):
+                raise Empty
+        return self.buffer.popleft()
+
+    def getMany(self, n):
+        """
+        Reads n tokens from the channel, blocking until they are available.
+        """
+        while len(self.buffer) < n and not (self.buffer and isLast(self.buffer[-1])):
+            self._receive(None)
+        return [self.buffer.popleft() for j in range(min(n, len(self.buffer)))]
+
+    def getBatch(self, n = 0):
+        """
+        Reads the tokens received by the consumer, blocking until there is
+        at least one. When n > 0, at most n tokens are read.
+        """
+        while not self.buffer:
+            self._receive(None)
+        if n == 0 or len(self.buffer) <= n:
+            tokens = list(self.buffer)
+            self.buffer.clear()
+        else:
+            tokens = [self.buffer.popleft() for j in range(n)]
+        return tokens
+
+    def available(self):
+        """
+        Receives the frames already sent to the consumer, without blocking,
+        and returns the number of tokens that can be read without waiting.
+        """
+        while self._receive(0):
+            pass
+        return len(self.buffer)
+
+    def qsize(self):
+        """
+        Returns the number of tokens received by the consumer and not read.
+        """
+        return len(self.buffer)
+
+    def unlink(self):
+        """
+        Closes the consumer end and removes its Unix socket file.
+        """
+        if self.listener is not None:
+            for conn in self.conns:
+                conn.close()
+            self.listener.close()
+            self.listener = None
+            self.conns = []
+            if isinstance(self.address, str) and os.path.exists(self.address):
+                os.unlink(self.address)
+
+
+################### Launcher ####################
+
+def loadMapping(fileName):
+    """
+    Reads a mapping file and returns it as a dictionary, with the paths made
+    relative to the current directory.
+    """
+    with open(fileName) as f:
+        mapping = json.load(f)
+    base = os.path.dirname(os.path.abspath(fileName))
+    mapping['path'] = [os.path.join(base, p) for p in mapping.get('path', [])]
+    return mapping
+
+
+def buildNetwork(mapping):
+    """
+    Calls the model function of the mapping and returns its Network.
+    """
+    for p in mapping['path']:
+        if p not in sys.path:
+            sys.path.insert(0, p)
+    (module, function) = mapping['model'].split(':')
+    return getattr(importlib.import_module(module), function)(**mapping.get('args', {}))
+
+
+def channelAddress(mapping, host, k):
+    """
+    Returns the address of channel k when it is read by a node of host.
+    """
+    address = mapping['hosts'][host].get('address', '127.0.0.1')
+    if address.startswith('unix:'):
+        return address[5:] + '-' + str(k) + '.sock'
+    return (address, mapping.get('port', 47000) + k)
+
+
+def replaceChannel(node, old, new):
+    """
+    Replaces the channel old by new in the attributes of node.
+    """
+    for attr, value in vars(node).items():
+        if value is old:
+            setattr(node, attr, new)
+        elif isinstance(value, list):
+            for i, v in enumerate(value):
+                if v is old:
+                    value[i] = new
+
+
+def hostAuthkey():
+    """
+    Returns the key of the hosts, given in hexadecimal by the environment
+    variable MOC_AUTHKEY.
+    """
+    key = os.environ.get('MOC_AUTHKEY')
+    if not key:
+        raise Exception('The hosts need a shared key: set MOC_AUTHKEY to the same hexadecimal string on every host')
+    return bytes.fromhex(key)
+
+
+def distribute(net, mapping, host, authkey = None):
+    """
+    Places the nodes of net on the hosts of the mapping. The channels between
+    nodes of different hosts, and the sink channels read by the outputs host
+    from other hosts, are replaced by SocketChannels. Initial tokens are kept
+    by the host of the consumer.
+
+    Parameters
+    ----------
+    net : Network
+        Network built in the same way on every host.
+    mapping : dict
+        Mapping returned by loadMapping.
+    host : str
+        Name of the current host.
+    authkey : bytes (default = None)
+        Key of the SocketChannels, shared by every host (see hostAuthkey).
+        When None, the authkey of the current process is used.
+
+    Returns
+    ----------
+    nodes : [Node]
+        Nodes of the current host.
+    sinks : [Queue]
+        Sink channels, read by the outputs host (empty on other hosts).
+    """
+    placement = {}
+    for name, h in mapping['hosts'].items():
+        for nodeName in h['nodes']:
+            placement[nodeName] = name
+    for node in net.nodes:
+        if node.name not in placement:
+            raise Exception('Node ' + node.name + ' is not placed on any host')
+    outputsHost = mapping.get('outputs', list(mapping['hosts'])[0])
+    sinks = net.sinks()
+    for k, ch in enumerate(net.allChannels()):
+        producers = [n for n in net.nodes if any(ch is c for c in n.outputChannels())]
+        consumers = [n for n in net.nodes if any(ch is c for c in n.inputChannels())]
+        src = placement[producers[0].name] if producers else outputsHost
+        dst = placement[consumers[0].name] if consumers else outputsHost
+        if src == dst or host not in (src, dst):
+            continue
+        new = SocketChannel(channelAddress(mapping, dst, k), authkey = authkey)
+        initial = inputRead([ch.qsize()], [ch])[0]
+        if host == dst:
+            new.preload(initial)
+            new.listen()
+        for n in producers + consumers:
+            replaceChannel(n, ch, new)
+        sinks = [new if s is ch else s for s in sinks]
+    nodes = [n for n in net.nodes if placement[n.name] == host]
+    return (nodes, sinks if host == outputsHost else [])
+
+
+def runHost(mapping, host):
+    """
+    Runs the nodes of host until their streams end. The outputs host reads
+    the sink channels and returns their tokens.
+
+    Returns
+    ----------
+    outputs : [[Tokens]]
+        Tokens of each sink channel, EOS excluded.
+    """
+    net = buildNetwork(mapping)
+    (nodes, sinks) = distribute(net, mapping, host, hostAuthkey())
+    local = Network()
+    if nodes:
+        local.add(*nodes)
+    local.start()
+    outputs = []
+    for ch in sinks:
+        tokens = []
+        while 1:
+            token = ch.get()
+            if token is EOS:
+                break
+            tokens.append(token)
+        outputs.append(tokens)
+    local.join()
+    local.shutdown()
+    for ch in sinks:
+        unlink = getattr(ch, 'unlink', None)
+        if unlink is not None:
+            unlink()
+    return outputs
+
+
+def launchLocal(mappingFile, timeout = None):
+    """
+    Runs every host of a mapping file on the local machine, each one in its
+    own worker process with a new random key, and returns the output of the
+    outputs host.
+    """
+    mapping = loadMapping(mappingFile)
+    outputsHost = mapping.get('outputs', list(mapping['hosts'])[0])
+    env = dict(os.environ, MOC_AUTHKEY = os.urandom(32).hex())
+    procs = {}
+    for host in mapping['hosts']:
+        cmd = [sys.executable, os.path.abspath(__file__), mappingFile, '--host', host]
+        procs[host] = subprocess.Popen(cmd, stdout = subprocess.PIPE, text = True, env = env)
+    output = None
+    for host, proc in procs.items():
+        (out, err) = proc.communicate(timeout = timeout)
+        if proc.returncode != 0:
+            raise Exception('Host ' + host + ' failed with exit code ' + str(proc.returncode))
+        if host == outputsHost:
+            output = out
+    return output
+
+
+# Execution as main
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if '--host' in args:
+        host = args[args.index('--host') + 1]
+        start = time.time()
+        outputs = runHost(loadMapping(args[0]), host)
+        elapsed = time.time() - start
+        for k, tokens in enumerate(outputs):
+            digest = hashlib.md5()
+            for token in tokens:
+                digest.update(pickle.dumps(token))
+            print('sink ' + str(k) + ': ' + str(len(tokens)) + ' tokens in ' + str(round(elapsed, 4)) + 's, md5 ' + \
+                digest.hexdigest())
+    else:
+        print(launchLocal(args[0]), end = '')
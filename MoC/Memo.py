@@ -0,0 +1,147 @@
+"""
+Author: Ricardo Bonna
+Creation date: 18/oct/2026
+Module description: This module provides the class Memo, a memoization
+cache for the functions of pure actors and kernels. A firing is looked up by
+the function and a content hash of the consumed tokens, and a hit returns a
+copy of the stored outputs instead of calling the function. NumPy arrays are
+hashed directly from their buffers, and other tokens from their protocol-5
+pickles, whose array buffers are also hashed without copies. The outputs are
+kept pickled, so the cache size is measured in bytes and the consumers of a
+hit can modify its tokens. The least recently used entries are evicted when
+the cache exceeds its size.
+"""
+
+from multiprocessing.sharedctypes import RawArray
+from collections import OrderedDict
+import hashlib
+import pickle
+import numpy as np
+
+# Indexes of the counters of a Memo
+_HITS, _MISSES, _SKIPPED, _EVICTIONS, _ENTRIES, _BYTES = range(6)
+
+
+def tokenHash(inputs):
+    """
+    Returns a 16-byte content hash of a list of token lists, as read by
+    inputRead. Raises an exception when a token cannot be pickled.
+    """
+    h = hashlib.blake2b(digest_size = 16)
+    for tokens in inputs:
+        h.update(b'|')
+        for t in tokens:
+            if type(t) is np.ndarray and not t.dtype.hasobject:
+                h.update(b'a' + str(t.dtype).encode() + str(t.shape).encode())
+                h.update(t if t.flags.c_contiguous else np.ascontiguousarray(t))
+            else:
+                bufs = []
+                h.update(b'p' + pickle.dumps(t, 5, buffer_callback = bufs.append))
+                for b in bufs:
+                    h.update(b.raw())
+    return h.digest()
+
+
+class Memo(object):
+    """
+    The Memo class is a bounded LRU cache of firings. The hit and miss
+    counters are kept in shared memory, so the statistics of a node that
+    runs in its own process can be read from the parent. A Memo must be used
+    by one node only; the cached entries are local to the process of the
+    node.
+    """
+    def __init__(self, maxBytes = 64 << 20):
+        """
+        Memo initializer.
+
+        Parameters
+        ----------
+        maxBytes : int (default = 64 MiB)
+            Maximum size of the stored outputs, in bytes. Outputs larger than
+            maxBytes are not stored.
+        """
+        self.maxBytes = maxBytes
+        self.entries = OrderedDict()        # (function, hash): pickled outputs
+        self.size = 0                       # Bytes of the stored outputs
+        self.counters = RawArray('q', 6)    # Hits, misses, skipped, evictions, entries, bytes
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['entries'] = OrderedDict()
+        state['size'] = 0
+        return state
+
+    def call(self, f, inputs):
+        """
+        Returns f(inputs), from the cache when the function was already
+        applied to tokens with the same content. Firings whose tokens cannot
+        be hashed are counted as skipped and always call f.
+        """
+        cnt = self.counters
+        try:
+            key = (f, tokenHash(inputs))
+        except Exception:
+            cnt[_SKIPPED] += 1
+            return f(inputs)
+        data = self.entries.get(key)
+        if data is not None:
+            self.entries.move_to_end(key)
+            cnt[_HITS] += 1
+            return pickle.loads(data)
+        cnt[_MISSES] += 1
+        outputs = f(inputs)
+        try:
+            data = pickle.dumps(outputs, 5)
+        except Exception:
+            return outputs
+        if len(data) <= self.maxBytes:
+            self.entries[key] = data
+            self.size += len(data)
+            while self.size > self.maxBytes:
+                (k, old) = self.entries.popitem(last = False)
+                self.size -= len(old)
+                cnt[_EVICTIONS] += 1
+            cnt[_ENTRIES] = len(self.entries)
+            cnt[_BYTES] = self.size
+        return outputs
+
+    def clear(self):
+        """
+        Removes the entries of the cache (of the calling process) and resets
+        the statistics.
+        """
+        self.entries.clear()
+        self.size = 0
+        for i in range(len(self.counters)):
+            self.counters[i] = 0
+
+    def stats(self):
+        """
+        Returns the statistics of the cache.
+
+        Returns
+        ----------
+        stats : dict
+            Number of hits, misses, skipped firings (tokens that cannot be
+            hashed) and evictions, hit rate, and number and size in bytes of
+            the stored entries.
+        """
+        (hits, misses, skipped, evictions, entries, size) = self.counters[:]
+        total = hits + misses + skipped
+        return {'hits': hits, 'misses': misses, 'skipped': skipped, 'evictions': evictions, \
+            'hitRate': hits / total if total else 0.0, 'entries': entries, 'bytes': size}
+
+
+def getMemo(memo):
+    """
+    Returns the Memo of a node given its memo argument: None (no cache), True
+    (a new Memo with the default size), an int (a new Memo of that many
+    bytes) or a Memo.
+    """
+    if memo is None or memo is False:
+        return None
+    if memo is True:
+        return Memo()
+    if isinstance(memo, int):
+        return Memo(memo)
+    return memo
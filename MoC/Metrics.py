@@ -0,0 +1,417 @@
+"""
+Author: Ricardo Bonna
+Creation date: 18/oct/2026
+Module description: This module provides live metrics of the channels of a
+network. A ChannelMetrics table keeps, in shared memory, the tokens written
+to and read from every channel, its high-water mark, the bytes of the array
+tokens written and the time its producer and consumer spent blocked on it.
+The counters are updated by the nodes through a Meter, which takes the place
+of their tracer, so they work for every channel type (Queues included) and
+backend. A MetricsSampler publishes them while the network runs, in the
+Prometheus text format on a local HTTP endpoint and as a CSV stream.
+"""
+
+from multiprocessing import shared_memory
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from array import array
+import threading
+import time
+import numpy as np
+from Trace import clock
+
+# Columns of a channel row: tokens written, tokens read, bytes written,
+# high-water mark, and nanoseconds blocked writing and reading
+_IN, _OUT, _BYTES, _HIGH, _PUT, _GET = range(6)
+_COLUMNS = 6
+
+# Time between two writes of the counters kept by the nodes, in seconds
+PUBLISH_INTERVAL = 0.05
+
+# Prometheus name, type and help of each sampled value
+_SERIES = [('tokensIn', 'moc_channel_tokens_in_total', 'counter', 'Tokens written to the channel.'), \
+    ('tokensOut', 'moc_channel_tokens_out_total', 'counter', 'Tokens read from the channel.'), \
+    ('tokens', 'moc_channel_tokens', 'gauge', 'Tokens in the channel.'), \
+    ('highWater', 'moc_channel_high_water', 'gauge', 'Largest number of tokens in the channel.'), \
+    ('bytes', 'moc_channel_bytes_total', 'counter', 'Bytes of the array tokens written to the channel.'), \
+    ('putBlocked', 'moc_channel_put_blocked_seconds_total', 'counter', 'Time spent writing to the channel.'), \
+    ('getBlocked', 'moc_channel_get_blocked_seconds_total', 'counter', 'Time spent reading from the channel.')]
+
+
+# Kind of the token types seen so far: 0 (no data), 1 (NumPy), 2 (bytes)
+# or 3 (tuple or list)
+_kinds = {}
+
+def tokenKind(kind):
+    """
+    Returns the kind of the tokens of type kind (see _kinds).
+    """
+    if kind not in _kinds:
+        _kinds[kind] = 1 if issubclass(kind, (np.ndarray, np.generic)) else 2 if issubclass(kind, (bytes, bytearray)) \
+            else 3 if issubclass(kind, (tuple, list)) else 0
+    return _kinds[kind]
+
+
+def tokenBytes(tokens, n = None):
+    """
+    Returns the number of bytes of the NumPy arrays and scalars and of the
+    bytes objects in the first n tokens of a list (all of them when n is
+    None), including those in tuples and lists. Other tokens count as 0
+    bytes. The tokens of a channel are assumed to have the same type, so the
+    list is only scanned when its first token can hold data.
+    """
+    if not tokens:
+        return 0
+    kind = _kinds.get(type(tokens[0]))
+    if kind is None:
+        kind = tokenKind(type(tokens[0]))
+    if kind == 1:
+        return sum([t.nbytes for t in tokens[:n] if _kinds.get(type(t)) == 1])
+    if kind == 2:
+        return sum([len(t) for t in tokens[:n] if _kinds.get(type(t)) == 2])
+    if kind == 3:
+        return sum([tokenBytes(t) for t in tokens[:n] if _kinds.get(type(t)) == 3])
+    return 0
+
+
+class ChannelMetrics(object):
+    """
+    The ChannelMetrics class is a table of counters in shared memory, with
+    one row per channel. Each counter is written by a single process (the
+    producer or the consumer of its channel), so no locks are needed, and the
+    table can be read at any time from the parent. Rows must not be used
+    after close.
+    """
+    def __init__(self, labels, capacities = None):
+        """
+        ChannelMetrics initializer.
+
+        Parameters
+        ----------
+        labels : [str]
+            Names of the channels, one per row.
+        capacities : [int] (default = None)
+            Capacity of each channel (0 when unbounded).
+        """
+        self.labels = list(labels)
+        self.capacities = list(capacities or [0] * len(self.labels))
+        self.shm = shared_memory.SharedMemory(create = True, size = 8 * _COLUMNS * max(len(self.labels), 1))
+        self.name = self.shm.name           # Shared memory block name
+        self.attachRows()
+        for row in self.rows:
+            row[:] = array('q', [0] * _COLUMNS)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['shm'], state['rows']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        try:
+            self.shm = shared_memory.SharedMemory(name = self.name, track = False)
+        except TypeError:
+            self.shm = shared_memory.SharedMemory(name = self.name)
+        self.attachRows()
+
+    def __del__(self):
+        # Rows are released first, so that the block can be closed
+        for row in getattr(self, 'rows', []):
+            row.release()
+
+    def attachRows(self):
+        # Memoryviews of int64 are read and written faster than NumPy arrays
+        size = 8 * _COLUMNS
+        self.rows = [self.shm.buf[k * size:(k + 1) * size].cast('q') for k in range(len(self.labels))]
+
+    def setTokens(self, row, n):
+        """
+        Counts n tokens written to the channel of row before the start (e.g.
+        initial tokens).
+        """
+        self.rows[row][_IN] = n
+
+    def sample(self):
+        """
+        Returns the current metrics of every channel.
+
+        Returns
+        ----------
+        metrics : [dict]
+            One dict per channel, with its label, the tokens written and read,
+            the tokens in the channel and its high-water mark, the bytes
+            written and the seconds spent blocked writing and reading. Tokens
+            written by the caller after the start are not counted, so the
+            channels it feeds only count their reads. The counters of the
+            two ends of a channel are updated after each transfer, so the
+            tokens in a bounded channel are limited to its capacity.
+        """
+        result = []
+        for label, capacity, row in zip(self.labels, self.capacities, self.rows):
+            c = row.tolist()
+            tokens = max(c[_IN] - c[_OUT], 0)
+            high = max(c[_HIGH], tokens)
+            if capacity:
+                (tokens, high) = (min(tokens, capacity), min(high, capacity))
+            result.append({'channel': label, 'tokensIn': c[_IN], 'tokensOut': c[_OUT], 'tokens': tokens, \
+                'highWater': high, 'bytes': c[_BYTES], 'putBlocked': c[_PUT] * 1e-9, \
+                'getBlocked': c[_GET] * 1e-9})
+        return result
+
+    def close(self):
+        """
+        Detaches the process from the shared memory block.
+        """
+        for row in self.rows:
+            row.release()
+        self.rows = []
+        self.shm.close()
+
+    def unlink(self):
+        """
+        Frees the shared memory block. Must be called once, by the process
+        that created the table, after every node has stopped.
+        """
+        self.close()
+        self.shm.unlink()
+
+
+class Meter(object):
+    """
+    The Meter class updates the rows of the channels of a node. It has the
+    interface of a Tracer and takes its place in the node, so inputRead and
+    outputWrite report to it the tokens moved and the time spent on each
+    channel. When the node is also traced, the calls are passed on to its
+    Tracer. Token counts are written to the table after every transfer; the
+    other counters are kept in the node and written every
+    PUBLISH_INTERVAL seconds and when it stops.
+    """
+    def __init__(self, metrics, inRows, outRows, tracer = None):
+        """
+        Meter initializer.
+
+        Parameters
+        ----------
+        metrics : ChannelMetrics
+            Table of the network.
+        inRows : [int]
+            Row of each input channel, in the order of inputChannels.
+        outRows : [int]
+            Row of each output channel, in the order of outputChannels.
+        tracer : Tracer (default = None)
+            Tracer of the node.
+        """
+        self.metrics = metrics
+        self.inRows = inRows
+        self.outRows = outRows
+        self.tracer = tracer
+        self.inPorts = {}       # (row, local counters) of each input channel, by id
+        self.outPorts = {}      # (row, local counters) of each output channel, by id
+        self.due = 0.0          # Time of the next write of the local counters
+        self.start = 0.0
+
+    def attach(self, node):
+        """
+        Maps the channels of node to their rows. It is called by the worker
+        running the node, since channels are copied to child processes.
+        """
+        rows = self.metrics.rows
+        port = lambda r: (rows[r], [rows[r][_IN], rows[r][_OUT], 0, 0, 0.0, 0.0])
+        self.inPorts = {id(ch): port(r) for ch, r in zip(node.inputChannels(), self.inRows)}
+        self.outPorts = {id(ch): port(r) for ch, r in zip(node.outputChannels(), self.outRows)}
+        self.due = clock() + PUBLISH_INTERVAL
+        if self.tracer is not None:
+            self.tracer.attach(node)
+
+    def untraced(self):
+        """
+        Returns a Meter of the same channels without tracer, for the threads
+        of a node that write outside of its firings.
+        """
+        meter = Meter(self.metrics, self.inRows, self.outRows)
+        meter.inPorts = self.inPorts
+        meter.outPorts = self.outPorts
+        meter.due = self.due
+        return meter
+
+    def publish(self):
+        """
+        Writes the local counters of the node to the table: the reading time
+        of its inputs, and the bytes, high-water mark and writing time of its
+        outputs.
+        """
+        for (row, c) in self.inPorts.values():
+            row[_GET] = int(c[_GET] * 1e9)
+        for (row, c) in self.outPorts.values():
+            row[_BYTES] = c[_BYTES]
+            row[_HIGH] = c[_HIGH]
+            row[_PUT] = int(c[_PUT] * 1e9)
+        self.due = clock() + PUBLISH_INTERVAL
+
+    def begin(self):
+        if self.tracer is not None:
+            self.tracer.begin()
+            self.start = self.tracer.start
+        else:
+            self.start = clock()
+
+    def read(self, ch, n, t0, t1):
+        (row, c) = self.inPorts[id(ch)]
+        c[_OUT] += n
+        row[_OUT] = c[_OUT]
+        c[_GET] += t1 - t0
+        if t1 > self.due:
+            self.publish()
+        if self.tracer is not None:
+            self.tracer.read(ch, n, t0, t1)
+
+    def computing(self):
+        if self.tracer is not None:
+            self.tracer.computing()
+
+    def fired(self):
+        if self.tracer is not None:
+            self.tracer.fired()
+
+    def write(self, ch, n, t0, t1, tokens = None):
+        (row, c) = self.outPorts[id(ch)]
+        c[_IN] += n
+        row[_IN] = c[_IN]
+        c[_PUT] += t1 - t0
+        if tokens:
+            c[_BYTES] += tokenBytes(tokens, n)
+        if c[_IN] - row[_OUT] > c[_HIGH]:
+            c[_HIGH] = c[_IN] - row[_OUT]
+        if t1 > self.due:
+            self.publish()
+        if self.tracer is not None:
+            self.tracer.write(ch, n, t0, t1)
+
+    def end(self, scenario = None, label = None):
+        if self.tracer is not None:
+            self.tracer.end(scenario, label)
+
+    def flush(self):
+        self.publish()
+        if self.tracer is not None:
+            self.tracer.flush()
+
+
+def prometheusText(samples):
+    """
+    Formats the result of ChannelMetrics.sample in the Prometheus text
+    exposition format.
+    """
+    lines = []
+    for (key, name, kind, text) in _SERIES:
+        lines.append('# HELP ' + name + ' ' + text)
+        lines.append('# TYPE ' + name + ' ' + kind)
+        for s in samples:
+            label = s['channel'].replace('\\', '\\\\').replace('"', '\\"')
+            lines.append(name + '{channel="' + label + '"} ' + repr(s[key]))
+    return '\n'.join(lines) + '\n'
+
+
+def metricsSummary(samples):
+    """
+    Summarizes the result of ChannelMetrics.sample in a table with one line
+    per channel: tokens written and read, high-water mark, bytes written and
+    time blocked writing and reading.
+    """
+    lines = ['channel'.ljust(36) + 'in'.rjust(10) + 'out'.rjust(10) + 'high'.rjust(7) + 'kB'.rjust(10) + \
+        'put (ms)'.rjust(10) + 'get (ms)'.rjust(10)]
+    for s in samples:
+        lines.append(s['channel'][:35].ljust(36) + str(s['tokensIn']).rjust(10) + str(s['tokensOut']).rjust(10) + \
+            str(s['highWater']).rjust(7) + ('%.1f' % (s['bytes'] * 1e-3)).rjust(10) + \
+            ('%.1f' % (s['putBlocked'] * 1e3)).rjust(10) + ('%.1f' % (s['getBlocked'] * 1e3)).rjust(10))
+    return '\n'.join(lines)
+
+
+class MetricsSampler(object):
+    """
+    The MetricsSampler class publishes the metrics of a ChannelMetrics table
+    while a network runs: on a local HTTP endpoint (/metrics, in the
+    Prometheus text format), sampled on each request, and as a CSV stream
+    with one line per channel every interval seconds.
+    """
+    def __init__(self, metrics, port = None, csvFile = None, interval = 1.0, host = '127.0.0.1'):
+        """
+        MetricsSampler initializer. Starts the HTTP server and the CSV thread.
+
+        Parameters
+        ----------
+        metrics : ChannelMetrics
+            Table to be published.
+        port : int (default = None)
+            Port of the HTTP endpoint. When None, there is no endpoint, and
+            when 0, a free port is chosen (see self.port).
+        csvFile : str or file (default = None)
+            File name or open text file (e.g. sys.stdout) of the CSV stream.
+            When None, there is no CSV stream.
+        interval : float (default = 1.0)
+            Time between two CSV samples, in seconds.
+        host : str (default = '127.0.0.1')
+            Address of the HTTP endpoint.
+        """
+        self.metrics = metrics
+        self.interval = interval
+        self.server = None
+        self.port = None
+        self.stopped = threading.Event()
+        self.threads = []
+        if port is not None:
+            sampler = self
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split('?')[0] != '/metrics':
+                        self.send_error(404)
+                        return
+                    body = prometheusText(sampler.metrics.sample()).encode()
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+            self.server = ThreadingHTTPServer((host, port), Handler)
+            self.server.daemon_threads = True
+            self.port = self.server.server_address[1]
+            self.threads.append(threading.Thread(target = self.server.serve_forever, daemon = True))
+        self.csv = None
+        self.ownFile = False
+        if csvFile is not None:
+            self.ownFile = isinstance(csvFile, str)
+            self.csv = open(csvFile, 'w') if self.ownFile else csvFile
+            self.csv.write('time,channel,' + ','.join(s[0] for s in _SERIES) + '\n')
+            self.threads.append(threading.Thread(target = self.writeCSV, daemon = True))
+        for thread in self.threads:
+            thread.start()
+
+    def writeSample(self):
+        """
+        Writes one CSV line per channel with the current metrics.
+        """
+        now = '%.3f' % time.time()
+        for s in self.metrics.sample():
+            self.csv.write(now + ',"' + s['channel'] + '",' + ','.join(str(s[key]) for (key, n, k, t) in _SERIES) + '\n')
+        self.csv.flush()
+
+    def writeCSV(self):
+        while not self.stopped.wait(self.interval):
+            self.writeSample()
+
+    def stop(self):
+        """
+        Stops the endpoint and the CSV stream, which gets a last sample.
+        """
+        self.stopped.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        for thread in self.threads:
+            thread.join()
+        if self.csv is not None:
+            self.writeSample()
+            if self.ownFile:
+                self.csv.close()
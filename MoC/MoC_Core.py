@@ -1,20 +1,36 @@
 """
 Author: Ricardo Bonna
 Creation date: 23/may/2018
-Last update: 13/mar/2019
+Last update: 18/oct/2026
 Module description: This module provides commom functionalities used as
 support for the SDF and SADF modules.
 """
 
 from multiprocessing import Process, Queue
 from typing import List
-from matplotlib import pyplot
+from Channels import *
+from Backends import *
+from Trace import *
+from Metrics import *
+from Memo import *
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from queue import Empty
+import queue
+import threading
+import asyncio
+import pickle
+import time
+import os
 
-def inputRead(c, inps):
+def inputRead(c, inps, tracer = None, check = True):
     """
     Reads the tokens in the input channels (Queues) given by the list inps
     using the token rates defined by the list c.
     It outputs a list where each element is a list of the read tokens.
+    Channels that provide getMany are read with a single call per channel.
+    Raises EndOfStream when a token EOS is read, unless check is False, and
+    MarkerReceived when the checkpoint marker MARK is read.
 
     Parameters
     ----------
@@ -22,6 +38,11 @@ def inputRead(c, inps):
         List of token consumption rates.
     inps : [Queue]
         List of channels.
+    tracer : Tracer (default = None)
+        Tracer of the reading node, which records the time spent on each
+        channel.
+    check : bool (default = True)
+        When False, EOS tokens are returned as any other token.
 
     Returns
     ----------
@@ -32,13 +53,177 @@ def inputRead(c, inps):
         raise Exception("Token consumption list and Queue list have different sizes")
     inputs = []
     for i in range(len(c)):
-        aux = []
-        for j in range(c[i]):
-            aux.append(inps[i].get())
+        if tracer is not None:
+            t0 = clock()
+        getMany = getattr(inps[i], 'getMany', None)
+        if getMany is not None:
+            aux = getMany(c[i])
+        else:
+            aux = []
+            for j in range(c[i]):
+                aux.append(inps[i].get())
+                if isLast(aux[-1]):
+                    break
+        if tracer is not None:
+            tracer.read(inps[i], len(aux) - (len(aux) > 0 and isLast(aux[-1])), t0, clock())
+        if aux and aux[-1] is MARK:
+            raise MarkerReceived(list(zip(inps, inputs)) + [(inps[i], aux[:-1])], inps[i])
+        if check:
+            checkEOS(aux)
         inputs.append(aux)
     return inputs
 
 
+def available(ch):
+    """
+    Returns the number of tokens that can be read from the channel ch
+    without blocking, or 0 when it is not known.
+    """
+    try:
+        return ch.available() if hasattr(ch, 'available') else ch.qsize()
+    except NotImplementedError:
+        return 0
+
+
+def readToMark(ch):
+    """
+    Reads the tokens of the channel ch up to its checkpoint marker MARK,
+    which is not returned, or up to and including an EOS.
+    """
+    tokens = []
+    while 1:
+        batch = ch.getBatch() if hasattr(ch, 'getBatch') else [ch.get()]
+        last = [j for j, t in enumerate(batch) if isLast(t)]
+        if last:
+            return tokens + batch[:last[0] + (batch[last[0]] is EOS)]
+        tokens.extend(batch)
+
+
+def outputWrite(p, outs, outputs, tracer = None):
+    """
+    Writes the token lists in outputs to the output channels (Queues) given
+    by the list outs using the token rates defined by the list p.
+    Channels that provide putMany are written with a single call per channel.
+
+    Parameters
+    ----------
+    p : [int]
+        List of token production rates.
+    outs : [Queue]
+        List of channels.
+    outputs : [[Tokens]]
+        List of token lists, one per channel.
+    tracer : Tracer (default = None)
+        Tracer of the writing node, which records the time spent on each
+        channel.
+    """
+    if len(p) != len(outs):
+        raise Exception("Token production list and Queue list have different sizes")
+    for i in range(len(p)):
+        if len(outputs[i]) < p[i]:
+            raise Exception("Function returns less tokens than the production rate")
+        if tracer is not None:
+            t0 = clock()
+        putMany = getattr(outs[i], 'putMany', None)
+        if putMany is not None:
+            putMany(outputs[i][:p[i]])
+        else:
+            for j in range(p[i]):
+                outs[i].put(outputs[i][j])
+        if tracer is not None:
+            tracer.write(outs[i], p[i], t0, clock(), outputs[i])
+
+
+async def ainputRead(c, inps, tracer = None):
+    """
+    Coroutine version of inputRead, used by the nodes of the asyncio
+    backend. Channels without agetMany are read in a thread of the default
+    executor, so they do not block the event loop.
+
+    Parameters
+    ----------
+    c : [int]
+        List of token consumption rates.
+    inps : [Queue]
+        List of channels.
+    tracer : Tracer (default = None)
+        Tracer of the reading node.
+
+    Returns
+    ----------
+    inputs: [List]
+        List of token lists.
+    """
+    if len(c) != len(inps):
+        raise Exception("Token consumption list and Queue list have different sizes")
+    inputs = []
+    for i in range(len(c)):
+        agetMany = getattr(inps[i], 'agetMany', None)
+        if agetMany is not None:
+            if tracer is not None:
+                t0 = clock()
+            aux = await agetMany(c[i])
+            if tracer is not None:
+                tracer.read(inps[i], len(aux) - (len(aux) > 0 and isLast(aux[-1])), t0, clock())
+            checkEOS(aux)
+            inputs.append(aux)
+        else:
+            loop = asyncio.get_running_loop()
+            inputs.append((await loop.run_in_executor(None, inputRead, [c[i]], [inps[i]], tracer))[0])
+    return inputs
+
+
+async def aoutputWrite(p, outs, outputs, tracer = None):
+    """
+    Coroutine version of outputWrite, used by the nodes of the asyncio
+    backend.
+
+    Parameters
+    ----------
+    p : [int]
+        List of token production rates.
+    outs : [Queue]
+        List of channels.
+    outputs : [[Tokens]]
+        List of token lists, one per channel.
+    tracer : Tracer (default = None)
+        Tracer of the writing node.
+    """
+    if len(p) != len(outs):
+        raise Exception("Token production list and Queue list have different sizes")
+    for i in range(len(p)):
+        if len(outputs[i]) < p[i]:
+            raise Exception("Function returns less tokens than the production rate")
+        aputMany = getattr(outs[i], 'aputMany', None)
+        if aputMany is not None:
+            if tracer is not None:
+                t0 = clock()
+            await aputMany(outputs[i][:p[i]])
+            if tracer is not None:
+                tracer.write(outs[i], p[i], t0, clock(), outputs[i])
+        else:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, outputWrite, [p[i]], [outs[i]], [outputs[i]], tracer)
+
+
+def setCapacities(sizes):
+    """
+    Sets the capacity of the bounded channels (e.g. Channel) in the
+    dictionary sizes, as returned by the buffer size analyses of the SDF and
+    SADF modules. Channels without a setCapacity method are ignored.
+    It must be called before the processes are started.
+
+    Parameters
+    ----------
+    sizes : {Queue: int}
+        Dictionary of channel capacities.
+    """
+    for ch, size in sizes.items():
+        setCapacity = getattr(ch, 'setCapacity', None)
+        if setCapacity is not None:
+            setCapacity(size)
+
+
 def SequencePlot(nSamples, inp, grid = True):
     """
     Plot a sequence of nSamples from the input channel inp
@@ -52,6 +237,9 @@ def SequencePlot(nSamples, inp, grid = True):
     grid: bool (default = True)
         Add grid to the plot.
     """
+    # matplotlib is imported here, so that importing this module (e.g. in
+    # every node process under the spawn start method) stays fast
+    from matplotlib import pyplot
     data = []
     for i in range(nSamples):
         data.append(inp.get())
@@ -61,13 +249,295 @@ def SequencePlot(nSamples, inp, grid = True):
     pyplot.show()
 
 
-class Fork(Process):
+class Node(object):
+    """
+    The Node class is the base class of the processes of a model (Fork,
+    Actor, Kernel and Detector). It runs the firing loop of the node on an
+    execution backend: an OS process (default), a thread or an asyncio
+    coroutine. Subclasses implement step and astep, which perform firings.
+    """
+    count = 0   # Number of nodes created, used for default names
+
+    def __init__(self, nIter = 0, backend = None, name = None):
+        """
+        Node initializer.
+
+        Parameters
+        ----------
+        nIter : int (default = 0)
+            Maximun number of times that the node is allow to fire.
+            When nIter = 0, it can fire indefinitelly.
+        backend : str or backend (default = None)
+            Execution backend: 'process', 'thread', 'asyncio' or a backend
+            object. When None, the node runs in its own process.
+        name : str (default = None)
+            Name of the node. When None, a name is generated.
+        """
+        Node.count += 1
+        self.nIter = nIter                  # Maximun number of firing cycles (0 means inf)
+        self.backend = getBackend(backend)  # Execution backend
+        self.defaultBackend = backend is None
+        self.name = name or type(self).__name__ + '-' + str(Node.count)
+        self.worker = None                  # Process, thread or coroutine running the node
+        self.stopped = False                # Set to stop the node before its next firing
+        self.eosOnEnd = False               # Write EOS on the outputs after the last firing
+        self.tracer = None                  # Tracer of the firings (None when not traced)
+        self.fired = 0                      # Firings before the start (restored from a checkpoint)
+        self.finished = False               # Finished before the restored checkpoint, so not started
+        self.snapshots = None               # Channel receiving the snapshot of the node at a checkpoint
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['worker'] = None
+        return state
+
+    def start(self):
+        """
+        Starts the execution of the node on its backend.
+        """
+        self.stopped = False
+        self.worker = self.backend.start(self)
+
+    def join(self, timeout = None):
+        """
+        Waits for the node to finish.
+        """
+        if self.worker is not None:
+            self.worker.join(timeout)
+
+    def terminate(self):
+        """
+        Stops the node. Process nodes are killed, thread and asyncio nodes are
+        stopped at their next firing.
+        """
+        self.worker.terminate()
+
+    def is_alive(self):
+        """
+        Returns True while the node is running.
+        """
+        return self.worker is not None and self.worker.is_alive()
+
+    def run(self):
+        if self.tracer is not None:
+            self.tracer.attach(self)
+        n = 0
+        try:
+            if getattr(self, 'replicas', 0) > 1:
+                self.runReplicated()
+            else:
+                while 1:
+                    if self.stopped or (self.nIter != 0 and n >= self.nIter):
+                        break
+                    n += self.step(self.nIter - n if self.nIter != 0 else 0)
+            if self.eosOnEnd:
+                self.endStream()
+        except EndOfStream:
+            self.endStream()
+        except MarkerReceived as m:
+            self.cut(m, n)
+        finally:
+            if self.tracer is not None:
+                self.tracer.flush()
+
+    def runReplicated(self):
+        """
+        Firing loop of stateless nodes in replicated mode. The node reads the
+        inputs of its firings and sends them to a pool of self.replicas worker
+        processes, while a writer thread writes the results in the order of
+        the firings. Requires the method readFiring and picklable functions.
+        When traced, a firing ends when it is sent to the pool, so its records
+        show the reads only. An error of a firing or of its writing stops
+        the loop and is raised by the node.
+        """
+        pool = ProcessPoolExecutor(self.replicas)
+        window = queue.Queue(2 * self.replicas)    # Firings in progress, in order
+        meter = self.tracer.untraced() if isinstance(self.tracer, Meter) else None
+        errors = []                                 # Error of the writer thread
+        def writer():
+            while 1:
+                item = window.get()
+                if item is None:
+                    break
+                (future, p) = item
+                if errors:
+                    # The firings after an error are discarded, so that the
+                    # loop never blocks on a full window
+                    future.cancel()
+                    continue
+                try:
+                    outputs = future.result()
+                    if len(outputs) != len(self.outs):
+                        raise Exception('Function returns wrong output number')
+                    outputWrite(p, self.outs, outputs, meter)
+                except BaseException as e:
+                    errors.append(e)
+        thread = threading.Thread(target = writer, daemon = True)
+        thread.start()
+        try:
+            n = 0
+            while 1:
+                if errors or self.stopped or (self.nIter != 0 and n >= self.nIter):
+                    break
+                tr = self.tracer
+                if tr is not None:
+                    tr.begin()
+                (f, inputs, p) = self.readFiring()
+                window.put((pool.submit(f, inputs), p))
+                if tr is not None:
+                    tr.end(getattr(f, '__name__', None))
+                n += 1
+        finally:
+            # Firings in progress are written before the node stops
+            window.put(None)
+            thread.join()
+            pool.shutdown()
+            if errors:
+                raise errors[0]
+
+    async def arun(self):
+        if self.tracer is not None:
+            self.tracer.attach(self)
+        try:
+            if getattr(self, 'replicas', 0) > 1:
+                # The replicated loop blocks, so it runs in a thread of the loop
+                await asyncio.get_running_loop().run_in_executor(None, self.runReplicated)
+            else:
+                n = 0
+                while 1:
+                    if self.stopped or (self.nIter != 0 and n >= self.nIter):
+                        break
+                    n += await self.astep(self.nIter - n if self.nIter != 0 else 0)
+            if self.eosOnEnd:
+                await self.aendStream()
+        except EndOfStream:
+            await self.aendStream()
+        finally:
+            if self.tracer is not None:
+                self.tracer.flush()
+
+    def cut(self, marker, n):
+        """
+        Takes part in a checkpoint after reading the first marker MARK, with
+        n firings performed since the start. The tokens read by the
+        interrupted firing are given back as tokens of their channels, MARK
+        is written in every output, and the tokens that arrive in the other
+        inputs before their MARK are recorded. The snapshot is sent to
+        self.snapshots and the node stops. Since every channel is FIFO and
+        ends at its MARK, each token is either consumed before the snapshot
+        of its consumer or recorded in its channel, once.
+        """
+        chans = self.inputChannels()
+        recorded = [[] for ch in chans]
+        for (ch, tokens) in marker.inputs:
+            recorded[[i for i, c in enumerate(chans) if c is ch][0]].extend(tokens)
+        self.rollback(recorded)
+        for ch in self.outputChannels():
+            ch.put(MARK)
+        for i, ch in enumerate(chans):
+            if ch is not marker.channel:
+                # An EOS is recorded, so the node also stops after a resume
+                recorded[i].extend(readToMark(ch))
+        snapshot = {'fired': self.fired + n, 'state': self.snapshot(), \
+            'channels': {i: tokens for i, tokens in enumerate(recorded) if tokens}}
+        self.snapshots.put((self.name, snapshot))
+
+    def rollback(self, recorded):
+        """
+        Undoes the effects of a firing interrupted by a checkpoint marker
+        (e.g. a control token read before it), adding the tokens it read to
+        the lists of recorded tokens of the input channels.
+        """
+        pass
+
+    def snapshot(self):
+        """
+        Returns the state of the node saved by a checkpoint (a picklable
+        dict).
+        """
+        return {}
+
+    def restore(self, state):
+        """
+        Sets the state of the node from a snapshot taken by snapshot.
+        """
+        pass
+
+    def endStream(self):
+        """
+        Writes the token EOS in every output channel of the node, and tells
+        the network that the node has finished, so that a checkpoint does
+        not wait for its snapshot.
+        """
+        for ch in self.outputChannels():
+            ch.put(EOS)
+        if self.snapshots is not None:
+            self.snapshots.put((self.name, None))
+
+    async def aendStream(self):
+        """
+        Coroutine version of endStream.
+        """
+        outs = self.outputChannels()
+        await aoutputWrite([1] * len(outs), outs, [[EOS]] * len(outs))
+
+    def step(self, maxFirings = 0):
+        """
+        Performs at least one firing, and at most maxFirings firings when
+        maxFirings > 0. Returns the number of firings performed.
+        """
+        raise NotImplementedError
+
+    def iterationRate(self, nodes):
+        """
+        Returns the number of firings of the node in one iteration of the
+        network formed by the list nodes, or None when the node fires as long
+        as it receives tokens.
+        """
+        return None
+
+    def inputChannels(self):
+        """
+        Returns the list of channels read by the node.
+        """
+        return list(self.inps)
+
+    def outputChannels(self):
+        """
+        Returns the list of channels written by the node.
+        """
+        return list(self.outs)
+
+    def localNeeds(self, fifos):
+        """
+        Returns the list of (channel, n) token amounts needed by the next
+        firing when the node is executed in a single process, where fifos
+        maps each input channel to a deque of available tokens.
+        """
+        raise NotImplementedError
+
+    def localFire(self, fifos):
+        """
+        Fires the node once, taking its inputs from the deques in fifos.
+        Returns the production rates and the list of output token lists, in
+        the order of outputChannels.
+        """
+        raise NotImplementedError
+
+    async def astep(self, maxFirings = 0):
+        """
+        Coroutine version of step.
+        """
+        raise NotImplementedError
+
+
+class Fork(Node):
     """
     The Fork class create fork processes that are used to create channel
     junctions. A fork process replicates the tokens from its single input
     channel to its multiple output channels.
     """
-    def __init__(self, inp, outs, nIter = 0):
+    def __init__(self, inp, outs, nIter = 0, backend = None, name = None):
         """
         Fork process initializer.
 
@@ -80,22 +550,874 @@ class Fork(Process):
         nIter: int (default = 0)
             Maximun number of times that the kernel is allow to fire.
             When nIter = 0, it can fire indefinitelly.
+        backend : str or backend (default = None)
+            Execution backend ('process', 'thread' or 'asyncio').
+        name : str (default = None)
+            Name of the node.
         """
-        Process.__init__(self)
+        Node.__init__(self, nIter, backend, name)
         self.inp = inp      # Input channel
         self.outs = outs    # List of output channels
-        self.nIter = nIter  # Maximun number of firing cycles (0 means inf)
 
-    def run(self):
-        n = 0
+    def step(self, maxFirings = 0):
+        tr = self.tracer
+        if tr is not None:
+            tr.begin()
+        getBatch = getattr(self.inp, 'getBatch', None)
+        if getBatch is None:
+            inputVals = [self.inp.get()]
+        else:
+            # Forwards all the tokens already available as a single message.
+            # Batches can not be larger than the capacity of the output channels
+            capacity = min([o.capacity for o in self.outs if getattr(o, 'capacity', 0)] or [0])
+            if capacity != 0:
+                maxFirings = min(maxFirings, capacity) if maxFirings != 0 else capacity
+            inputVals = getBatch(maxFirings)
+        if tr is not None:
+            tr.read(self.inp, len([t for t in inputVals if not isLast(t)]), tr.start, clock())
+            tr.fired()
+        for k in range(len(inputVals)):
+            if isLast(inputVals[k]):
+                # Forwards the tokens before EOS or MARK, which ends the stream
+                outputWrite([k] * len(self.outs), self.outs, [inputVals] * len(self.outs), tr)
+                if inputVals[k] is MARK:
+                    raise MarkerReceived([], self.inp)
+                raise EndOfStream
+        outputWrite([len(inputVals)] * len(self.outs), self.outs, [inputVals] * len(self.outs), tr)
+        if tr is not None:
+            tr.end()
+        return len(inputVals)
+
+    async def astep(self, maxFirings = 0):
+        tr = self.tracer
+        if tr is not None:
+            tr.begin()
+        inputVals = (await ainputRead([1], [self.inp], tr))[0]
+        if tr is not None:
+            tr.fired()
+        await aoutputWrite([1] * len(self.outs), self.outs, [inputVals] * len(self.outs), tr)
+        if tr is not None:
+            tr.end()
+        return 1
+
+    def inputChannels(self):
+        return [self.inp]
+
+    def localNeeds(self, fifos):
+        return [(self.inp, 1)]
+
+    def localFire(self, fifos):
+        inputVals = [fifos[self.inp].popleft()]
+        return ([1] * len(self.outs), [inputVals] * len(self.outs))
+
+
+class Source(Node):
+    """
+    The Source class creates processes that write the items of an iterable
+    (e.g. a generator reading an input file) to their output channels, one
+    token per firing, so that the inputs of a model are produced while the
+    model consumes them instead of being stored in the channels beforehand.
+    With bounded channels, a source runs at most the channel capacity ahead
+    of its consumers. When the iterable is exhausted, the source writes EOS
+    in its outputs and stops. Sources can not be fused in a Cluster.
+    """
+    def __init__(self, items, outs, nIter = 0, backend = None, name = None):
+        """
+        Source process initializer.
+
+        Parameters
+        ----------
+        items: iterable
+            Tokens to be written. Generators are consumed by the process
+            running the source.
+        outs: [Queue]
+            List of output channels. Every item is written to all of them.
+        nIter: int (default = 0)
+            Maximun number of times that the source is allow to fire.
+            When nIter = 0, it fires until items is exhausted.
+        backend : str or backend (default = None)
+            Execution backend ('process', 'thread' or 'asyncio').
+        name : str (default = None)
+            Name of the node.
+        """
+        Node.__init__(self, nIter, backend, name)
+        self.items = items  # Iterable of tokens
+        self.outs = outs    # List of output channels
+        self.iterator = None
+        self.emitted = 0    # Number of items taken from the iterable
+        self.marker = None  # Channel of the checkpoint requests (see Network.checkpoint)
+
+    def __getstate__(self):
+        state = Node.__getstate__(self)
+        state['iterator'] = None
+        return state
+
+    def next(self):
+        """
+        Returns the next item, raising EndOfStream when there is none. The
+        items taken before a restored checkpoint are skipped.
+        """
+        try:
+            if self.iterator is None:
+                self.iterator = iter(self.items)
+                for j in range(self.emitted):
+                    next(self.iterator)
+            item = next(self.iterator)
+        except StopIteration:
+            raise EndOfStream
+        self.emitted += 1
+        return item
+
+    def step(self, maxFirings = 0):
+        if self.marker is not None and available(self.marker):
+            # Checkpoint request: the source is cut before its next item
+            raise MarkerReceived([], None)
+        tr = self.tracer
+        if tr is not None:
+            tr.begin()
+        item = self.next()
+        if tr is not None:
+            tr.fired()
+        outputWrite([1] * len(self.outs), self.outs, [[item]] * len(self.outs), tr)
+        if tr is not None:
+            tr.end()
+        return 1
+
+    async def astep(self, maxFirings = 0):
+        tr = self.tracer
+        if tr is not None:
+            tr.begin()
+        item = self.next()
+        if tr is not None:
+            tr.fired()
+        await aoutputWrite([1] * len(self.outs), self.outs, [[item]] * len(self.outs), tr)
+        if tr is not None:
+            tr.end()
+        return 1
+
+    def inputChannels(self):
+        return []
+
+    def snapshot(self):
+        return {'emitted': self.emitted}
+
+    def restore(self, state):
+        self.emitted = state['emitted']
+        self.iterator = None
+
+
+def takeTokens(fifos, chans, rates):
+    """
+    Takes rates[i] tokens from the deque fifos[chans[i]] for every i,
+    returning the list of token lists.
+    """
+    return [[fifos[ch].popleft() for j in range(r)] for ch, r in zip(chans, rates)]
+
+
+class Cluster(Node):
+    """
+    The Cluster class creates composite nodes that execute a group of nodes
+    (Actor, Kernel, Detector or Fork) in a single process. The members are
+    fired data-driven, one after the other, and the channels between them are
+    replaced by local deques, so Forks become plain fan-outs. Channels that
+    connect the cluster to other nodes are read and written as usual. Tokens
+    already present in an internal channel before the start are consumed as
+    initial tokens.
+    """
+    def __init__(self, members, nIter = 0, backend = None, name = None):
+        """
+        Cluster initializer.
+
+        Parameters
+        ----------
+        members : [Node]
+            List of nodes to be fused. Their nIter limits are respected, and
+            their backends are ignored.
+        nIter : int (default = 0)
+            Maximun number of scheduling rounds (0 means inf).
+        backend : str or backend (default = None)
+            Execution backend ('process', 'thread' or 'asyncio').
+        name : str (default = None)
+            Name of the node.
+        """
+        Node.__init__(self, nIter, backend, name or '+'.join(m.name for m in members))
+        self.members = members
+        produced = set(ch for m in members for ch in m.outputChannels())
+        consumed = set(ch for m in members for ch in m.inputChannels())
+        self.internal = produced & consumed                 # Channels inside the cluster
+        self.inps = [ch for ch in consumed if ch not in self.internal]
+        self.outs = [ch for ch in produced if ch not in self.internal]
+        self.fifos = {ch: deque() for ch in consumed}       # Local tokens of the read channels
+        self.firings = [0] * len(members)                   # Number of firings of each member
+        self.ended = set()                                  # External channels that delivered EOS
+
+    def start(self):
+        """
+        Moves the tokens already written in the internal channels (initial
+        tokens) to the local deques and starts the cluster.
+        """
+        for ch in self.internal:
+            self.fifos[ch].extend(inputRead([ch.qsize()], [ch])[0])
+        Node.start(self)
+
+    def step(self, maxFirings = 0):
+        tr = self.tracer
         while 1:
-            if self.nIter != 0:
-                n += 1
-            if n > self.nIter:
+            fired = 0
+            missing = []
+            for k, m in enumerate(self.members):
+                if m.nIter != 0 and self.firings[k] >= m.nIter:
+                    continue
+                needs = [(ch, n - len(self.fifos[ch])) for (ch, n) in m.localNeeds(self.fifos) \
+                    if len(self.fifos[ch]) < n]
+                if needs:
+                    if not any(ch in self.ended for (ch, n) in needs):
+                        missing.append(needs[0])
+                    continue
+                if tr is not None:
+                    tr.computing()
+                (p, outputs) = m.localFire(self.fifos)
+                if tr is not None:
+                    tr.fired()
+                for ch, r, tokens in zip(m.outputChannels(), p, outputs):
+                    if ch in self.internal:
+                        if len(tokens) < r:
+                            raise Exception("Function returns less tokens than the production rate")
+                        self.fifos[ch].extend(tokens[:r])
+                    else:
+                        outputWrite([r], [ch], [tokens], tr)
+                if tr is not None:
+                    tr.end(label = m.name)
+                self.firings[k] += 1
+                fired += 1
+            if fired:
+                return 1
+            if not missing:
+                # Every member reached its nIter
+                self.stopped = True
+                return 0
+            missing = [(ch, n) for (ch, n) in missing if ch not in self.internal]
+            if not missing:
+                if self.ended:
+                    # The members left wait for ended streams or for each other
+                    raise EndOfStream
+                raise Exception('Deadlock: the members of cluster ' + self.name + ' wait for each other')
+            self.fetch(missing)
+
+    def fetch(self, missing):
+        """
+        Reads tokens from the external channels in the list of (channel, n)
+        missing tokens. Blocks on the channel when there is only one,
+        otherwise waits until one of them delivers a token. A channel that
+        delivers EOS is recorded in self.ended, and the members that do not
+        read it keep firing with the tokens they have.
+        """
+        chans = {}
+        for (ch, n) in missing:
+            chans[ch] = max(chans.get(ch, 0), n)
+        tr = self.tracer
+        if len(chans) == 1:
+            (ch, n), = chans.items()
+            tokens = inputRead([n], [ch], tr, False)[0]
+            if tokens and tokens[-1] is EOS:
+                tokens.pop()
+                self.ended.add(ch)
+            self.fifos[ch].extend(tokens)
+            return
+        if tr is not None:
+            t0 = clock()
+        delay = 0.0001
+        while 1:
+            if not waitChannels(list(chans), 0.01):
+                # Channels without pipes (e.g. ShmChannel) are polled with a
+                # growing delay
+                time.sleep(delay)
+                delay = min(2 * delay, 0.01)
+            for ch in chans:
+                try:
+                    token = ch.get(False)
+                except Empty:
+                    continue
+                if token is EOS:
+                    self.ended.add(ch)
+                    return
+                if tr is not None:
+                    tr.read(ch, 1, t0, clock())
+                self.fifos[ch].append(token)
+                return
+
+    async def astep(self, maxFirings = 0):
+        # Members block on external channels, so rounds run in a thread
+        return await asyncio.get_running_loop().run_in_executor(None, self.step, maxFirings)
+
+
+def fuse(nodes, groups):
+    """
+    Replaces each group of nodes in the list nodes by a Cluster.
+
+    Parameters
+    ----------
+    nodes : [Node]
+        List of nodes of a model.
+    groups : [[Node]]
+        Disjoint groups of nodes to be fused.
+
+    Returns
+    ----------
+    nodes : [Node]
+        New list of nodes, with the clusters in the place of their first
+        member.
+    """
+    result = []
+    fused = []
+    for node in nodes:
+        group = [g for g in groups if node in g]
+        if not group:
+            result.append(node)
+        elif group[0] not in fused:
+            fused.append(group[0])
+            result.append(Cluster(group[0]))
+    return result
+
+
+def autoFuse(nodes, costs = None, ipcCost = 2e-5):
+    """
+    Fuses connected nodes under a simple cost model. Fusing the producer and
+    the consumer of a channel saves ipcCost seconds per token moved, but
+    serializes their execution, losing the execution time of the cheaper
+    cluster. Channels are visited from the one that moves most tokens per
+    firing and their clusters are merged while the saving is larger than the
+    loss. Forks are always fused with their producer.
+
+    Parameters
+    ----------
+    nodes : [Node]
+        List of nodes of a model.
+    costs : {Node: float} (default = None)
+        Execution time of one firing of each node, measured or annotated.
+        Nodes without a cost (other than Forks) are never fused.
+    ipcCost : float (default = 2e-5)
+        Cost in seconds of moving one token between processes.
+
+    Returns
+    ----------
+    nodes : [Node]
+        New list of nodes, with Clusters in the place of the fused nodes.
+    """
+    costs = costs or {}
+    def cost(node):
+        if isinstance(node, Fork):
+            return 0.0
+        return costs.get(node)
+    cluster = {node: [node] for node in nodes}
+    producer = {ch: node for node in nodes for ch in node.outputChannels()}
+    edges = []
+    for node in nodes:
+        for i, ch in enumerate(node.inputChannels()):
+            if ch in producer and producer[ch] is not node:
+                src = producer[ch]
+                rate = getattr(src, 'p', [1] * len(src.outputChannels()))[src.outputChannels().index(ch)]
+                edges.append((rate, src, node))
+    edges.sort(key = lambda e: -e[0])
+    for (rate, src, dst) in edges:
+        a = cluster[src]
+        b = cluster[dst]
+        if a is b:
+            continue
+        costA = [cost(m) for m in a]
+        costB = [cost(m) for m in b]
+        if isinstance(dst, Fork) or (None not in costA and None not in costB and \
+            ipcCost * rate > min(sum(costA), sum(costB))):
+            merged = [m for m in nodes if m in a or m in b]
+            for m in merged:
+                cluster[m] = merged
+    groups = []
+    for node in nodes:
+        if len(cluster[node]) > 1 and cluster[node] not in groups:
+            groups.append(cluster[node])
+    return fuse(nodes, groups)
+
+
+CHECKPOINT_HEADER = b'MoC-ckpt-1\n'   # First bytes of a checkpoint file
+
+
+def channelKey(node, i):
+    """
+    Returns the key of the i-th input channel of node in a checkpoint.
+    """
+    return node.name + ':' + str(i)
+
+
+def sinkKey(node, j):
+    """
+    Returns the key of the j-th output channel of node in a checkpoint, for
+    channels that no node reads.
+    """
+    return node.name + '>' + str(j)
+
+
+def saveCheckpoint(fileName, nodes, channels):
+    """
+    Writes a checkpoint file: a header followed by the protocol-5 pickle of
+    the snapshot, with the data of NumPy tokens in the pickle stream. The
+    file is written under a temporary name and renamed, so a crash while
+    writing keeps the previous checkpoint.
+
+    Parameters
+    ----------
+    fileName : str
+        Name of the checkpoint file.
+    nodes : {str: dict}
+        Number of firings ('fired') and state ('state') of each node, or
+        {'finished': True} for finished nodes, by node name.
+    channels : {str: [Tokens]}
+        Tokens in each channel, by channelKey, or by sinkKey for the sink
+        channels.
+    """
+    tmp = fileName + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(CHECKPOINT_HEADER)
+        pickle.dump({'nodes': nodes, 'channels': channels}, f, 5)
+    os.replace(tmp, fileName)
+
+
+def loadCheckpoint(fileName):
+    """
+    Reads a checkpoint file written by saveCheckpoint. Returns the dicts of
+    node snapshots and channel tokens.
+    """
+    with open(fileName, 'rb') as f:
+        if f.read(len(CHECKPOINT_HEADER)) != CHECKPOINT_HEADER:
+            raise Exception(fileName + ' is not a checkpoint file')
+        data = pickle.load(f)
+    return (data['nodes'], data['channels'])
+
+class Network(object):
+    """
+    The Network class groups the nodes and channels of a model and manages
+    their lifecycle. Nodes are stopped gracefully with end-of-stream tokens
+    (EOS): a node that reads EOS writes EOS in all its outputs and stops, so
+    the end of the streams propagates through Forks, Kernels and Detectors.
+    A traced network records the firings of its nodes, which are available
+    in traces after shutdown, and a network with metrics counts the tokens,
+    bytes and blocked time of every channel while it runs (see the Metrics
+    module). A running network can be stopped at a
+    consistent checkpoint written to a file, and a new network built in the
+    same way can be restored from it before being started.
+    """
+    def __init__(self, backend = None, trace = False, metrics = False):
+        """
+        Network initializer.
+
+        Parameters
+        ----------
+        backend : str or backend (default = None)
+            Execution backend of the nodes created without an explicit
+            backend, and of the channels created with channel.
+        trace : bool (default = False)
+            Records the firings of every node (see the Trace module).
+        metrics : bool (default = False)
+            Counts the tokens moved through every channel (see
+            sampleMetrics and publishMetrics).
+        """
+        self.backend = getBackend(backend)  # Default execution backend
+        self.nodes = []                     # Registered nodes
+        self.channels = []                  # Registered channels
+        self.trace = trace                  # Trace the firings of the nodes
+        self.collector = None               # Receives the traces while the network runs
+        self.traces = []                    # Traces of the nodes, one dict per node
+        self.snapshots = None               # Receives the snapshots of the nodes at a checkpoint
+        self.metrics = metrics              # Count the tokens moved through the channels
+        self.table = None                   # ChannelMetrics of the running network
+        self.sampler = None                 # MetricsSampler publishing the table
+        self.lastMetrics = []               # Metrics sampled at shutdown
+
+    def add(self, *nodes):
+        """
+        Registers one or more nodes. Returns the first node.
+        """
+        for node in nodes:
+            if node.defaultBackend:
+                node.backend = self.backend
+            self.nodes.append(node)
+        return nodes[0]
+
+    def channel(self, capacity = 0):
+        """
+        Creates and registers a channel suitable for the network backend.
+        """
+        return self.addChannel(self.backend.channel(capacity))
+
+    def addChannel(self, ch):
+        """
+        Registers a channel created elsewhere (e.g. a ShmChannel), so that it
+        is released by shutdown. Returns the channel.
+        """
+        self.channels.append(ch)
+        return ch
+
+    def allChannels(self):
+        """
+        Returns the registered channels and the channels of the nodes.
+        """
+        chans = []
+        for ch in self.channels + [ch for n in self.nodes for ch in n.inputChannels() + n.outputChannels()]:
+            if not any(ch is c for c in chans):
+                chans.append(ch)
+        return chans
+
+    def sources(self):
+        """
+        Returns the channels read by the nodes and written by none of them.
+        """
+        produced = [ch for n in self.nodes for ch in n.outputChannels()]
+        return [ch for ch in self.allChannels() if not any(ch is c for c in produced) and \
+            any(ch is c for n in self.nodes for c in n.inputChannels())]
+
+    def sinks(self):
+        """
+        Returns the channels written by the nodes and read by none of them.
+        """
+        consumed = [ch for n in self.nodes for ch in n.inputChannels()]
+        return [ch for ch in self.allChannels() if not any(ch is c for c in consumed) and \
+            any(ch is c for n in self.nodes for c in n.outputChannels())]
+
+    def start(self):
+        """
+        Starts every node. Nodes that stop after nIter firings write EOS in
+        their outputs.
+        """
+        if self.trace:
+            self.collector = TraceCollector(self.controlChannel())
+            producer = {}
+            consumer = {}
+            for n in self.nodes:
+                for ch in n.outputChannels():
+                    producer[id(ch)] = n.name
+                for ch in n.inputChannels():
+                    consumer[id(ch)] = n.name
+            for n in self.nodes:
+                inLabels = ['<-' + producer.get(id(ch), 'in' + str(i)) for i, ch in enumerate(n.inputChannels())]
+                outLabels = ['->' + consumer.get(id(ch), 'out' + str(i)) for i, ch in enumerate(n.outputChannels())]
+                n.tracer = Tracer(n.name, self.collector.results, inLabels, outLabels)
+        if self.metrics:
+            self.startMetrics()
+        self.snapshots = self.controlChannel()
+        for n in self.nodes:
+            n.snapshots = self.snapshots
+            if isinstance(n, Source):
+                n.marker = self.controlChannel()
+        pool = [n for n in self.nodes if isinstance(n.backend, PoolBackend)]
+        if pool:
+            # Starts the missing pool workers at once instead of one by one
+            pool[0].backend.warmUp(len(pool))
+        for node in self.nodes:
+            node.eosOnEnd = True
+            if not node.finished:
+                node.start()
+
+    def startMetrics(self):
+        """
+        Creates the metrics table, with one row per channel labelled
+        producer:output->consumer:input, and puts a Meter in every node.
+        """
+        chans = self.allChannels()
+        row = lambda ch: [k for k, c in enumerate(chans) if c is ch][0]
+        ends = [['input', 'output'] for ch in chans]
+        for n in self.nodes:
+            for j, ch in enumerate(n.outputChannels()):
+                ends[row(ch)][0] = n.name + ':' + str(j)
+            for i, ch in enumerate(n.inputChannels()):
+                ends[row(ch)][1] = n.name + ':' + str(i)
+        self.table = ChannelMetrics([p + '->' + c for (p, c) in ends], [getattr(ch, 'capacity', 0) for ch in chans])
+        for k, ch in enumerate(chans):
+            try:
+                # Initial tokens and tokens restored from a checkpoint
+                self.table.setTokens(k, ch.qsize())
+            except NotImplementedError:
+                pass
+        for n in self.nodes:
+            n.tracer = Meter(self.table, [row(ch) for ch in n.inputChannels()], \
+                [row(ch) for ch in n.outputChannels()], n.tracer)
+
+    def sampleMetrics(self):
+        """
+        Returns the current metrics of every channel (see
+        ChannelMetrics.sample), or the last ones after shutdown.
+        """
+        if self.table is None:
+            return self.lastMetrics
+        return self.table.sample()
+
+    def publishMetrics(self, port = None, csvFile = None, interval = 1.0):
+        """
+        Publishes the metrics of the running network until shutdown, in the
+        Prometheus text format on http://127.0.0.1:port/metrics and as a CSV
+        stream sampled every interval seconds. Returns the MetricsSampler,
+        whose port attribute holds the port chosen when port is 0.
+        """
+        if self.table is None:
+            raise Exception('Metrics are published after the start of a network with metrics')
+        self.sampler = MetricsSampler(self.table, port, csvFile, interval)
+        return self.sampler
+
+    def controlChannel(self):
+        """
+        Returns a new channel for the messages between the nodes and the
+        network (traces, snapshots), which pool workers can also receive.
+        """
+        return self.backend.channel() if isinstance(self.backend, PoolBackend) else Queue()
+
+    def run(self, nIter, firings = None, timeout = None):
+        """
+        Starts the network, waits for nIter iterations and shuts it down.
+        The tokens written in the sink channels are collected while the
+        network runs.
+
+        Parameters
+        ----------
+        nIter : int
+            Number of iterations.
+        firings : {Node: int} (default = None)
+            Number of firings of each node per iteration. By default, SDF
+            actors fire as given by the repetition vector, detectors fire once
+            and the other nodes fire while they receive tokens.
+        timeout : float (default = None)
+            Maximum time to wait for the nodes to stop after the iterations.
+
+        Returns
+        ----------
+        outputs : {Queue: [Tokens]}
+            Tokens read from each sink channel, EOS excluded.
+        """
+        if firings is None:
+            firings = {node: node.iterationRate(self.nodes) for node in self.nodes}
+        for node, rate in firings.items():
+            if rate:
+                node.nIter = nIter * rate
+        outputs = {}
+        def drain(ch, tokens):
+            while 1:
+                token = ch.get()
+                if isLast(token):
+                    break
+                tokens.append(token)
+        drains = []
+        for ch in self.sinks():
+            outputs[ch] = []
+            drains.append(threading.Thread(target = drain, args = (ch, outputs[ch]), daemon = True))
+        self.start()
+        for thread in drains:
+            thread.start()
+        for node in self.nodes:
+            if node.nIter != 0:
+                node.join()
+        self.shutdown(timeout)
+        for thread in drains:
+            thread.join(timeout)
+        return outputs
+
+    def join(self, timeout = None):
+        """
+        Waits for every node to stop.
+        """
+        for node in self.nodes:
+            node.join(timeout)
+
+    def shutdown(self, timeout = 5.0):
+        """
+        Stops the network: writes EOS in the source channels, waits for the
+        nodes to stop, terminates the nodes that did not stop in timeout
+        seconds and releases the shared memory channels.
+
+        Parameters
+        ----------
+        timeout : float (default = 5.0)
+            Maximum time to wait for the nodes. When None, waits indefinitely.
+        """
+        for ch in self.sources():
+            if any(ch is c and n.is_alive() for n in self.nodes for c in n.inputChannels()):
+                ch.put(EOS)
+        deadline = None if timeout is None else time.time() + timeout
+        consumers = [(ch, [n for n in self.nodes if any(ch is c for c in n.inputChannels())]) \
+            for ch in self.allChannels()]
+        while any(node.is_alive() for node in self.nodes):
+            if deadline is not None and time.time() > deadline:
                 break
-            inputVal = self.inp.get()
-            for i in self.outs:
-                i.put(inputVal)
+            # Tokens left in the channels of stopped consumers are discarded,
+            # so that their producers can flush their queues and exit
+            for (ch, nodes) in consumers:
+                if nodes and not any(n.is_alive() for n in nodes):
+                    try:
+                        while 1:
+                            ch.get(False)
+                    except Empty:
+                        pass
+            time.sleep(0.01)
+        for node in self.nodes:
+            if node.is_alive():
+                node.terminate()
+        if self.collector is not None:
+            # Nodes that were terminated do not send their traces
+            self.traces = self.collector.stop(1.0)
+            if isinstance(self.collector.results, PoolChannel):
+                self.collector.results.unlink()
+            self.collector = None
+        for n in self.nodes:
+            if isinstance(getattr(n, 'marker', None), PoolChannel):
+                n.marker.unlink()
+            n.marker = None
+        if isinstance(self.snapshots, PoolChannel):
+            self.snapshots.unlink()
+        self.snapshots = None
+        if self.sampler is not None:
+            self.sampler.stop()
+            self.sampler = None
+        if self.table is not None:
+            self.lastMetrics = self.table.sample()
+            for n in self.nodes:
+                if isinstance(n.tracer, Meter):
+                    n.tracer = n.tracer.tracer
+            self.table.unlink()
+            self.table = None
+        for ch in self.allChannels():
+            unlink = getattr(ch, 'unlink', None)
+            if unlink is not None:
+                try:
+                    unlink()
+                except FileNotFoundError:
+                    pass
+
+    def checkpoint(self, fileName, timeout = None):
+        """
+        Stops the running network at a consistent checkpoint and writes it to
+        fileName. The marker MARK is written in the source channels and by
+        the Sources, and flows through the network behind the tokens (see
+        Node.cut), so the snapshot holds, for the same cut, the tokens in
+        every channel and the state and number of firings of every node:
+        each token is consumed before the cut or saved, once. The network is
+        not paused beforehand. The sink channels are read until their MARK
+        while the checkpoint is taken, and their tokens are saved too, so
+        they must not be read by the caller during the call. Nodes that had
+        finished (e.g. Sources with no more items) are saved as finished.
+        The nodes are stopped when the call returns, and shutdown must be
+        called afterwards. Clusters, replicated nodes and asyncio nodes do
+        not support checkpoints.
+
+        Parameters
+        ----------
+        fileName : str
+            Name of the checkpoint file.
+        timeout : float (default = None)
+            Maximum time to wait for the snapshots, in seconds. When None,
+            waits while some node is running.
+        """
+        for node in self.nodes:
+            if isinstance(node, Cluster) or getattr(node, 'replicas', 0) > 1:
+                raise Exception('Node ' + node.name + ' does not support checkpoints')
+            if isinstance(node.backend, AsyncioBackend):
+                raise Exception('Checkpoints are not supported by the asyncio backend (node ' + node.name + ')')
+        if self.snapshots is None:
+            raise Exception('Checkpoint of a network that was not started')
+        sinks = {}
+        drains = []
+        for ch in self.sinks():
+            sinks[id(ch)] = []
+            drains.append(threading.Thread(target = lambda ch, tokens: tokens.extend(readToMark(ch)), \
+                args = (ch, sinks[id(ch)]), daemon = True))
+        for thread in drains:
+            thread.start()
+        for node in self.nodes:
+            if isinstance(node, Source):
+                node.marker.put(MARK)
+        for ch in self.sources():
+            ch.put(MARK)
+        deadline = None if timeout is None else time.time() + timeout
+        snapshots = {node.name: {'finished': True} for node in self.nodes if node.finished}
+        while len(snapshots) < len(self.nodes):
+            try:
+                (name, snapshot) = self.snapshots.get(timeout = 0.1)
+                snapshots[name] = snapshot or {'finished': True}
+            except Empty:
+                if not any(node.is_alive() for node in self.nodes):
+                    break
+                if deadline is not None and time.time() > deadline:
+                    raise Exception('Checkpoint timeout')
+        missing = [node.name for node in self.nodes if node.name not in snapshots]
+        if missing:
+            raise Exception('Nodes stopped without a snapshot: ' + ', '.join(missing))
+        for thread in drains:
+            thread.join()
+        channels = {}
+        for node in self.nodes:
+            for i, tokens in snapshots[node.name].pop('channels', {}).items():
+                channels[channelKey(node, i)] = tokens
+            for j, ch in enumerate(node.outputChannels()):
+                if sinks.get(id(ch)):
+                    channels[sinkKey(node, j)] = sinks[id(ch)]
+        saveCheckpoint(fileName, snapshots, channels)
+
+    def restore(self, fileName):
+        """
+        Sets the nodes and their channels to a checkpoint written by
+        checkpoint or by Simulator.checkpoint. It must be called before start
+        on a network built as the one that was checkpointed (nodes are
+        matched by name and channels by their consumer, or by their producer
+        for sink channels). The tokens already in the channels (e.g. initial
+        tokens) are replaced by the saved ones, so the tokens that were in
+        the sink channels at the cut are read again first. Sources skip the
+        items they had written, and finished nodes are not started. Bounded
+        Queues must have room for the saved tokens.
+
+        Parameters
+        ----------
+        fileName : str
+            Name of the checkpoint file.
+        """
+        (states, channels) = loadCheckpoint(fileName)
+        if len(set(node.name for node in self.nodes)) != len(self.nodes):
+            raise Exception('Checkpoints require nodes with different names')
+        sinks = self.sinks()
+        for node in self.nodes:
+            if node.name not in states:
+                raise Exception('Node ' + node.name + ' is not in the checkpoint ' + fileName)
+            state = states[node.name]
+            node.finished = state.get('finished', False)
+            if not node.finished:
+                node.fired = state['fired']
+                node.restore(state['state'])
+            chans = [(channelKey(node, i), ch) for i, ch in enumerate(node.inputChannels())] + \
+                [(sinkKey(node, j), ch) for j, ch in enumerate(node.outputChannels()) if any(ch is c for c in sinks)]
+            for key, ch in chans:
+                if ch.qsize():
+                    inputRead([ch.qsize()], [ch], check = False)
+                tokens = channels.get(key, [])
+                if getattr(ch, 'capacity', 0) and len(tokens) > ch.capacity and hasattr(ch, 'setCapacity'):
+                    # The tokens given back by an interrupted firing may exceed
+                    # the capacity by less than its consumption rate
+                    ch.setCapacity(len(tokens))
+                if tokens:
+                    outputWrite([len(tokens)], [ch], [tokens])
+
+    def saveTrace(self, fileName):
+        """
+        Writes the traces of the last run to fileName in the Chrome trace
+        event format.
+        """
+        saveTrace(self.traces, fileName)
+
+    def traceSummary(self):
+        """
+        Returns a table summarizing the traces of the last run.
+        """
+        return traceSummary(self.traces)
+
+    def metricsSummary(self):
+        """
+        Returns a table of the current channel metrics, or of the last ones
+        after shutdown.
+        """
+        return metricsSummary(self.sampleMetrics())
 
 
 # Test of the module
@@ -105,3 +1427,69 @@ if __name__ == '__main__':
     q = [Queue()]
     q[0].put(12)
     print(inputRead(c,q))
+    ch = [Channel()]
+    outputWrite([2], ch, [[1, 2, 3]])
+    print(inputRead([2], ch))
+
+    # Network of forks ended by EOS
+    net = Network()
+    a = net.channel()
+    b = net.channel()
+    o1 = net.channel()
+    o2 = net.channel()
+    net.add(Fork(a, [b]), Fork(b, [o1, o2]))
+    net.start()
+    a.putMany([1, 2, 3])
+    net.shutdown()
+    print(inputRead([3], [o1]), o1.get(), inputRead([3], [o2]))
+
+    # Traced network
+    net = Network(trace = True)
+    a = net.channel()
+    o = net.channel()
+    net.add(Fork(a, [o], name = 'fork'))
+    for i in range(10):
+        a.put(i)
+    print(net.run(10)[o])
+    print(net.traceSummary())
+
+    # Network fed by a generator through a bounded channel
+    net = Network()
+    a = net.channel(2)
+    o = net.channel()
+    net.add(Source((i * i for i in range(6)), [a]), Fork(a, [o]))
+    print(net.run(0)[o])
+
+    # Cluster whose inputs end at different times: the members keep firing
+    # until both streams end, as in the network without the cluster. The
+    # LocalChannels of the thread backend have no pipe to wait on
+    for backend in [None, 'thread']:
+        outs = []
+        for fused in [False, True]:
+            net = Network(backend)
+            (a, b, o1, o2) = [net.channel() for i in range(4)]
+            forks = [Fork(a, [o1]), Fork(b, [o2])]
+            net.add(Source(range(2), [a]), Source(range(8), [b]), *(fuse(forks, [forks]) if fused else forks))
+            result = net.run(0)
+            outs.append((result[o1], result[o2]))
+        print(outs[1], outs[0] == outs[1])
+
+    # Network with channel metrics, published while it runs
+    import io
+    import urllib.request
+    net = Network(metrics = True)
+    a = net.channel()
+    b = net.channel(4)
+    o = net.channel()
+    net.add(Source((np.zeros(8) for i in range(50)), [a], name = 'source'), Fork(a, [b], name = 'fork'), \
+        Fork(b, [o], name = 'copy'))
+    net.start()
+    csv = io.StringIO()
+    sampler = net.publishMetrics(port = 0, csvFile = csv, interval = 0.05)
+    text = urllib.request.urlopen('http://127.0.0.1:' + str(sampler.port) + '/metrics').read().decode()
+    print([line for line in text.split('\n') if line.startswith('moc_channel_tokens_in_total')])
+    for i in range(50):
+        o.get()
+    net.shutdown()
+    print(net.metricsSummary())
+    print(csv.getvalue().split('\n')[:2])
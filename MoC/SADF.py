@@ -1,18 +1,186 @@
 """
 Author: Ricardo Bonna
 Creation date: 22/may/2018
-Last update: 13/mar/2019
+Last update: 18/oct/2026
 Module description: This module provides the classes Kernel and Detector, for
-creating the two basic components of an SADF model.
+creating the two basic components of an SADF model, and the class Simulator,
+which executes an SADF model in a single process. Detectors can be
+controlled by other detectors, forming hierarchies of sub-networks.
 """
 
 from MoC_Core import *
+from math import gcd
 
-class Kernel(Process):
+
+class RepeatToken(object):
+    """
+    Class of the control token REPEAT, which selects again the scenario of
+    the previous control token of the channel (for as many firings). It is
+    emitted by incremental detectors when a scenario does not change.
+    Unpickling gives back the single instance.
+    """
+    def __repr__(self):
+        return 'REPEAT'
+
+    def __reduce__(self):
+        return (_repeat, ())
+
+REPEAT = RepeatToken()
+
+def _repeat():
+    return REPEAT
+
+
+def sameToken(a, b):
     """
-    The Kernel class creates SADF kernel processes.
+    Returns True when the tokens a and b are equal. Tokens that can not be
+    compared (e.g. NumPy arrays) are different.
     """
-    def __init__(self, ctrl, inps, outs, nIter = 0):
+    try:
+        return bool(a == b)
+    except Exception:
+        return False
+
+
+class Controlled(Node):
+    """
+    Base class of the nodes whose firings are selected by the control tokens
+    of a control channel: kernels, and detectors of a hierarchy. A control
+    token is a scenario id of the scenario table of the node, a pair (id, n)
+    that selects the scenario for n firings, a tuple of length 3 with the
+    scenario itself, or REPEAT.
+    """
+    def initControl(self, ctrl, scenarios):
+        """
+        Sets the control channel and the scenario table of the node.
+        """
+        self.ctrl = ctrl    # Control input channel
+        self.scenarios = scenarios          # Scenario table or function
+        self.table = dict(scenarios) if isinstance(scenarios, dict) else {}  # Known scenarios
+        self.current = None                 # Current scenario
+        self.label = None                   # Id or function name of the current scenario
+        self.left = 0                       # Firings left in the current scenario
+        self.last = None                    # Decoded last control token, repeated by REPEAT
+        self.lastToken = None               # Last control token other than REPEAT
+        self.undo = None                    # Control token read by the current firing (or None) and previous lastToken
+
+    def scenario(self, sid):
+        """
+        Returns the scenario with id sid.
+        """
+        s = self.table.get(sid)
+        if s is None:
+            if not callable(self.scenarios):
+                raise Exception(type(self).__name__ + ' ' + self.name + ': unknown scenario ' + str(sid))
+            s = self.table[sid] = self.scenarios(sid)
+        return s
+
+    def decode(self, token, last = None):
+        """
+        Returns the scenario selected by a control token, its label and the
+        number of firings it lasts. REPEAT gives back last, or the last
+        control token selected by the node.
+        """
+        if token is REPEAT:
+            last = last or self.last
+            if last is None:
+                raise Exception(type(self).__name__ + ' ' + self.name + ': REPEAT before the first scenario')
+            return last
+        if isinstance(token, tuple):
+            if len(token) == 3:
+                return (token, getattr(token[2], '__name__', None), 1)
+            (sid, n) = token
+            if n < 1:
+                raise Exception(type(self).__name__ + ' ' + self.name + ': scenario runs must have at least one firing')
+            return (self.scenario(sid), sid, n)
+        return (self.scenario(token), token, 1)
+
+    def expand(self, tokens):
+        """
+        Returns the list of scenarios of the firings selected by a list of
+        control tokens.
+        """
+        firings = []
+        last = None
+        for token in tokens:
+            last = self.decode(token, last)
+            firings += [last[0]] * last[2]
+        return firings
+
+    def select(self, token):
+        """
+        Makes the control token token the current scenario.
+        """
+        self.last = self.decode(token)
+        (self.current, self.label, self.left) = self.last
+        if token is not REPEAT:
+            self.lastToken = token
+
+    def readControl(self):
+        """
+        Reads a control token when the current scenario is over and counts
+        the firing.
+        """
+        self.undo = None
+        if self.left == 0:
+            token = inputRead([1], [self.ctrl], self.tracer)[0][0]
+            self.undo = (token, self.lastToken)
+            self.select(token)
+        else:
+            self.undo = (None, self.lastToken)
+        self.left -= 1
+
+    async def areadControl(self):
+        if self.left == 0:
+            self.select((await ainputRead([1], [self.ctrl], self.tracer))[0][0])
+        self.left -= 1
+
+    def localControl(self, fifos):
+        if self.left == 0:
+            self.select(fifos[self.ctrl].popleft())
+        self.left -= 1
+
+    def inputChannels(self):
+        return [self.ctrl] + list(self.inps)
+
+    def rollback(self, recorded):
+        # The firing counted by readControl is given back, and the control
+        # token it read goes back to the control channel (the first input)
+        if self.undo is None:
+            return
+        (token, self.lastToken) = self.undo
+        if token is None:
+            self.left += 1
+        else:
+            self.left = 0
+            recorded[0].insert(0, token)
+
+    def snapshot(self):
+        return {'left': self.left, 'lastToken': self.lastToken}
+
+    def restore(self, state):
+        if state['lastToken'] is not None:
+            self.select(state['lastToken'])
+        self.left = state['left']
+
+    def localNeeds(self, fifos):
+        if self.left:
+            return list(zip(self.inps, self.current[0]))
+        if not fifos[self.ctrl]:
+            return [(self.ctrl, 1)]
+        c = self.decode(fifos[self.ctrl][0])[0][0]
+        return [(self.ctrl, 1)] + list(zip(self.inps, c))
+
+
+class Kernel(Controlled):
+    """
+    The Kernel class creates SADF kernel processes. Each firing is selected
+    by a control token: a scenario id of the kernel scenario table, a pair
+    (id, n) that selects the scenario for n firings, a tuple (c, p, f) with
+    the consumption rates, the production rates and the function, or REPEAT.
+    A kernel keeps its scenario until its firings are over.
+    """
+    def __init__(self, ctrl, inps, outs, nIter = 0, backend = None, name = None, replicas = 0, scenarios = None, memo = None):
         """
         Kernel process initializer.
 
@@ -27,41 +195,105 @@ class Kernel(Process):
         nIter : Int (default = 0)
             Maximun number of times that the kernel is allow to fire.
             When nIter = 0, it can fire indefinitelly.
+        backend : str or backend (default = None)
+            Execution backend ('process', 'thread' or 'asyncio').
+        name : str (default = None)
+            Name of the node.
+        replicas : Int (default = 0)
+            When replicas > 1, the kernel is fired in replicated mode: up to
+            replicas firings run at the same time in a pool of worker
+            processes, and the outputs are written in the firing order.
+            Only for kernels whose scenario functions are pure and picklable
+            and that have no self-loops.
+        scenarios : {id: (c, p, f)} or function : id -> (c, p, f) (default = None)
+            Scenario table of the kernel, so that control tokens only carry
+            scenario ids. A function is called once per id, in the process
+            of the kernel. Ids must not be tuples.
+        memo : bool, Int or Memo (default = None)
+            Memoization of the firings of pure scenario functions: True for a
+            new Memo, an Int for a new Memo of that many bytes, or a Memo.
+            Firings of a function whose inputs have the same content as an
+            earlier firing return the stored outputs. Not used in replicated
+            mode.
         """
-        Process.__init__(self)
-        self.ctrl = ctrl    # Control input channel
+        Node.__init__(self, nIter, backend, name)
+        self.initControl(ctrl, scenarios)
+        self.replicas = replicas    # Number of parallel firings in replicated mode
         self.m = len(inps)  # Number of inputs
         self.n = len(outs)  # Number of outputs
         self.inps = inps    # List of input channels
         self.outs = outs    # List of output channels
-        self.nIter = nIter  # Maximun number of firing cycles (0 means inf)
-
-    def run(self):
-        n = 0
-        while 1:
-            if self.nIter != 0:
-                n += 1
-            if n > self.nIter:
-                break
-            # Reads the control input
-            (c, p, f) = self.ctrl.get()
-            # Reads inputs based on token consumption rates
-            inputs = inputRead(c, self.inps)
-            # Applies function to inputs
-            outputs = f(inputs)
-            if len(outputs) != self.n:
-                raise Exception('Function returns wrong output number')
-            # Write on the output channels
-            for i in range(self.n):
-                for j in range(p[i]):
-                    self.outs[i].put(outputs[i][j])
+        self.memo = getMemo(memo)   # Cache of the firings (None when not memoized)
+
+    def step(self, maxFirings = 0):
+        tr = self.tracer
+        if tr is not None:
+            tr.begin()
+        # Reads the control input when the current scenario is over
+        self.readControl()
+        (c, p, f) = self.current
+        # Reads inputs based on token consumption rates
+        inputs = inputRead(c, self.inps, tr)
+        # Applies function to inputs
+        outputs = self.fire(f, inputs)
+        if tr is not None:
+            tr.fired()
+        # Write on the output channels
+        outputWrite(p, self.outs, outputs, tr)
+        if tr is not None:
+            tr.end(self.label)
+        return 1
 
+    async def astep(self, maxFirings = 0):
+        tr = self.tracer
+        if tr is not None:
+            tr.begin()
+        await self.areadControl()
+        (c, p, f) = self.current
+        inputs = await ainputRead(c, self.inps, tr)
+        outputs = self.fire(f, inputs)
+        if tr is not None:
+            tr.fired()
+        await aoutputWrite(p, self.outs, outputs, tr)
+        if tr is not None:
+            tr.end(self.label)
+        return 1
 
-class Detector(Process):
+    def readFiring(self):
+        """
+        Reads the control token and the inputs of one firing. Returns the
+        scenario function, the inputs and the production rates.
+        """
+        self.readControl()
+        (c, p, f) = self.current
+        return (f, inputRead(c, self.inps, self.tracer), p)
+
+    def localFire(self, fifos):
+        self.localControl(fifos)
+        (c, p, f) = self.current
+        return (p, self.fire(f, takeTokens(fifos, self.inps, c)))
+
+    def fire(self, f, inputs):
+        """
+        Applies the scenario function f to a list of token lists and checks
+        the number of outputs.
+        """
+        outputs = f(inputs) if self.memo is None else self.memo.call(f, inputs)
+        if len(outputs) != self.n:
+            raise Exception('Function returns wrong output number')
+        return outputs
+
+
+class Detector(Controlled):
     """
-    The Detector class creates SADF detector processes.
+    The Detector class creates SADF detector processes. A detector with a
+    control channel is part of a hierarchy: each of its firings is selected
+    by a control token of a higher level detector, as for kernels, and its
+    scenarios are (c, f, g) tuples, so the higher level detector sets the
+    rates and functions of the detector of a sub-network.
     """
-    def __init__(self, c, f, g, s0, inps, outs, nIter = 0):
+    def __init__(self, c, f, g, s0, inps, outs, nIter = 0, backend = None, name = None, ctrl = None, \
+        scenarios = None, incremental = False):
         """
         Detector process initializer.
 
@@ -82,8 +314,25 @@ class Detector(Process):
         nIter : Int (default = 0)
             Maximun number of times that the kernel is allow to fire.
             When nIter = 0, it can fire indefinitelly.
+        backend : str or backend (default = None)
+            Execution backend ('process', 'thread' or 'asyncio').
+        name : str (default = None)
+            Name of the node.
+        ctrl : Queue (default = None)
+            Control channel that connects the detector to a higher level
+            detector. When given, c, f and g are those of the first scenario
+            until the first control token is read (they may be None).
+        scenarios : {id: (c, f, g)} or function : id -> (c, f, g) (default = None)
+            Scenario table of a detector with a control channel.
+        incremental : bool (default = False)
+            When True, an output of a single control token equal to the
+            previous one on the same channel is sent as REPEAT, and g is only
+            called when the state or the scenario changes (f must return
+            new states instead of modifying them). The outputs must be read
+            by kernels or controlled detectors.
         """
-        Process.__init__(self)
+        Node.__init__(self, nIter, backend, name)
+        self.initControl(ctrl, scenarios)
         self.c = c          # List of token consumption rate
         self.f = f          # Next state function
         self.g = g          # Output decoder
@@ -92,29 +341,332 @@ class Detector(Process):
         self.n = len(outs)  # Number of outputs
         self.inps = inps    # List of input channels
         self.outs = outs    # List of output channels
-        self.nIter = nIter  # Maximun number of firing cycles (0 means inf)
-        if self.m != len(self.c):
+        self.incremental = incremental  # Send REPEAT for unchanged control tokens
+        self.sent = None    # Outputs of the previous firing (incremental mode)
+        self.sentBy = None  # State and output decoder of the previous firing
+        if ctrl is None and self.m != len(self.c):
             raise Exception('List of inputs and list of tiken consumption rates with different sizes')
 
-    def run(self):
-        n = 0
-        while 1:
-            if self.nIter != 0:
-                n += 1
-            if n > self.nIter:
-                break
-            # Reads inputs based on token consumption rates
-            inputs = inputRead(self.c, self.inps)
-            # Performs state transition
-            self.state = self.f(self.state, inputs)
+    def select(self, token):
+        Controlled.select(self, token)
+        (self.c, self.f, self.g) = self.current
+
+    def step(self, maxFirings = 0):
+        tr = self.tracer
+        if tr is not None:
+            tr.begin()
+        # Reads the control input of a detector of a hierarchy
+        if self.ctrl is not None:
+            self.readControl()
+        # Reads inputs based on token consumption rates
+        inputs = inputRead(self.c, self.inps, tr)
+        # Performs state transition and output decoding
+        outputs = self.fire(inputs)
+        if tr is not None:
+            tr.fired()
+        # Write on the output channels
+        outputWrite([len(o) for o in outputs], self.outs, outputs, tr)
+        if tr is not None:
+            tr.end(str(self.state))
+        return 1
+
+    async def astep(self, maxFirings = 0):
+        tr = self.tracer
+        if tr is not None:
+            tr.begin()
+        if self.ctrl is not None:
+            await self.areadControl()
+        inputs = await ainputRead(self.c, self.inps, tr)
+        outputs = self.fire(inputs)
+        if tr is not None:
+            tr.fired()
+        await aoutputWrite([len(o) for o in outputs], self.outs, outputs, tr)
+        if tr is not None:
+            tr.end(str(self.state))
+        return 1
+
+    def iterationRate(self, nodes):
+        return 1
+
+    def inputChannels(self):
+        return list(self.inps) if self.ctrl is None else Controlled.inputChannels(self)
+
+    def snapshot(self):
+        state = Controlled.snapshot(self)
+        state['state'] = self.state
+        return state
+
+    def restore(self, state):
+        Controlled.restore(self, state)
+        self.state = state['state']
+        self.sent = None
+        self.sentBy = None
+
+    def localNeeds(self, fifos):
+        if self.ctrl is None:
+            return list(zip(self.inps, self.c))
+        return Controlled.localNeeds(self, fifos)
+
+    def localFire(self, fifos):
+        if self.ctrl is not None:
+            self.localControl(fifos)
+        outputs = self.fire(takeTokens(fifos, self.inps, self.c))
+        return ([len(o) for o in outputs], outputs)
+
+    def fire(self, inputs):
+        """
+        Performs the state transition with a list of token lists and returns
+        the outputs of the new state.
+        """
+        # Performs state transition
+        self.state = self.f(self.state, inputs)
+        if not self.incremental:
             # Output decoding
             outputs = self.g(self.state)
             if len(outputs) != self.n:
                 raise Exception('Function returns wrong output number')
-            # Write on the output channels
-            for i in range(self.n):
-                for j in range(len(outputs[i])):
-                    self.outs[i].put(outputs[i][j])
+            return outputs
+        # Incremental mode: the outputs are decoded when the state or the
+        # scenario change, and repeated control tokens are sent as REPEAT
+        prev = self.sent
+        if prev is not None and self.sentBy[1] is self.g and sameToken(self.sentBy[0], self.state):
+            outputs = prev
+        else:
+            outputs = self.g(self.state)
+            if len(outputs) != self.n:
+                raise Exception('Function returns wrong output number')
+            self.sentBy = (self.state, self.g)
+        self.sent = outputs
+        if prev is None:
+            return outputs
+        return [[REPEAT] if len(o) == 1 and len(q) == 1 and sameToken(o[0], q[0]) else o \
+            for (o, q) in zip(outputs, prev)]
+
+
+def bufferSizes(nodes, states, delays = None):
+    """
+    Computes buffer sizes for the channels of the SADF graph formed by the
+    list nodes. The token rates of each kernel are collected from the
+    scenarios its detector emits in the given states. A channel whose
+    producer writes at most P tokens and whose consumer reads at most C
+    tokens per firing gets P + C - g plus the initial tokens that are not a
+    multiple of g, where g is the gcd of all its rates, so the producer is
+    never blocked while the consumer waits for tokens. Channels connected to
+    only one node get its largest rate.
+
+    Parameters
+    ----------
+    nodes : [Kernel, Detector, Fork]
+        List of processes of the graph.
+    states : {Detector: [State]}
+        States that each detector can reach.
+    delays : {Queue: int} (default = None)
+        Number of initial tokens in the channels.
+
+    Returns
+    ----------
+    sizes : {Queue: int}
+        Buffer size of every channel of the graph.
+    """
+    delays = delays or {}
+    prod = {}
+    cons = {}
+    def addRate(rates, ch, r):
+        rates.setdefault(ch, set()).add(r)
+    kernels = [k for k in nodes if isinstance(k, Kernel)]
+    for node in nodes:
+        if isinstance(node, Detector):
+            for ch, c in zip(node.inps, node.c):
+                addRate(cons, ch, c)
+            for s in states[node]:
+                outputs = node.g(s)
+                for ch, tokens in zip(node.outs, outputs):
+                    addRate(prod, ch, len(tokens))
+                    for k in kernels:
+                        if k.ctrl is not ch:
+                            continue
+                        for (c, p, f) in k.expand(tokens):
+                            for inp, r in zip(k.inps, c):
+                                addRate(cons, inp, r)
+                            for out, r in zip(k.outs, p):
+                                addRate(prod, out, r)
+        elif isinstance(node, Kernel):
+            addRate(cons, node.ctrl, 1)
+        elif isinstance(node, Fork):
+            addRate(cons, node.inp, 1)
+            for ch in node.outs:
+                addRate(prod, ch, 1)
+    sizes = {}
+    for ch in set(prod) | set(cons):
+        p = max(prod.get(ch, {0}))
+        c = max(cons.get(ch, {0}))
+        d = delays.get(ch, 0)
+        if ch not in prod or ch not in cons:
+            sizes[ch] = max(p, c, d)
+            continue
+        g = 0
+        for r in prod[ch] | cons[ch]:
+            g = gcd(g, r)
+        g = max(g, 1)
+        sizes[ch] = max(p + c - g + d % g, d)
+    return sizes
+
+
+class Simulator(object):
+    """
+    The Simulator class executes an SADF network (Kernels, Detectors, Forks,
+    Sources and SDF Actors) in a single thread, for functional runs and
+    parameter sweeps. Channels between the nodes are replaced by in-memory
+    FIFOs and the nodes are fired data-driven, one firing per node in turn,
+    while any of them can fire. The tokens of a Source are taken only when
+    its consumers need them. Since SADF networks are deterministic, the
+    output sequences are the same as in a run with one process per node.
+    """
+    def __init__(self, nodes, delays = None):
+        """
+        Simulator initializer. Tokens already written in the internal
+        channels are consumed as initial tokens.
+
+        Parameters
+        ----------
+        nodes : [Node]
+            List of nodes of the network. They must not be started.
+        delays : {Queue: [Tokens]} (default = None)
+            Additional initial tokens of the channels.
+        """
+        delays = delays or {}
+        self.sources = [n for n in nodes if isinstance(n, Source)]
+        self.nodes = [n for n in nodes if not isinstance(n, Source)]
+        produced = set(ch for n in self.nodes for ch in n.outputChannels())
+        consumed = set(ch for n in self.nodes for ch in n.inputChannels())
+        self.internal = produced & consumed                 # Channels between nodes
+        self.fed = {ch: s for s in self.sources for ch in s.outs}   # Channels written by Sources
+        self.inps = [ch for ch in consumed if ch not in self.internal and ch not in self.fed]
+        self.outs = [ch for ch in produced if ch not in self.internal]
+        self.fifos = {ch: deque() for ch in consumed}       # Tokens available in each read channel
+        for ch in self.internal:
+            self.fifos[ch].extend(inputRead([ch.qsize()], [ch])[0])
+        for ch, tokens in delays.items():
+            self.fifos[ch].extend(tokens)
+        self.exhausted = set()                              # Sources without more tokens
+        self.firings = {n: 0 for n in self.nodes}           # Number of firings of each node
+
+    def feed(self, ch, tokens):
+        """
+        Appends the list of tokens to the input channel ch.
+        """
+        self.fifos[ch].extend(tokens)
+
+    def pull(self, ch, n):
+        """
+        Takes tokens from the Source that writes ch until it has n tokens.
+        Returns False when the Source is exhausted first.
+        """
+        source = self.fed[ch]
+        while len(self.fifos[ch]) < n:
+            if source in self.exhausted:
+                return False
+            try:
+                item = source.next()
+            except EndOfStream:
+                self.exhausted.add(source)
+                return False
+            for out in source.outs:
+                if out in self.fifos:
+                    self.fifos[out].append(item)
+        return True
+
+    def ready(self, node):
+        """
+        Returns True when node has the tokens of its next firing.
+        """
+        if node.nIter != 0 and self.firings[node] >= node.nIter:
+            return False
+        for (ch, n) in node.localNeeds(self.fifos):
+            if len(self.fifos[ch]) < n and (ch not in self.fed or not self.pull(ch, n)):
+                return False
+        return True
+
+    def run(self, maxFirings = 0):
+        """
+        Fires the nodes until none of them can fire. The tokens written in
+        the input channels before the call are read first.
+
+        Parameters
+        ----------
+        maxFirings : int (default = 0)
+            Maximum number of firings. When 0, runs until the network stops.
+
+        Returns
+        ----------
+        outputs : {Queue: [Tokens]}
+            Tokens written in each output channel during the call.
+        """
+        for ch in self.inps:
+            self.fifos[ch].extend(inputRead([ch.qsize()], [ch])[0])
+        outputs = {ch: [] for ch in self.outs}
+        total = 0
+        while maxFirings == 0 or total < maxFirings:
+            fired = 0
+            for node in self.nodes:
+                if not self.ready(node):
+                    continue
+                (p, tokens) = node.localFire(self.fifos)
+                for ch, r, t in zip(node.outputChannels(), p, tokens):
+                    if len(t) < r:
+                        raise Exception("Function returns less tokens than the production rate")
+                    if ch in self.internal:
+                        self.fifos[ch].extend(t[:r])
+                    else:
+                        outputs[ch].extend(t[:r])
+                self.firings[node] += 1
+                fired += 1
+                total += 1
+                if total == maxFirings:
+                    break
+            if not fired:
+                break
+        return outputs
+
+    def checkpoint(self, fileName):
+        """
+        Writes the state of the simulation to fileName, in the format of
+        Network.checkpoint: the tokens in the channels read by the nodes,
+        and the state and number of firings of every node. The simulation
+        can go on after the call.
+        """
+        nodes = {s.name: {'fired': s.emitted, 'state': s.snapshot()} for s in self.sources}
+        channels = {}
+        for node in self.nodes:
+            nodes[node.name] = {'fired': self.firings[node], 'state': node.snapshot()}
+            for i, ch in enumerate(node.inputChannels()):
+                if self.fifos[ch]:
+                    channels[channelKey(node, i)] = list(self.fifos[ch])
+        saveCheckpoint(fileName, nodes, channels)
+
+    def restore(self, fileName):
+        """
+        Sets the simulation to a checkpoint written by checkpoint or by
+        Network.checkpoint, replacing the tokens in the channels read by the
+        nodes. The nodes must have the names of the checkpointed ones.
+        """
+        (states, channels) = loadCheckpoint(fileName)
+        self.exhausted = set()
+        for node in self.sources + self.nodes:
+            if node.name not in states:
+                raise Exception('Node ' + node.name + ' is not in the checkpoint ' + fileName)
+            state = states[node.name]
+            if state.get('finished', False):
+                if node not in self.sources:
+                    raise Exception('Node ' + node.name + ' finished before the checkpoint')
+                self.exhausted.add(node)
+                continue
+            node.restore(state['state'])
+            if node in self.firings:
+                self.firings[node] = state['fired']
+        for node in self.nodes:
+            for i, ch in enumerate(node.inputChannels()):
+                self.fifos[ch] = deque(channels.get(channelKey(node, i), []))
 
 
 # Test of the module
@@ -142,6 +694,66 @@ if __name__ == '__main__':
             return [[([1,1], [1], func1)]]
         return [[([1,0], [1], func2)]]
 
+    # Single-process simulation of the model, fed by a Source
+    si = Queue()
+    so = Queue()
+    sfb = Queue()
+    sd = Queue()
+    sctrl = Queue()
+    sko = Queue()
+    sim = Simulator([Kernel(sctrl, [sfb, si], [sko]), Fork(sko, [sfb, so, sd]), \
+        Detector([1], next_state, out_decode, 1, [sd], [sctrl]), Source(range(1, 51), [si])], {sko: [0]})
+    print(sim.run()[so][:12])
+
+    print("SADF hierarchy test model")
+
+    # The top detector selects the scenario of the sub-network detector for
+    # 4 firings at a time, and the sub-network detector selects the scenario
+    # of the kernel. Both are incremental, so unchanged scenarios are sent as
+    # REPEAT
+    sm = Queue()
+    sc1 = Queue()
+    st = Queue()
+    sc2 = Queue()
+    si = Queue()
+    so = Queue()
+    top = Detector([1], lambda s, inps: inps[0][0], lambda s: [[('shift', 4)] if s == 0 else [('neg', 4)]], 0, \
+        [sm], [sc1], name = 'top', incremental = True)
+    sub = Detector(None, None, None, 0, [st], [sc2], name = 'sub', ctrl = sc1, incremental = True, scenarios = \
+        {'shift': ([1], lambda s, inps: s + 1, lambda s: [['add']]), 'neg': ([1], lambda s, inps: s, lambda s: [['neg']])})
+    kernel = Kernel(sc2, [si], [so], scenarios = {'add': ([1], [1], lambda a: [[a[0][0] + 100]]), \
+        'neg': ([1], [1], lambda a: [[-a[0][0]]])})
+    sim = Simulator([top, sub, kernel, Source([0, 1, 0], [sm]), Source(range(12), [st]), Source(range(12), [si])])
+    print(sim.run()[so])
+
+    print("SADF checkpoint test model")
+
+    # A network stopped at a checkpoint and resumed from it in a new network
+    # gives the outputs of an uninterrupted run
+    def ckptNetwork():
+        net = Network()
+        si, so, sfb, sd, sctrl, sko = [net.channel(8) for i in range(6)]
+        net.add(Kernel(sctrl, [sfb, si], [sko], name = 'kernel', scenarios = {1: ([1, 1], [1], func1), \
+            2: ([1, 1], [1], lambda a: [[a[0][0] - a[1][0]]])}), Fork(sko, [sfb, so, sd], name = 'fork'), \
+            Detector([1], next_state, lambda s: [[s]], 1, [sd], [sctrl], name = 'detector', incremental = True), \
+            Source(range(1, 2001), [si], name = 'source'))
+        sko.put(0)
+        return (net, so)
+    (net, so) = ckptNetwork()
+    ref = net.run(0)[so]
+    (net, so) = ckptNetwork()
+    net.start()
+    time.sleep(0.1)
+    net.checkpoint('sadf.ckpt')
+    net.shutdown()
+    (net, so) = ckptNetwork()
+    net.restore('sadf.ckpt')
+    out = net.run(0)[so]
+    os.remove('sadf.ckpt')
+    if out != ref:
+        raise Exception('Outputs after a resume differ from an uninterrupted run')
+    print(len(out), out[-4:])
+
     # Definition of the channels
     si = Queue()
     so = Queue()
@@ -155,20 +767,19 @@ if __name__ == '__main__':
     forkProc = Fork(sko, [sfb, so, sd])
     detectorProc = Detector([1], next_state, out_decode, 1, [sd], [sctrl])
 
+    net = Network()
+    net.add(kernelProc, forkProc, detectorProc)
+
     # Initial token
     sko.put(0)
 
     # Start every process in the process network
-    kernelProc.start()
-    forkProc.start()
-    detectorProc.start()
+    net.start()
 
     for i in range(50):
         si.put(i+1)
 
     SequencePlot(50, so)
 
-    # Kill all the processes
-    kernelProc.terminate()
-    forkProc.terminate()
-    detectorProc.terminate()
+    # Stop all the processes
+    net.shutdown()
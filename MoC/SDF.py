@@ -2,16 +2,22 @@
 Author: Ricardo Bonna
 Creation date: 22/may/2018
 Module description: This module provides the class Actor for creating
-SDF actors.
+SDF actors, and the class Graph for executing a network of actors with a
+static schedule in a single process.
 """
 
 from MoC_Core import *
+from collections import deque
+from fractions import Fraction
+from math import gcd
+import numpy as np
 
-class Actor(Process):
+class Actor(Node):
     """
     The Actor class is used to create SDF actors.
     """
-    def __init__(self, c, p, f, inps, outs, nIter = 0):
+    def __init__(self, c, p, f, inps, outs, nIter = 0, backend = None, name = None, replicas = 0, memo = None, \
+        vf = None, latency = 0.01):
         """
         Actor process initializer.
 
@@ -22,7 +28,8 @@ class Actor(Process):
         p : [Int]
             List of token production rate.
         f : function : [[Tokens]] -> [[Tokens]]
-            Function executed by the actor when fired.
+            Function executed by the actor when fired. It can be None when
+            vf is given.
         inps : [Queue]
             List of input channels.
         outs : [Queue]
@@ -30,8 +37,38 @@ class Actor(Process):
         nIter : Int (default = 0)
             Maximun number of times that the kernel is allow to fire.
             When nIter = 0, it can fire indefinitelly.
+        backend : str or backend (default = None)
+            Execution backend ('process', 'thread' or 'asyncio').
+        name : str (default = None)
+            Name of the node.
+        replicas : Int (default = 0)
+            When replicas > 1, the actor is fired in replicated mode: up to
+            replicas firings run at the same time in a pool of worker
+            processes, and the outputs are written in the firing order.
+            Only for actors without state (f must be a pure, picklable
+            function and the actor must not have self-loops).
+        memo : bool, Int or Memo (default = None)
+            Memoization of the firings of a pure function f: True for a new
+            Memo, an Int for a new Memo of that many bytes, or a Memo. Firings
+            whose inputs have the same content as an earlier firing return
+            the stored outputs. Not used in replicated mode.
+        vf : function : [np.ndarray] -> [np.ndarray] (default = None)
+            Vectorized version of f, which performs k firings in one call. The
+            tokens of input i are given as an array of shape (k, c[i], ...)
+            and the tokens of output j are returned as an array of shape
+            (k, p[j], ...). When vf is given, the actor runs in vectorized
+            mode: each step performs as many firings as there are tokens
+            already in the input channels, up to the latency budget. Not
+            used by the asyncio backend, which fires one at a time.
+        latency : float (default = 0.01)
+            Latency budget of vectorized mode, in seconds: batches are
+            limited to the number of firings that vf is expected to perform
+            in this time. When None, batches are only limited by the tokens
+            available.
         """
-        Process.__init__(self)
+        Node.__init__(self, nIter, backend, name)
+        self.replicas = replicas    # Number of parallel firings in replicated mode
+        self.memo = getMemo(memo)   # Cache of the firings (None when not memoized)
         self.c = c          # List of token consumption rates
         self.p = p          # List of token production rates
         self.m = len(c)     # Number of inputs
@@ -39,29 +76,431 @@ class Actor(Process):
         self.inps = inps    # List of input channels
         self.outs = outs    # List of output channels
         self.fun = f        # Function to be executed
-        self.nIter = nIter  # Maximun number of firing cycles (0 means inf)
+        self.vf = vf        # Vectorized function (None when not vectorized)
+        self.latency = latency      # Latency budget of a batch, in seconds
+        self.firingTime = None      # Mean time of one firing of vf, in seconds
         if len(self.inps) != self.m:
             raise Exception('Number of inputs wrong')
         if len(self.outs) != self.n:
             raise Exception('Number of outputs wrong')
+        if f is None and vf is None:
+            raise Exception('Actor needs a function f or vf')
+        if vf is not None and replicas > 1:
+            raise Exception('Vectorized actors can not be replicated')
 
-    def run(self):
-        n = 0
-        while 1:
-            if self.nIter != 0:
-                n += 1
-            if n > self.nIter:
-                break
-            # Reads inputs based on token consumption rates
-            inputs = inputRead(self.c, self.inps)
-            # Applies function to inputs
-            outputs = self.fun(inputs)
-            if len(outputs) != self.n:
-                raise Exception('Function returns wrong output number')
-            # Write on the output channels
-            for i in range(self.n):
-                for j in range(self.p[i]):
-                    self.outs[i].put(outputs[i][j])
+    def step(self, maxFirings = 0):
+        if self.vf is not None:
+            return self.stepBatch(maxFirings)
+        tr = self.tracer
+        if tr is not None:
+            tr.begin()
+        # Reads inputs based on token consumption rates
+        inputs = inputRead(self.c, self.inps, tr)
+        # Applies function to inputs
+        outputs = self.fire(inputs)
+        if tr is not None:
+            tr.fired()
+        # Write on the output channels
+        outputWrite(self.p, self.outs, outputs, tr)
+        if tr is not None:
+            tr.end()
+        return 1
+
+    async def astep(self, maxFirings = 0):
+        tr = self.tracer
+        if tr is not None:
+            tr.begin()
+        inputs = await ainputRead(self.c, self.inps, tr)
+        outputs = self.fire(inputs)
+        if tr is not None:
+            tr.fired()
+        await aoutputWrite(self.p, self.outs, outputs, tr)
+        if tr is not None:
+            tr.end()
+        return 1
+
+    def batchSize(self, maxFirings = 0):
+        """
+        Returns the number of firings of the next batch in vectorized mode:
+        the firings whose input tokens are already in the channels, limited
+        by the latency budget, by maxFirings (when not 0) and by the
+        capacities of the channels. The first batch has a single firing,
+        which measures the time of vf.
+        """
+        k = min([available(ch) // c for (ch, c) in zip(self.inps, self.c) if c > 0] or [1])
+        if self.latency is not None:
+            k = min(k, int(self.latency / self.firingTime) if self.firingTime else 1)
+        if maxFirings != 0:
+            k = min(k, maxFirings)
+        for (chans, rates) in ((self.inps, self.c), (self.outs, self.p)):
+            for (ch, r) in zip(chans, rates):
+                if r > 0 and getattr(ch, 'capacity', 0):
+                    k = min(k, ch.capacity // r)
+        return max(k, 1)
+
+    def stepBatch(self, maxFirings = 0):
+        """
+        Performs a batch of firings with vf. The tokens before an EOS are
+        consumed by the firings they complete, and the stream is then ended.
+        """
+        tr = self.tracer
+        if tr is not None:
+            tr.begin()
+        k = self.batchSize(maxFirings)
+        inputs = inputRead([k * c for c in self.c], self.inps, tr, False)
+        # No token follows an EOS, so an EOS can only be the last token read
+        ends = [(len(tokens) - 1) // c for (tokens, c) in zip(inputs, self.c) if tokens and tokens[-1] is EOS]
+        end = len(ends) > 0
+        if end:
+            k = min(ends)
+            inputs = [tokens[:k * c] for (tokens, c) in zip(inputs, self.c)]
+        if k > 0:
+            t0 = clock()
+            outputs = self.fireBatch(k, inputs)
+            t = (clock() - t0) / k
+            self.firingTime = t if self.firingTime is None else 0.8 * self.firingTime + 0.2 * t
+            if tr is not None:
+                tr.fired()
+            outputWrite([k * p for p in self.p], self.outs, outputs, tr)
+        if tr is not None:
+            tr.end()
+        if end:
+            raise EndOfStream
+        return k
+
+    def fireBatch(self, k, inputs):
+        """
+        Applies vf to k firings and checks the shapes of its outputs.
+
+        Parameters
+        ----------
+        k : Int
+            Number of firings.
+        inputs : [[Tokens]]
+            List of token lists, one per input channel, with the tokens of
+            the k firings in order.
+
+        Returns
+        ----------
+        outputs : [[Tokens]]
+            List of token lists, one per output channel, with the tokens of
+            the k firings in order.
+        """
+        arrays = []
+        for (tokens, c) in zip(inputs, self.c):
+            a = np.asarray(tokens) if len(tokens) else np.zeros((0,))
+            arrays.append(a.reshape((k, c) + a.shape[1:]))
+        results = self.vf(arrays)
+        if len(results) != self.n:
+            raise Exception('Function returns wrong output number')
+        outputs = []
+        for (a, p) in zip(results, self.p):
+            a = np.asarray(a)
+            if a.shape[:2] != (k, p):
+                raise Exception('Vectorized function returns wrong output shape ' + str(a.shape))
+            outputs.append(list(a.reshape((k * p,) + a.shape[2:])))
+        return outputs
+
+    def iterationRate(self, nodes):
+        actors = [a for a in nodes if isinstance(a, Actor)]
+        return repetitionVector(actors)[actors.index(self)]
+
+    def readFiring(self):
+        """
+        Reads the inputs of one firing. Returns the function to be applied,
+        the inputs and the production rates.
+        """
+        return (self.fun, inputRead(self.c, self.inps, self.tracer), self.p)
+
+    def localNeeds(self, fifos):
+        return list(zip(self.inps, self.c))
+
+    def localFire(self, fifos):
+        return (self.p, self.fire(takeTokens(fifos, self.inps, self.c)))
+
+    def fire(self, inputs):
+        """
+        Applies the actor function to a list of token lists, as read by
+        inputRead, and checks the number of outputs.
+
+        Parameters
+        ----------
+        inputs : [[Tokens]]
+            List of token lists, one per input channel.
+
+        Returns
+        ----------
+        outputs : [[Tokens]]
+            List of token lists, one per output channel.
+        """
+        if self.fun is None:
+            return self.fireBatch(1, inputs)
+        outputs = self.fun(inputs) if self.memo is None else self.memo.call(self.fun, inputs)
+        if len(outputs) != self.n:
+            raise Exception('Function returns wrong output number')
+        return outputs
+
+
+def graphChannels(actors):
+    """
+    Finds the channels of the SDF graph formed by the list actors.
+
+    Parameters
+    ----------
+    actors : [Actor]
+        List of SDF actors.
+
+    Returns
+    ----------
+    channels : {Queue: (producer, p, consumer, c)}
+        Dictionary indexed by channel. producer and consumer are indexes in
+        the list actors (None when the channel is connected to the outside of
+        the graph) and p and c are the respective token rates.
+    """
+    channels = {}
+    for k, a in enumerate(actors):
+        for ch, p in zip(a.outs, a.p):
+            (src, _, dst, c) = channels.get(ch, (None, 0, None, 0))
+            if src is not None:
+                raise Exception('Channel with more than one producer (use a Fork)')
+            channels[ch] = (k, p, dst, c)
+        for ch, c in zip(a.inps, a.c):
+            (src, p, dst, _) = channels.get(ch, (None, 0, None, 0))
+            if dst is not None:
+                raise Exception('Channel with more than one consumer (use a Fork)')
+            channels[ch] = (src, p, k, c)
+    return channels
+
+
+def repetitionVector(actors):
+    """
+    Solves the balance equations of the SDF graph formed by the list actors.
+    Channels connected to only one actor of the list are considered inputs
+    or outputs of the graph and do not constrain the solution.
+
+    Parameters
+    ----------
+    actors : [Actor]
+        List of SDF actors.
+
+    Returns
+    ----------
+    q : [int]
+        Repetition vector. q[i] is the number of firings of actors[i] in one
+        graph iteration.
+    """
+    channels = graphChannels(actors)
+    adj = [[] for a in actors]
+    for (src, p, dst, c) in channels.values():
+        if src is None or dst is None:
+            continue
+        if p == 0 or c == 0:
+            raise Exception('Inconsistent token rates: internal channel with zero rate')
+        adj[src].append((dst, Fraction(p, c)))
+        adj[dst].append((src, Fraction(c, p)))
+    rates = [None] * len(actors)
+    for k in range(len(actors)):
+        if rates[k] is not None:
+            continue
+        # Propagates the firing ratios over the connected component of k
+        rates[k] = Fraction(1)
+        component = [k]
+        stack = [k]
+        while stack:
+            i = stack.pop()
+            for (j, ratio) in adj[i]:
+                if rates[j] is None:
+                    rates[j] = rates[i] * ratio
+                    component.append(j)
+                    stack.append(j)
+                elif rates[j] != rates[i] * ratio:
+                    raise Exception('Inconsistent token rates between actors ' + str(i) + ' and ' + str(j))
+        # Scales the component to the smallest integer solution
+        den = 1
+        for i in component:
+            den = den * rates[i].denominator // gcd(den, rates[i].denominator)
+        num = 0
+        for i in component:
+            num = gcd(num, int(rates[i] * den))
+        for i in component:
+            rates[i] = int(rates[i] * den) // num
+    return rates
+
+
+def _simulate(actors, q, delays, capacities):
+    # Fires the actors while possible, up to q firings each, returning the
+    # sequence of firings, the remaining firings and the token counts
+    channels = graphChannels(actors)
+    tokens = {ch: len(delays.get(ch, [])) for ch in channels}
+    internal = [[(ch, c) for ch, c in zip(a.inps, a.c) if channels[ch][0] is not None] for a in actors]
+    bounded = [[(ch, p) for ch, p in zip(a.outs, a.p) if ch in capacities] for a in actors]
+    # Tokens consumed from self-loops are freed before the production
+    selfLoops = [{ch: c for ch, c in zip(a.inps, a.c) if ch in a.outs} for a in actors]
+    remaining = list(q)
+    schedule = []
+    fired = True
+    while fired and any(remaining):
+        fired = False
+        for k, a in enumerate(actors):
+            if remaining[k] == 0:
+                continue
+            if all(tokens[ch] >= c for (ch, c) in internal[k]) and \
+                all(tokens[ch] - selfLoops[k].get(ch, 0) + p <= capacities[ch] for (ch, p) in bounded[k]):
+                for (ch, c) in internal[k]:
+                    tokens[ch] -= c
+                for ch, p in zip(a.outs, a.p):
+                    tokens[ch] += p
+                remaining[k] -= 1
+                schedule.append(k)
+                fired = True
+    return (schedule, remaining, tokens)
+
+
+def passSchedule(actors, q = None, delays = None, capacities = None):
+    """
+    Builds a periodic admissible sequential schedule (PASS) for the SDF
+    graph formed by the list actors. Raises an exception if the graph
+    deadlocks before completing one iteration.
+
+    Parameters
+    ----------
+    actors : [Actor]
+        List of SDF actors.
+    q : [int] (default = None)
+        Repetition vector. Computed with repetitionVector when None.
+    delays : {Queue: [Tokens]} (default = None)
+        Initial tokens of the internal channels.
+    capacities : {Queue: int} (default = None)
+        Maximum number of tokens in the internal channels. Channels that are
+        not in the dictionary are unbounded.
+
+    Returns
+    ----------
+    schedule : [int]
+        Sequence of actor indexes, one entry per firing.
+    """
+    if q is None:
+        q = repetitionVector(actors)
+    (schedule, remaining, tokens) = _simulate(actors, q, delays or {}, capacities or {})
+    if any(remaining):
+        raise Exception('Deadlock: not enough initial tokens to complete one iteration')
+    return schedule
+
+
+def bufferSizes(actors, delays = None):
+    """
+    Computes deadlock-free buffer sizes for the channels of the SDF graph
+    formed by the list actors. Each internal channel starts from the smallest
+    size that lets its producer and consumer fire forever, p + c - gcd(p, c)
+    plus the initial tokens that do not fit this pattern, and channels are
+    enlarged only where one iteration of the bounded graph deadlocks. Graph
+    inputs and outputs get the rate of the actor connected to them.
+
+    Parameters
+    ----------
+    actors : [Actor]
+        List of SDF actors.
+    delays : {Queue: [Tokens]} (default = None)
+        Initial tokens of the internal channels.
+
+    Returns
+    ----------
+    sizes : {Queue: int}
+        Buffer size of every channel of the graph.
+    """
+    delays = delays or {}
+    q = repetitionVector(actors)
+    passSchedule(actors, q, delays)
+    sizes = {}
+    internal = {}
+    for ch, (src, p, dst, c) in graphChannels(actors).items():
+        if src is None or dst is None:
+            sizes[ch] = max(p, c)
+            continue
+        d = len(delays.get(ch, []))
+        g = gcd(p, c)
+        internal[ch] = max(p + c - g + d % g, d)
+    while True:
+        (schedule, remaining, tokens) = _simulate(actors, q, delays, internal)
+        if not any(remaining):
+            break
+        # Enlarges the channels that block actors with enough input tokens
+        enlarged = False
+        for k, a in enumerate(actors):
+            if remaining[k] == 0:
+                continue
+            for ch, p in zip(a.outs, a.p):
+                need = tokens[ch] - (a.c[a.inps.index(ch)] if ch in a.inps else 0) + p
+                if ch in internal and need > internal[ch]:
+                    internal[ch] = need
+                    enlarged = True
+        if not enlarged:
+            raise Exception('Deadlock: not enough initial tokens to complete one iteration')
+    sizes.update(internal)
+    return sizes
+
+
+class Graph(object):
+    """
+    The Graph class executes a network of SDF actors in a single process,
+    following a static schedule. Channels between actors of the graph are
+    replaced by in-memory FIFOs. Channels connected to only one actor of the
+    graph are kept as the graph inputs and outputs.
+    """
+    def __init__(self, actors, delays = None):
+        """
+        Graph initializer. Computes the repetition vector and the schedule,
+        raising an exception for inconsistent token rates or deadlock.
+
+        Parameters
+        ----------
+        actors : [Actor]
+            List of SDF actors. They must not be started.
+        delays : {Queue: [Tokens]} (default = None)
+            Initial tokens of the internal channels.
+        """
+        delays = delays or {}
+        self.actors = actors
+        self.q = repetitionVector(actors)
+        self.schedule = passSchedule(actors, self.q, delays)
+        channels = graphChannels(actors)
+        # Internal channels become FIFOs, external ones keep their Queue
+        self.fifos = {}
+        for ch, (src, p, dst, c) in channels.items():
+            if src is not None and dst is not None:
+                self.fifos[ch] = deque(delays.get(ch, []))
+        self.firing = []
+        for a in actors:
+            inps = [(self.fifos.get(ch), ch, c) for ch, c in zip(a.inps, a.c)]
+            outs = [(self.fifos.get(ch), ch, p) for ch, p in zip(a.outs, a.p)]
+            self.firing.append((a, inps, outs))
+
+    def run(self, nIter = 1):
+        """
+        Executes nIter iterations of the schedule.
+
+        Parameters
+        ----------
+        nIter : int (default = 1)
+            Number of graph iterations.
+        """
+        firing = [self.firing[k] for k in self.schedule]
+        for n in range(nIter):
+            for (a, inps, outs) in firing:
+                inputs = []
+                for (fifo, ch, c) in inps:
+                    if fifo is None:
+                        inputs.append(inputRead([c], [ch])[0])
+                    else:
+                        inputs.append([fifo.popleft() for j in range(c)])
+                outputs = a.fire(inputs)
+                for i, (fifo, ch, p) in enumerate(outs):
+                    if fifo is None:
+                        outputWrite([p], [ch], [outputs[i]])
+                    elif len(outputs[i]) < p:
+                        raise Exception("Function returns less tokens than the production rate")
+                    else:
+                        fifo.extend(outputs[i][:p])
 
 
 # Test of the module
@@ -86,3 +525,94 @@ if __name__ == '__main__':
     print(q2.get())
     print(q2.get())
     proc.terminate()
+
+    print("SDF static schedule test model")
+
+    # Channels
+    q1 = Queue()
+    q2 = Queue()
+    q3 = Queue()
+    q4 = Queue()
+
+    def func_dup(a):
+        return [[a[0][0], a[0][0]]]
+
+    # Graph definition: q1 -> proc -> q2 -> dup -> q3 -> proc2 -> q4
+    proc = Actor([3], [2], func_test, [q1], [q2])
+    dup = Actor([1], [2], func_dup, [q2], [q3])
+    proc2 = Actor([4], [1], lambda a: [[sum(a[0])]], [q3], [q4])
+    graph = Graph([proc, dup, proc2])
+    print(graph.q, graph.schedule)
+    sizes = bufferSizes([proc, dup, proc2])
+    print([sizes[ch] for ch in (q1, q2, q3, q4)])
+
+    for i in range(6):
+        q1.put(i+1)
+    graph.run(2)
+    print(q4.get())
+    print(q4.get())
+
+    # Short writes to the internal FIFOs are rejected like outputWrite does
+    for f in (lambda a: [[]], lambda a: []):
+        q1 = Queue()
+        q2 = Queue()
+        q3 = Queue()
+        graph = Graph([Actor([1], [1], f, [q1], [q2]), Actor([1], [1], lambda a: a, [q2], [q3])])
+        q1.put(0)
+        try:
+            graph.run(1)
+        except Exception as e:
+            print(e)
+
+    print("SDF memoization test model")
+
+    q1 = Queue()
+    q2 = Queue()
+
+    # Blocks of a stream with repeated content: the idct-like function is
+    # only applied to the first two
+    import numpy as np
+    basis = np.cos(np.pi * np.outer(np.arange(8) + 0.5, np.arange(8)) / 8)
+    proc = Actor([1], [1], lambda a: [[basis @ a[0][0] @ basis.T]], [q1], [q2], 6, memo = True)
+    proc.start()
+    blocks = [np.eye(8), np.ones((8, 8))]
+    for i in range(6):
+        q1.put(blocks[i % 2])
+    print([round(float(q2.get()[0, 0]), 3) for i in range(6)])
+    proc.join()
+    print(proc.memo.stats())
+
+    print("SDF vectorized actor test model")
+
+    q1 = Channel()
+    q2 = Channel()
+
+    # Sum and maximum of blocks of 4 samples: vf performs a batch of firings
+    # in one call
+    proc = Actor([4], [2], None, [q1], [q2], 5, vf = lambda a: [np.stack([a[0].sum(1), a[0].max(1)], 1)])
+    proc.start()
+    q1.putMany(list(range(20)))
+    print([int(q2.get()) for i in range(10)])
+    proc.join()
+
+    print("SDF pool backend test model")
+
+    # A function defined in __main__ after the workers are started can not be
+    # received by them: the error is raised by start, and the pool can still
+    # run the nodes of other functions
+    pool = getBackend('pool')
+    pool.warmUp(2)
+    def func_late(a):
+        return [[a[0][0], -a[0][0]]]
+    for f in [func_late, func_dup]:
+        net = Network(pool)
+        q1 = net.channel()
+        q2 = net.channel()
+        net.add(Actor([1], [2], f, [q1], [q2], 2))
+        q1.putMany([1, 2])
+        try:
+            print(net.run(0)[q2])
+        except Exception as e:
+            print(e)
+            net.shutdown()
+    print(len(pool.workers), len(pool.idle))
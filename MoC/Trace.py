@@ -0,0 +1,273 @@
+"""
+Author: Ricardo Bonna
+Creation date: 18/oct/2026
+Module description: This module provides the instrumentation of the firings
+of the nodes of a model. A Tracer records, for every firing of its node, the
+time spent blocked on each input and output port, the time spent in the node
+function, the number of tokens moved and the scenario selected. The records
+are sent to the parent process when the node stops, and can be exported as a
+Chrome trace (chrome://tracing or https://ui.perfetto.dev) or summarized in a
+table.
+"""
+
+import os
+import json
+import threading
+import time
+
+clock = time.perf_counter   # Clock of the records, shared by the processes of a host
+
+
+class Tracer(object):
+    """
+    The Tracer class records the firings of a node. The firing loop calls
+    begin before reading the inputs, fired after applying the node function
+    and end after writing the outputs. The functions inputRead and
+    outputWrite report the time spent on each channel with read and write.
+    """
+    def __init__(self, name, results, inLabels = None, outLabels = None):
+        """
+        Tracer initializer.
+
+        Parameters
+        ----------
+        name : str
+            Name of the traced node.
+        results : Queue
+            Queue where the records are sent when the node stops.
+        inLabels : [str] (default = None)
+            Names of the input ports, in the order of inputChannels.
+        outLabels : [str] (default = None)
+            Names of the output ports, in the order of outputChannels.
+        """
+        self.name = name
+        self.results = results
+        self.inLabels = inLabels
+        self.outLabels = outLabels
+        self.records = []       # One tuple per firing
+        self.inPorts = {}       # Index of each input channel, by id
+        self.outPorts = {}      # Index of each output channel, by id
+        self.start = 0.0        # Scratch values of the current firing
+        self.readEnd = 0.0
+        self.computeEnd = 0.0
+        self.inWaits = []
+        self.outWaits = []
+        self.tokensIn = 0
+        self.tokensOut = 0
+
+    def attach(self, node):
+        """
+        Maps the channels of node to its ports. It is called by the worker
+        running the node, since channels are copied to child processes.
+        """
+        inps = node.inputChannels()
+        outs = node.outputChannels()
+        self.inPorts = {id(ch): i for i, ch in enumerate(inps)}
+        self.outPorts = {id(ch): i for i, ch in enumerate(outs)}
+        self.inLabels = self.inLabels or ['in' + str(i) for i in range(len(inps))]
+        self.outLabels = self.outLabels or ['out' + str(i) for i in range(len(outs))]
+        self.begin()
+
+    def begin(self):
+        """
+        Starts a firing.
+        """
+        self.start = self.readEnd = clock()
+        self.inWaits = [0.0] * len(self.inLabels)
+        self.outWaits = [0.0] * len(self.outLabels)
+        self.tokensIn = 0
+        self.tokensOut = 0
+
+    def read(self, ch, n, t0, t1):
+        """
+        Records that n tokens were read from channel ch between t0 and t1.
+        """
+        self.inWaits[self.inPorts[id(ch)]] += t1 - t0
+        self.tokensIn += n
+        self.readEnd = t1
+
+    def computing(self):
+        """
+        Marks the start of the node function, when it does not follow the
+        last read (e.g. in a Cluster).
+        """
+        self.readEnd = clock()
+
+    def fired(self):
+        """
+        Marks the end of the node function.
+        """
+        self.computeEnd = clock()
+
+    def write(self, ch, n, t0, t1, tokens = None):
+        """
+        Records that n tokens were written to channel ch between t0 and t1.
+        The tokens written are given to the tracers that need them (see the
+        Metrics module).
+        """
+        self.outWaits[self.outPorts[id(ch)]] += t1 - t0
+        self.tokensOut += n
+
+    def end(self, scenario = None, label = None):
+        """
+        Ends the firing and starts the next one.
+
+        Parameters
+        ----------
+        scenario : str (default = None)
+            Scenario selected by the firing.
+        label : str (default = None)
+            Name of the fired function, when it is not the node itself (e.g.
+            the members of a Cluster).
+        """
+        now = clock()
+        computeEnd = self.computeEnd if self.computeEnd >= self.readEnd else now
+        self.records.append((label, self.start, self.readEnd, computeEnd, now, tuple(self.inWaits), \
+            tuple(self.outWaits), self.tokensIn, self.tokensOut, scenario))
+        self.begin()
+
+    def flush(self):
+        """
+        Sends the records to the parent process.
+        """
+        self.results.put({'name': self.name, 'pid': os.getpid(), 'tid': threading.get_ident(), \
+            'inLabels': self.inLabels, 'outLabels': self.outLabels, 'records': self.records})
+        self.records = []
+
+
+class TraceCollector(object):
+    """
+    Thread that receives the records sent by the tracers of a network while
+    it runs, so that child processes never block on a full pipe.
+    """
+    def __init__(self, results):
+        self.results = results  # Queue shared with the tracers
+        self.traces = []        # Received traces, one per node
+        self.thread = threading.Thread(target = self.collect, daemon = True)
+        self.thread.start()
+
+    def collect(self):
+        while 1:
+            trace = self.results.get()
+            if trace is None:
+                break
+            self.traces.append(trace)
+
+    def stop(self, timeout = None):
+        """
+        Waits for the traces sent so far and returns them.
+        """
+        self.results.put(None)
+        self.thread.join(timeout)
+        return self.traces
+
+
+def chromeTrace(traces):
+    """
+    Converts traces to the Chrome trace event format. Each firing gives a
+    read, a fire and a write event in the track of its node.
+
+    Parameters
+    ----------
+    traces : [dict]
+        Traces returned by Network.shutdown.
+
+    Returns
+    ----------
+    trace : dict
+        Trace object, ready to be written with json.dump.
+    """
+    starts = [r[1] for t in traces for r in t['records']]
+    origin = min(starts) if starts else 0.0
+    def us(t):
+        return round((t - origin) * 1e6, 3)
+    events = []
+    for tid, t in enumerate(traces):
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': t['pid'], 'tid': tid, 'args': {'name': 'pid ' + str(t['pid'])}})
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': t['pid'], 'tid': tid, 'args': {'name': t['name']}})
+        for (label, start, readEnd, computeEnd, end, inWaits, outWaits, nIn, nOut, scenario) in t['records']:
+            name = label or t['name']
+            if scenario is not None:
+                name += ' [' + str(scenario) + ']'
+            if readEnd > start:
+                waits = {l: round(w * 1e6, 3) for l, w in zip(t['inLabels'], inWaits) if w}
+                events.append({'name': 'read', 'cat': 'read', 'ph': 'X', 'pid': t['pid'], 'tid': tid, \
+                    'ts': us(start), 'dur': us(readEnd) - us(start), 'args': {'tokens': nIn, 'wait_us': waits}})
+            events.append({'name': name, 'cat': 'fire', 'ph': 'X', 'pid': t['pid'], 'tid': tid, \
+                'ts': us(readEnd), 'dur': us(computeEnd) - us(readEnd)})
+            if end > computeEnd:
+                waits = {l: round(w * 1e6, 3) for l, w in zip(t['outLabels'], outWaits) if w}
+                events.append({'name': 'write', 'cat': 'write', 'ph': 'X', 'pid': t['pid'], 'tid': tid, \
+                    'ts': us(computeEnd), 'dur': us(end) - us(computeEnd), 'args': {'tokens': nOut, 'wait_us': waits}})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def saveTrace(traces, fileName):
+    """
+    Writes traces to fileName in the Chrome trace event format.
+    """
+    with open(fileName, 'w') as f:
+        json.dump(chromeTrace(traces), f)
+
+
+def traceSummary(traces):
+    """
+    Summarizes traces in a table with one line per traced function: number of
+    firings, time spent in the function, time blocked reading and writing,
+    share of the traced time spent in the function (busy) and tokens moved.
+    The function with the largest busy share is the likely bottleneck, and
+    the ports where the others block most show who they wait for.
+
+    Parameters
+    ----------
+    traces : [dict]
+        Traces returned by Network.shutdown.
+
+    Returns
+    ----------
+    summary : str
+        Text table.
+    """
+    rows = []
+    for t in traces:
+        labels = []
+        for r in t['records']:
+            if r[0] not in labels:
+                labels.append(r[0])
+        for label in labels:
+            records = [r for r in t['records'] if r[0] == label]
+            compute = sum(r[3] - r[2] for r in records)
+            readWait = sum(r[2] - r[1] for r in records)
+            writeWait = sum(r[4] - r[3] for r in records)
+            total = compute + readWait + writeWait
+            inWaits = [sum(r[5][i] for r in records) for i in range(len(t['inLabels']))]
+            outWaits = [sum(r[6][i] for r in records) for i in range(len(t['outLabels']))]
+            scenarios = {}
+            for r in records:
+                if r[9] is not None:
+                    scenarios[r[9]] = scenarios.get(r[9], 0) + 1
+            ports = sorted(list(zip(inWaits, t['inLabels'])) + list(zip(outWaits, t['outLabels'])), reverse = True)
+            rows.append((label or t['name'], len(records), compute, readWait, writeWait, \
+                compute / total if total else 0.0, sum(r[7] for r in records), sum(r[8] for r in records), \
+                ports[0] if ports and ports[0][0] > 0 else None, scenarios))
+    header = 'node'.ljust(20) + 'firings'.rjust(9) + 'fire (ms)'.rjust(11) + 'mean (us)'.rjust(11) + \
+        'read (ms)'.rjust(11) + 'write (ms)'.rjust(11) + 'busy'.rjust(7) + 'in'.rjust(9) + 'out'.rjust(9) + \
+        '  most blocked on'
+    lines = [header]
+    for (name, n, compute, readWait, writeWait, busy, nIn, nOut, port, scenarios) in rows:
+        line = name[:19].ljust(20) + str(n).rjust(9) + ('%.2f' % (compute * 1e3)).rjust(11) + \
+            ('%.1f' % (compute * 1e6 / n if n else 0.0)).rjust(11) + ('%.2f' % (readWait * 1e3)).rjust(11) + \
+            ('%.2f' % (writeWait * 1e3)).rjust(11) + ('%.0f%%' % (busy * 100)).rjust(7) + str(nIn).rjust(9) + \
+            str(nOut).rjust(9)
+        if port is not None:
+            line += '  ' + port[1] + ' (%.2f ms)' % (port[0] * 1e3)
+        lines.append(line)
+        if scenarios:
+            common = sorted(scenarios.items(), key = lambda item: -item[1])
+            text = ', '.join(str(s) + ' x' + str(k) for s, k in common[:5])
+            if len(common) > 5:
+                text += ', ' + str(len(common) - 5) + ' more'
+            lines.append(' ' * 20 + 'scenarios: ' + text)
+    if rows:
+        lines.append('Busiest: ' + max(rows, key = lambda r: r[5])[0])
+    return '\n'.join(lines)
@@ -0,0 +1,57 @@
+"""
+Author: Ricardo Bonna
+Creation date: 18/oct/2026
+Module description: Benchmark of the token transfer between two SDF actors
+running in separate processes, comparing per token Queue transfers with the
+batched Channel protocol over a range of token rates.
+
+Usage: python channel_batching.py [nTokens] [rate1 rate2 ...]
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'MoC'))
+
+from SDF import *
+import time
+
+
+def identity(inputs):
+    return inputs
+
+
+def measure(makeChannel, rate, nTokens):
+    """
+    Measures the time taken to move nTokens through a producer and a
+    consumer actor with rate tokens per firing.
+    """
+    src = makeChannel()
+    mid = makeChannel()
+    dst = makeChannel()
+    nFirings = nTokens // rate
+    prod = Actor([rate], [rate], identity, [src], [mid], nFirings)
+    cons = Actor([rate], [rate], identity, [mid], [dst], nFirings)
+    for i in range(nFirings):
+        outputWrite([rate], [src], [list(range(rate))])
+    prod.start()
+    cons.start()
+    start = time.perf_counter()
+    inputRead([nFirings * rate], [dst])
+    elapsed = time.perf_counter() - start
+    prod.join()
+    cons.join()
+    return elapsed
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    nTokens = int(args[0]) if len(args) > 0 else 20000
+    rates = [int(a) for a in args[1:]] or [1, 4, 16, 64, 256]
+
+    print('rate'.rjust(6) + 'Queue (tok/s)'.rjust(16) + 'Channel (tok/s)'.rjust(18) + 'speedup'.rjust(10))
+    for rate in rates:
+        n = (nTokens // rate) * rate
+        tQueue = measure(Queue, rate, n)
+        tChannel = measure(Channel, rate, n)
+        print(str(rate).rjust(6) + str(round(n / tQueue)).rjust(16) + str(round(n / tChannel)).rjust(18) + \
+            str(round(tQueue / tChannel, 2)).rjust(10))
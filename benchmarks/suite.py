@@ -0,0 +1,383 @@
+"""
+Author: Ricardo Bonna
+Creation date: 18/oct/2026
+Module description: Benchmark suite of the SDF, SADF and MPEG4 models. It
+sweeps frame size, block size, token rate and execution backend, runs each
+configuration in a fresh interpreter after some warm-up runs, and reports the
+median and percentiles of the import time of the MoC modules, of the
+start-up time (spawning the nodes and waiting for the first output) and of
+the steady-state throughput (outputs after the first one), plus the peak
+resident memory. Results are written as JSON (and
+optionally CSV) and can be compared with the results of another version.
+
+Usage examples:
+    python suite.py --models sdf sadf --rates 1 16 --backends process thread
+    python suite.py --models mpeg4 --fs 16 32 64 --bs 8 --frames 100 --out new.json
+    python suite.py --models mpeg4 --fs 32 --compare old.json
+    python suite.py --models sdf --stages 8 --backends process pool --start-method spawn
+    python suite.py --models mpeg4 --fs 32 --external forsyde="forsyde-sadf-exe {fs} {fs} {bs} {ft} {mb}"
+"""
+
+import os
+import sys
+import json
+import csv
+import time
+import argparse
+import platform
+import resource
+import subprocess
+import tempfile
+import multiprocessing
+
+here = os.path.dirname(os.path.abspath(__file__))
+moc = os.path.join(here, '..', 'MoC')
+mpeg4 = os.path.join(here, '..', 'examples', 'MPEG4')
+
+
+################### Statistics ####################
+
+def percentile(values, q):
+    """
+    Returns the q-th percentile (0 <= q <= 100) of values, interpolating
+    linearly between the closest ranks.
+    """
+    values = sorted(values)
+    if not values:
+        return None
+    k = (len(values) - 1) * q / 100
+    i = int(k)
+    if i + 1 >= len(values):
+        return values[-1]
+    return values[i] + (values[i + 1] - values[i]) * (k - i)
+
+
+def summarize(runs, keys, percentiles):
+    """
+    Returns the median and the given percentiles of each key of the runs.
+    """
+    stats = {}
+    for key in keys:
+        values = [r[key] for r in runs if r.get(key) is not None]
+        if not values:
+            continue
+        stats[key + '_median'] = percentile(values, 50)
+        for q in percentiles:
+            stats[key + '_p' + str(q)] = percentile(values, q)
+    return stats
+
+
+################### Models ####################
+# Each model builds a network, fills its inputs and returns the network, the
+# output channel and the number of outputs to be read. They run in the worker
+# process only.
+
+def identity(inputs):
+    return inputs
+
+
+def negate(inputs):
+    return [[-x for x in inputs[0]]]
+
+
+def sdfModel(params, backend):
+    """
+    Chain of params['stages'] SDF actors that move params['rate'] tokens per
+    firing.
+    """
+    from SDF import Network, Actor, outputWrite
+    rate = params['rate']
+    nTokens = (params['tokens'] // rate) * rate
+    net = Network(backend)
+    chans = [net.channel() for i in range(params['stages'] + 1)]
+    for i in range(params['stages']):
+        net.add(Actor([rate], [rate], identity, [chans[i]], [chans[i + 1]], name = 'A' + str(i)))
+    for i in range(nTokens // rate):
+        outputWrite([rate], [chans[0]], [list(range(rate))])
+    return (net, chans[-1], nTokens)
+
+
+def sadfScenario(state):
+    rate = sadfScenario.rate
+    if state == 0:
+        return [[([rate], [rate], identity)]]
+    return [[([rate], [rate], negate)]]
+
+
+def sadfNextState(state, inps):
+    return inps[0][0]
+
+
+def sadfModel(params, backend):
+    """
+    Kernel controlled by a detector that alternates between two scenarios,
+    each moving params['rate'] tokens per firing.
+    """
+    from SADF import Network, Kernel, Detector, outputWrite
+    rate = params['rate']
+    sadfScenario.rate = rate
+    nFirings = params['tokens'] // rate
+    net = Network(backend)
+    si = net.channel()
+    ctrl = net.channel()
+    sel = net.channel()
+    so = net.channel()
+    net.add(Kernel(ctrl, [si], [so], name = 'K'), Detector([1], sadfNextState, sadfScenario, 0, [sel], [ctrl], name = 'D'))
+    for i in range(nFirings):
+        sel.put(i % 2)
+        outputWrite([rate], [si], [list(range(rate))])
+    return (net, so, nFirings * rate)
+
+
+def mpeg4Model(params, backend):
+    """
+    MPEG4 decoder of the examples, decoding params['frames'] random frames of
+    params['fs'] x params['fs'] pixels in blocks of params['bs'] pixels.
+    """
+    sys.path.insert(0, mpeg4)
+    import MPEG4 as m
+    from input_gen import genFtStream, genInpArrays
+    fs = (params['fs'], params['fs'])
+    bs = params['bs']
+    # Pool workers can only use the channels of the pool, so the model
+    # creates its channels with the pool backend
+    model = m.MPEG4Model(fs, bs, backend = 'pool' if backend == 'pool' else None)
+    ft = genFtStream(params['frames'], model.nb)
+    frames = genInpArrays(ft, fs, bs)
+    # The input channels are bounded, so the inputs are written by sources
+    net = m.Network(backend)
+    net.add(*(model.nodes + model.sources(ft, frames)))
+    return (net, model.s_out1, len(ft))
+
+
+models = {'sdf': sdfModel, 'sadf': sadfModel, 'mpeg4': mpeg4Model}
+
+
+################### Worker ####################
+
+def worker(config):
+    """
+    Runs one configuration in the current process and returns its timings.
+    The network is started after its inputs are written, so start-up covers
+    spawning the nodes and the latency of the first output, and the steady
+    state covers the outputs after the first one. The workers of the pool
+    backend are started while the model is built, so they count as setup.
+    """
+    sys.path.insert(0, moc)
+    if config.get('startMethod'):
+        multiprocessing.set_start_method(config['startMethod'])
+    t0 = time.perf_counter()
+    import SDF, SADF
+    imports = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    (net, out, nOut) = models[config['model']](config['params'], config['backend'])
+    if config['backend'] == 'pool':
+        net.backend.warmUp(len(net.nodes))
+    setup = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    net.start()
+    t1 = time.perf_counter()
+    out.get()
+    t2 = time.perf_counter()
+    for i in range(nOut - 1):
+        out.get()
+    t3 = time.perf_counter()
+    net.shutdown()
+    steady = t3 - t2
+    return {'import': imports, 'setup': setup, 'spawn': t1 - t0, 'startup': t2 - t0, 'steady': steady,
+        'throughput': (nOut - 1) / steady if steady > 0 else None, 'outputs': nOut,
+        'rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'child_rss_kb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss}
+
+
+def runWorker(config, timeout):
+    """
+    Runs config in a fresh interpreter and returns its timings.
+    """
+    cmd = [sys.executable, os.path.abspath(__file__), '--worker', json.dumps(config)]
+    with tempfile.TemporaryDirectory() as cwd:
+        result = subprocess.run(cmd, cwd = cwd, capture_output = True, text = True, timeout = timeout)
+    if result.returncode != 0:
+        raise Exception('Run failed: ' + json.dumps(config) + '\n' + result.stderr)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def runExternal(name, template, params):
+    """
+    Times an external implementation of the MPEG4 decoder, start-up
+    included. The template can use {fs}, {bs}, {frames}, {ft} and {mb}, the
+    input files written by input_gen.saveInpsToFile.
+    """
+    sys.path.insert(0, mpeg4)
+    from input_gen import genFtStream, iterInpStream, saveInpsToFile
+    fs = (params['fs'], params['fs'])
+    with tempfile.TemporaryDirectory() as cwd:
+        ft = genFtStream(params['frames'], int(fs[0] * fs[1] / params['bs'] ** 2))
+        ftFile = os.path.join(cwd, 'ft.inp')
+        mbFile = os.path.join(cwd, 'mbInputs.inp')
+        saveInpsToFile(ft, iterInpStream(ft, fs, params['bs']), ftFile, mbFile)
+        cmd = template.format(fs = params['fs'], bs = params['bs'], frames = params['frames'], ft = ftFile, mb = mbFile)
+        with open(os.path.join(cwd, 'stderr'), 'w+') as err:
+            t0 = time.perf_counter()
+            proc = subprocess.Popen(cmd, shell = True, cwd = cwd, stdout = subprocess.DEVNULL, stderr = err)
+            (pid, status, usage) = os.wait4(proc.pid, 0)
+            elapsed = time.perf_counter() - t0
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            if proc.returncode != 0:
+                err.seek(0)
+                raise Exception('External run ' + name + ' failed: ' + err.read())
+    return {'steady': elapsed, 'throughput': params['frames'] / elapsed, 'outputs': params['frames'],
+        'child_rss_kb': usage.ru_maxrss}
+
+
+################### Suite ####################
+
+def configurations(args):
+    """
+    Lists the configurations of the sweep given by the command line.
+    """
+    configs = []
+    for model in args.models:
+        if model == 'mpeg4':
+            grid = [{'fs': fs, 'bs': bs, 'frames': args.frames} for fs in args.fs for bs in args.bs if fs % bs == 0]
+        else:
+            grid = [{'rate': r, 'tokens': args.tokens, 'stages': args.stages} for r in args.rates]
+            if model == 'sadf':
+                for params in grid:
+                    del params['stages']
+        for params in grid:
+            for backend in args.backends:
+                config = {'model': model, 'backend': backend, 'params': params}
+                if args.start_method:
+                    config['startMethod'] = args.start_method
+                configs.append(config)
+            for (name, template) in args.external:
+                if model == 'mpeg4':
+                    configs.append({'model': model, 'backend': 'external:' + name, 'params': params, 'command': template})
+    return configs
+
+
+def key(result):
+    return (result['model'], result['backend'], result.get('startMethod'), json.dumps(result['params'], sort_keys = True))
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints the change of the median throughput and start-up time of each
+    configuration present in baseline. Returns the number of regressions,
+    i.e. throughput losses or start-up time increases larger than threshold
+    percent.
+    """
+    old = {key(r): r for r in baseline['results']}
+    regressions = 0
+    print('\nComparison with ' + baseline['meta'].get('revision', '?'))
+    for r in results:
+        b = old.get(key(r))
+        if b is None or not b.get('throughput_median') or not r.get('throughput_median'):
+            continue
+        change = 100 * (r['throughput_median'] / b['throughput_median'] - 1)
+        flag = ''
+        if change < -threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        line = (r['model'] + ' ' + r['backend'] + ' ' + paramText(r['params'])).ljust(50) + \
+            ('throughput %+.1f%%' % change).rjust(20)
+        if b.get('startup_median') and r.get('startup_median'):
+            startup = 100 * (r['startup_median'] / b['startup_median'] - 1)
+            line += ('startup %+.1f%%' % startup).rjust(18)
+            if startup > threshold and not flag:
+                flag = '  REGRESSION'
+                regressions += 1
+        print(line + flag)
+    return regressions
+
+
+def paramText(params):
+    return ' '.join(k + '=' + str(v) for k, v in sorted(params.items()))
+
+
+def revision():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd = here, capture_output = True, \
+            text = True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Benchmark suite of the SDF, SADF and MPEG4 models')
+    parser.add_argument('--models', nargs = '+', default = ['sdf', 'sadf', 'mpeg4'], choices = sorted(models))
+    parser.add_argument('--backends', nargs = '+', default = ['process'], choices = ['process', 'thread', 'asyncio', 'pool'])
+    parser.add_argument('--start-method', choices = ['fork', 'forkserver', 'spawn'], help = 'multiprocessing start method')
+    parser.add_argument('--fs', nargs = '+', type = int, default = [16, 32, 64], help = 'MPEG4 frame sizes')
+    parser.add_argument('--bs', nargs = '+', type = int, default = [8], help = 'MPEG4 block sizes')
+    parser.add_argument('--frames', type = int, default = 100, help = 'MPEG4 frames per run')
+    parser.add_argument('--rates', nargs = '+', type = int, default = [1, 16], help = 'SDF and SADF token rates')
+    parser.add_argument('--tokens', type = int, default = 20000, help = 'SDF and SADF tokens per run')
+    parser.add_argument('--stages', type = int, default = 3, help = 'SDF actors in the chain')
+    parser.add_argument('--warmup', type = int, default = 1, help = 'discarded runs per configuration')
+    parser.add_argument('--repeat', type = int, default = 5, help = 'measured runs per configuration')
+    parser.add_argument('--percentiles', nargs = '+', type = int, default = [10, 90])
+    parser.add_argument('--timeout', type = float, default = 600, help = 'seconds per run')
+    parser.add_argument('--external', nargs = '+', default = [], metavar = 'NAME=COMMAND',
+        help = 'external MPEG4 decoders, timed as a whole')
+    parser.add_argument('--out', default = 'results.json', help = 'JSON results file')
+    parser.add_argument('--csv', help = 'CSV results file')
+    parser.add_argument('--compare', help = 'JSON results of a previous version')
+    parser.add_argument('--threshold', type = float, default = 5.0, help = 'regression threshold in percent')
+    parser.add_argument('--worker', help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker(json.loads(args.worker))))
+        return 0
+    args.external = [tuple(e.split('=', 1)) for e in args.external]
+
+    results = []
+    keys = ['import', 'setup', 'spawn', 'startup', 'steady', 'throughput']
+    for config in configurations(args):
+        print('Running ' + config['model'] + ' ' + config['backend'] + ' ' + paramText(config['params']) + '...', \
+            flush = True)
+        runs = []
+        for i in range(args.warmup + args.repeat):
+            if 'command' in config:
+                run = runExternal(config['backend'], config['command'], config['params'])
+            else:
+                run = runWorker(config, args.timeout)
+            if i >= args.warmup:
+                runs.append(run)
+        result = {'model': config['model'], 'backend': config['backend'], 'params': config['params'], 'runs': runs}
+        if config.get('startMethod'):
+            result['startMethod'] = config['startMethod']
+        result.update(summarize(runs, keys, args.percentiles))
+        result['rss_kb_max'] = max(r.get('rss_kb', 0) for r in runs)
+        result['child_rss_kb_max'] = max(r.get('child_rss_kb', 0) for r in runs)
+        results.append(result)
+        print('    throughput %.1f/s (p%d %.1f, p%d %.1f), import %.1f ms, startup %.1f ms, peak RSS %d kB' % \
+            (result['throughput_median'], args.percentiles[0], result['throughput_p' + str(args.percentiles[0])], \
+            args.percentiles[-1], result['throughput_p' + str(args.percentiles[-1])], \
+            1e3 * result.get('import_median', 0), 1e3 * result.get('startup_median', 0), \
+            max(result['rss_kb_max'], result['child_rss_kb_max'])))
+
+    meta = {'revision': revision(), 'python': platform.python_version(), 'platform': platform.platform(), \
+        'cpus': os.cpu_count(), 'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'warmup': args.warmup, \
+        'repeat': args.repeat, 'command': sys.argv}
+    with open(args.out, 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent = 1)
+    if args.csv:
+        columns = ['model', 'backend', 'params'] + sorted(set(k for r in results for k in r if k not in \
+            ('model', 'backend', 'params', 'runs')))
+        with open(args.csv, 'w', newline = '') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for r in results:
+                writer.writerow([paramText(r['params']) if c == 'params' else r.get(c) for c in columns])
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(results, json.load(f), args.threshold):
+                return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
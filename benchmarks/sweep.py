@@ -0,0 +1,205 @@
+"""
+Author: Ricardo Bonna
+Creation date: 18/oct/2026
+Module description: Parallel parameter sweep of the MPEG4 model. Every
+configuration runs in its own process, pinned to its own set of cores (the
+nodes of a network inherit the set), and up to --jobs configurations run at
+once. The results are collected into one table, printed and optionally
+written as CSV or JSON. The function sweep can run any function of a
+configuration dictionary in the same way.
+
+Usage examples:
+    python sweep.py --fs 16 32 64 --bs 4 8 --frames 100 --jobs 4
+    python sweep.py --fs 32 64 --engines network simulate --tokens blocks frames --csv sweep.csv
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import hashlib
+import argparse
+import itertools
+import multiprocessing
+from queue import Empty
+
+here = os.path.dirname(os.path.abspath(__file__))
+moc = os.path.join(here, '..', 'MoC')
+mpeg4 = os.path.join(here, '..', 'examples', 'MPEG4')
+
+
+################### Sweep ####################
+
+def coreSets(jobs, cores = None):
+    """
+    Splits the cores available to the process (or the list cores) into jobs
+    disjoint sets. When there are fewer cores than jobs, sets are shared.
+    """
+    cores = sorted(cores if cores is not None else os.sched_getaffinity(0))
+    if jobs <= len(cores):
+        size = len(cores) // jobs
+        return [cores[i*size:(i+1)*size] for i in range(jobs)]
+    return [[cores[i % len(cores)]] for i in range(jobs)]
+
+
+def _runPinned(run, config, cores, index, results):
+    if cores is not None:
+        os.sched_setaffinity(0, cores)
+    try:
+        results.put((index, run(config), None))
+    except Exception as e:
+        results.put((index, None, type(e).__name__ + ': ' + str(e)))
+
+
+def sweep(run, configs, jobs = None, pin = True, timeout = None, verbose = True):
+    """
+    Runs run(config) for every configuration of the list configs, each one in
+    a new process, with up to jobs processes at once.
+
+    Parameters
+    ----------
+    run : function : dict -> dict
+        Runs one configuration and returns its results.
+    configs : [dict]
+        List of configurations.
+    jobs : int (default = None)
+        Number of configurations run at once. When None, one per core.
+    pin : bool (default = True)
+        Pins each run to its own set of cores.
+    timeout : float (default = None)
+        Maximum time of each run, in seconds.
+    verbose : bool (default = True)
+        Prints the progress.
+
+    Returns
+    ----------
+    rows : [dict]
+        One row per configuration, in the order of configs: the
+        configuration, the results of run, the wall time and, for failed
+        runs, the error.
+    """
+    jobs = jobs or len(os.sched_getaffinity(0))
+    sets = coreSets(jobs)
+    free = list(range(jobs))
+    ctx = multiprocessing.get_context('fork')
+    results = ctx.Queue()
+    pending = list(enumerate(configs))
+    running = {}        # index: (process, slot, start time)
+    rows = [None] * len(configs)
+    def finish(index, result, error):
+        (proc, slot, start) = running.pop(index)
+        proc.join()
+        free.append(slot)
+        row = dict(configs[index])
+        row.update(result or {})
+        row['wall'] = round(time.time() - start, 4)
+        if error is not None:
+            row['error'] = error
+        rows[index] = row
+        if verbose:
+            print('[%d/%d] %s %s' % (sum(r is not None for r in rows), len(configs), configText(configs[index]), \
+                error or ''), flush = True)
+    while pending or running:
+        while pending and free:
+            (index, config) = pending.pop(0)
+            slot = free.pop(0)
+            proc = ctx.Process(target = _runPinned, args = (run, config, sets[slot] if pin else None, index, results))
+            proc.start()
+            running[index] = (proc, slot, time.time())
+        try:
+            finish(*results.get(timeout = 0.1))
+        except Empty:
+            pass
+        for index, (proc, slot, start) in list(running.items()):
+            if timeout is not None and time.time() - start > timeout:
+                proc.terminate()
+                finish(index, None, 'timeout')
+            elif not proc.is_alive() and proc.exitcode != 0:
+                finish(index, None, 'exit code ' + str(proc.exitcode))
+    return rows
+
+
+def configText(config):
+    return ' '.join(k + '=' + str(v) for k, v in config.items())
+
+
+def table(rows, columns = None):
+    """
+    Formats rows as a text table.
+    """
+    columns = columns or [k for k in rows[0]] + sorted(set(k for r in rows for k in r) - set(rows[0]))
+    cells = [[str(c) for c in columns]] + [['' if r.get(c) is None else str(r.get(c)) for c in columns] for r in rows]
+    widths = [max(len(line[i]) for line in cells) for i in range(len(columns))]
+    return '\n'.join('  '.join(v.rjust(w) for v, w in zip(line, widths)) for line in cells)
+
+
+################### MPEG4 runs ####################
+
+def mpeg4Run(config):
+    """
+    Decodes config['frames'] random frames (seeded by config['seed']) with a
+    model of frame size config['fs'] x config['fs'] and block size
+    config['bs']. config['engine'] is 'network' or 'simulate' and
+    config['tokens'] is 'blocks' or 'frames'. Returns the frame rate and a
+    checksum of the decoded frames, equal for equal inputs.
+    """
+    sys.path.insert(0, moc)
+    sys.path.insert(0, mpeg4)
+    import numpy as np
+    import MPEG4 as m
+    from input_gen import genFtStream, iterInpArrays
+    np.random.seed(config.get('seed', 0))
+    fs = (config['fs'], config['fs'])
+    model = m.MPEG4Model(fs, config['bs'], config.get('tokens') == 'frames')
+    ft = genFtStream(config['frames'], model.nb)
+    (out, elapsed) = model.run(ft, iterInpArrays(ft, fs, config['bs']), config.get('engine') == 'simulate', \
+        config.get('backend'))
+    h = hashlib.md5()
+    for frame in out:
+        h.update(frame.tobytes())
+    return {'elapsed': round(elapsed, 4), 'fps': round(len(out) / elapsed, 2), 'checksum': h.hexdigest()[:8]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Parallel parameter sweep of the MPEG4 model')
+    parser.add_argument('--fs', nargs = '+', type = int, default = [16, 32, 64], help = 'frame sizes')
+    parser.add_argument('--bs', nargs = '+', type = int, default = [8], help = 'block sizes')
+    parser.add_argument('--frames', type = int, default = 100, help = 'frames per run')
+    parser.add_argument('--engines', nargs = '+', default = ['network'], choices = ['network', 'simulate'])
+    parser.add_argument('--backends', nargs = '+', default = ['process'], choices = ['process', 'thread'])
+    parser.add_argument('--tokens', nargs = '+', default = ['blocks'], choices = ['blocks', 'frames'])
+    parser.add_argument('--seeds', nargs = '+', type = int, default = [0], help = 'input seeds')
+    parser.add_argument('--jobs', type = int, help = 'configurations run at once (default: one per core)')
+    parser.add_argument('--no-pin', action = 'store_true', help = 'do not pin the runs to cores')
+    parser.add_argument('--timeout', type = float, help = 'seconds per run')
+    parser.add_argument('--csv', help = 'CSV results file')
+    parser.add_argument('--json', help = 'JSON results file')
+    args = parser.parse_args()
+
+    configs = []
+    for (fs, bs, engine, backend, tokens, seed) in itertools.product(args.fs, args.bs, args.engines, \
+        args.backends, args.tokens, args.seeds):
+        if fs % bs != 0 or (engine == 'simulate' and backend != args.backends[0]):
+            continue
+        configs.append({'fs': fs, 'bs': bs, 'frames': args.frames, 'engine': engine, \
+            'backend': backend if engine == 'network' else None, 'tokens': tokens, 'seed': seed})
+    start = time.time()
+    rows = sweep(mpeg4Run, configs, args.jobs, not args.no_pin, args.timeout)
+    print(table(rows))
+    print('%d configurations in %.1f s' % (len(rows), time.time() - start))
+    if args.csv:
+        columns = list(rows[0]) + sorted(set(k for r in rows for k in r) - set(rows[0]))
+        with open(args.csv, 'w', newline = '') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for r in rows:
+                writer.writerow([r.get(c) for c in columns])
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent = 1)
+    return 1 if any('error' in r for r in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -13,68 +13,89 @@ from input_gen import *
 import numpy as np
 from typing import List, Tuple
 import time
-
-
-################### Model parameters ####################
-fs = (16,16)                      # Frame size. Each element of fs should be a multiple of bs
-bs = 8                            # Macro blocks of bs x bs pixels
-nb = int(fs[0]*fs[1]/(bs**2))     # Number of macro blocks in a frame
+import os
 
 
 ################### Auxiliary functions ####################
 
+# Returns the DCT basis matrix for blocks of the given size. The matrices are
+# computed once per block size and cached
+dct_bases = {}
+def dctBasis(size):
+    if size not in dct_bases:
+        dct_matrix = np.zeros(size)
+        for i in range(size[0]):
+            for j in range(size[1]):
+                if i == 0:
+                    dct_matrix[i,j] = 1/np.sqrt(2)
+                else:
+                    dct_matrix[i,j] = np.cos((2*j+1) * i * np.pi / (2*size[0]))
+        dct_matrix = dct_matrix * np.sqrt(2/size[0])
+        dct_bases[size] = (dct_matrix.transpose().copy(), dct_matrix)
+    return dct_bases[size]
+
 # Applies the Inverse Discrete Cosine Transform to a matrix inp
 def idct(inp):
-    size = inp.shape
-    dct_matrix = np.zeros(size)
-    for i in range(size[0]):
-        for j in range(size[1]):
-            if i == 0:
-                dct_matrix[i,j] = 1/np.sqrt(2)
-            else:
-                dct_matrix[i,j] = np.cos((2*j+1) * i * np.pi / (2*size[0]))
-    dct_matrix = dct_matrix * np.sqrt(2/size[0])
+    (dct_matrix_t, dct_matrix) = dctBasis(inp.shape)
 #    return inp     # Uncomment this line for testing
-    return np.round(dct_matrix.transpose() @ inp @ dct_matrix).astype(int)
+    return np.round(dct_matrix_t @ inp @ dct_matrix).astype(int)
+
+# Applies the Inverse Discrete Cosine Transform to the blocks of an array of
+# block records, all at once
+def idctRecords(records):
+    (dct_matrix_t, dct_matrix) = dctBasis(records['block'].shape[1:])
+    result = np.zeros(len(records), dtype = blockDtype(records['block'].shape[1], np.int64))
+    result['block'] = np.round(dct_matrix_t @ records['block'] @ dct_matrix)
+    result['pos'] = records['pos']
+    return result
+
+# Adds the matrix b_mat to mat in place, with its top left corner at the
+# 0-indexed position b_pos. The parts of b_mat outside mat are discarded.
+def blockAddInPlace(b_mat, b_pos, mat):
+    r0 = max(b_pos[0], 0)
+    c0 = max(b_pos[1], 0)
+    r1 = min(b_pos[0] + b_mat.shape[0], mat.shape[0])
+    c1 = min(b_pos[1] + b_mat.shape[1], mat.shape[1])
+    if r0 < r1 and c0 < c1:
+        region = mat[r0:r1, c0:c1]
+        np.add(region, b_mat[r0-b_pos[0]:r1-b_pos[0], c0-b_pos[1]:c1-b_pos[1]], out = region, casting = 'unsafe')
 
 # block = (matrix, pos = array[row,col]).
 def blockAdd(block, mat):
     pos_start = np.array([1,1])   # put [0,0] is you want the position to be 0 indexed
-    b_mat = block.block
-    b_pos = block.pos-pos_start
-    b_size = b_mat.shape
-    m_size = mat.shape
-    result = np.zeros(m_size).astype(int)
-    for i in range(m_size[0]):
-        for j in range(m_size[1]):
-            if i in range(b_pos[0], b_pos[0]+b_size[0]) and j in range(b_pos[1], b_pos[1]+b_size[1]):
-                result[i,j] = mat[i,j] + b_mat[i-b_pos[0], j-b_pos[1]]
-            else:
-                result[i,j] = mat[i,j]
+    result = mat.astype(int)
+    blockAddInPlace(block.block, block.pos-pos_start, result)
     return result
 
 
-
-
 # Get a matrix x and a list of motion vectors and return a motion compensated matrix
 # mvs = [(array(pos), array(mv))]
 def motionComp(mvs, x, bs):
-    x_size = x.shape
-    x = frame2mblocks((bs,bs), x)
-    mCompList1 = [MacroBlock(a.block, a.pos+b[1]) for a in x for b in mvs if np.array_equal(a.pos, b[0])]
-    mCompList2 = [a for a in x if not any(map(lambda x: np.array_equal(a.pos,x), [b[0] for b in mvs]))]
-    mCompList = mCompList1 + mCompList2
-    result = np.zeros(x_size).astype(int)
-    for i in mCompList:
-        result = blockAdd(i,result)
+    moves = {}
+    for (pos, mv) in mvs:
+        moves.setdefault((int(pos[0]), int(pos[1])), []).append(mv)
+    result = np.zeros(x.shape).astype(int)
+    for i in range(0, x.shape[0], bs):
+        for j in range(0, x.shape[1], bs):
+            block = x[i:i+bs, j:j+bs]
+            for mv in moves.get((i+1, j+1), [(0, 0)]):
+                blockAddInPlace(block, (i + mv[0], j + mv[1]), result)
     return result
 
 
 # Gets a list of macro blocks [(matrix, pos = array[row,col])] and adds one by
 # one to the matrix frame at the position defined by pos
 def frameRC(mbl, frame):
+    frame = frame.astype(int)
     for i in mbl:
-        frame = blockAdd(i,frame)
+        blockAddInPlace(i.block, (i.pos[0]-1, i.pos[1]-1), frame)
+    return frame
+
+# Same as frameRC, for an array of block records
+def recordsRC(records, frame):
+    frame = frame.astype(int)
+    for (block, pos) in zip(records['block'], records['pos']):
+        blockAddInPlace(block, (pos[0]-1, pos[1]-1), frame)
     return frame
 
 
@@ -92,13 +113,14 @@ def scenarioVLD_func2(mbl):
     mv = mbl[0][0].motionV
     return [[MacroBlock(block, pos)],[(pos,mv)]]
 
-def scenarioVLD(n):
-    if n == 0:
-        return ([1], [1,0], scenarioVLD_func1)
-    if n == 1:
-        return ([1], [1,1], scenarioVLD_func2)
-    else:
-        raise Exception('scenarioVLD: Outside scenario range')
+# Frame tokens: the records of a frame pass as one token, and the motion
+# vectors of a P frame as the array of its pos and motionV fields
+def scenarioVLD_frame1(inputs):
+    return [[inputs[0][0]], []]
+
+def scenarioVLD_frame2(inputs):
+    records = inputs[0][0]
+    return [[records], [records[['pos', 'motionV']]]]
 
 
 def scenarioIDCT_func(mbl):
@@ -106,27 +128,8 @@ def scenarioIDCT_func(mbl):
     pos = mbl[0][0].pos
     return [[MacroBlock(idct(block), pos)]]
 
-def scenarioIDCT(n):
-    if n == 1:
-        return ([1], [1], scenarioIDCT_func)
-    raise Exception('scenarioIDCT: Outside scenario range')
-
-
-def scenarioMC_func1(inputs):
-    return [[np.zeros(fs).astype(int)]]
-
-def scenarioMC_func2(inputs):
-    mvl = inputs[0]
-    frame = inputs[1][0]
-    return [[motionComp(mvl, frame, bs)]]
-
-def scenarioMC(n):
-    if n == 0:
-        return ([0,1], [1], scenarioMC_func1)
-    elif n < nb and n > 0:
-        return ([n,1], [1], scenarioMC_func2)
-    else:
-        raise Exception('scenarioMC: Outside scenario range')
+def scenarioIDCT_frame(inputs):
+    return [[idctRecords(inputs[0][0])]]
 
 
 def scenarioRC_func(inputs):
@@ -134,13 +137,10 @@ def scenarioRC_func(inputs):
     frame = inputs[1][0]
     return [[frameRC(mbl,frame)], [True]]
 
-def scenarioRC(n):
-    if n == 0:
-        return ([nb,1], [1,1], scenarioRC_func)
-    elif n < nb and n > 0:
-        return ([n,1], [1,1], scenarioRC_func)
-    else:
-        raise Exception('scenarioRC: Outside scenario range')
+def scenarioRC_frame(inputs):
+    records = inputs[0][0]
+    frame = inputs[1][0]
+    return [[recordsRC(records, frame)], [True]]
 
 
 # Next State function for detector FD
@@ -155,114 +155,354 @@ def nextStateFD(state, inps):
     return nextState
 
 
-# Output decode function for detector FD
-def outDecodeFD(state):
-    if state == 0:
-        return [[scenarioVLD(0) for i in range(nb)], [scenarioIDCT(1) for i in range(nb)], [scenarioMC(0)], [scenarioRC(0)]]
-    elif state > 0 and state < nb:
-        return [[scenarioVLD(1) for i in range(state)], [scenarioIDCT(1) for i in range(state)], [scenarioMC(state)], [scenarioRC(state)]]
-    else:
-        raise Exception('outDecodeFD: Outside scenario range')
-
-
-################### Data and control channels ####################
-
-# Data channels
-s_mb = Queue()
-s_db = Queue()
-s_idct = Queue()
-s_pf = Queue()
-s_v = Queue()
-s_out = Queue()
-s_out1 = Queue()
-s_out2 = Queue()
-s_ft = Queue()
-s_fb = Queue()
-
-# Control channels
-c_idct = Queue()
-c_vld = Queue()
-c_mc = Queue()
-c_rc = Queue()
-
-# Initial tokens
-s_fb.put(True)
-s_fb.put(True)
-s_fb.put(True)
-
-################### Processes ####################
-
-# Kernels
-VLD = Kernel(c_vld, [s_mb], [s_db, s_v], 0)
-IDCT = Kernel(c_idct, [s_db], [s_idct], 0)
-MC = Kernel(c_mc, [s_v, s_out2], [s_pf], 0)
-RC = Kernel(c_rc, [s_idct, s_pf], [s_out, s_fb], 0)
-
-# Forks
-fork_out = Fork(s_out, [s_out1, s_out2], 0)
-
-# Detector
-FD = Detector([1,1], nextStateFD, outDecodeFD, 0, [s_ft, s_fb], [c_vld, c_idct, c_mc, c_rc], 0)
-
-
-# each macro block is either a 2-tuple (bs x bs np.array, np.array) for I frames
-#                         or a 3-tuple (bs x bs np.array, np.array, np.array) for P frames
+################### Model ####################
+
+class MPEG4Model(object):
+    """
+    The MPEG4Model class creates an instance of the MPEG4 decoder model: its
+    channels, kernels, fork and detector, for a frame size and a block size.
+    The scenario functions that depend on the parameters are methods of the
+    instance, so models with different parameters can live in one
+    interpreter.
+    """
+    def __init__(self, fs = (16,16), bs = 8, frameTokens = False, inputCapacity = 256, memo = None, backend = None):
+        """
+        MPEG4Model initializer.
+
+        Parameters
+        ----------
+        fs : (int, int) (default = (16,16))
+            Frame size. Each element of fs should be a multiple of bs.
+        bs : int (default = 8)
+            Macro blocks of bs x bs pixels.
+        frameTokens : bool (default = False)
+            If True, the blocks of a frame move as one array of records.
+        inputCapacity : int (default = 256)
+            Capacity of the input channels, in tokens, so that the sources
+            of the inputs run at most inputCapacity tokens ahead of the
+            decoder.
+        memo : bool or Int (default = None)
+            Memoization of the firings of the pure kernels IDCT and MC, with
+            one Memo per kernel (see the memo argument of Kernel).
+        backend : str or backend (default = None)
+            Backend that creates the channels of the model, for backends
+            whose nodes can only use their own channels (e.g. 'pool'). When
+            None, the channels are Queues.
+        """
+        if fs[0] % bs != 0 or fs[1] % bs != 0:
+            raise Exception("Frame dimensions must be multiples of the block size.")
+        self.fs = fs                            # Frame size
+        self.bs = bs                            # Block size
+        self.nb = int(fs[0]*fs[1]/(bs**2))      # Number of macro blocks in a frame
+        self.frameTokens = frameTokens
+        self.net = None                         # Network of the last run
+        self.backend = backend                  # Backend of the channels (None for Queues)
+        channel = Queue if backend is None else getBackend(backend).channel
+
+        # Data channels
+        self.s_mb = channel(inputCapacity)
+        self.s_db = channel()
+        self.s_idct = channel()
+        self.s_pf = channel()
+        self.s_v = channel()
+        self.s_out = channel()
+        self.s_out1 = channel()
+        self.s_out2 = channel()
+        self.s_ft = channel(inputCapacity)
+        self.s_fb = channel()
+
+        # Control channels
+        self.c_idct = channel()
+        self.c_vld = channel()
+        self.c_mc = channel()
+        self.c_rc = channel()
+
+        # Initial tokens
+        self.s_fb.put(True)
+        self.s_fb.put(True)
+        self.s_fb.put(True)
+        self.s_out2.put(np.zeros(fs).astype(int))
+
+        # Kernels
+        self.VLD = Kernel(self.c_vld, [self.s_mb], [self.s_db, self.s_v], 0, name = 'VLD', scenarios = self.scenarioVLD)
+        self.IDCT = Kernel(self.c_idct, [self.s_db], [self.s_idct], 0, name = 'IDCT', scenarios = self.scenarioIDCT, \
+            memo = memo)
+        self.MC = Kernel(self.c_mc, [self.s_v, self.s_out2], [self.s_pf], 0, name = 'MC', scenarios = self.scenarioMC, \
+            memo = memo)
+        self.RC = Kernel(self.c_rc, [self.s_idct, self.s_pf], [self.s_out, self.s_fb], 0, name = 'RC', scenarios = self.scenarioRC)
+
+        # Forks
+        self.fork_out = Fork(self.s_out, [self.s_out1, self.s_out2], 0, name = 'fork_out')
+
+        # Detector
+        self.FD = Detector([1,1], nextStateFD, self.outDecodeFD, 0, [self.s_ft, self.s_fb], \
+            [self.c_vld, self.c_idct, self.c_mc, self.c_rc], 0, name = 'FD', incremental = True)
+
+        self.nodes = [self.FD, self.VLD, self.IDCT, self.MC, self.RC, self.fork_out]
+
+    def __getstate__(self):
+        # The scenario methods of the kernels pickle the model when nodes are
+        # sent to pool workers, but not the Network of the last run
+        state = self.__dict__.copy()
+        state['net'] = None
+        return state
+
+    # Scenario tables of the kernels
+    def scenarioVLD(self, n):
+        if n == 'I':
+            return ([1], [1,0], scenarioVLD_frame1)
+        if n == 'P':
+            return ([1], [1,1], scenarioVLD_frame2)
+        if n == 0:
+            return ([1], [1,0], scenarioVLD_func1)
+        if n == 1:
+            return ([1], [1,1], scenarioVLD_func2)
+        else:
+            raise Exception('scenarioVLD: Outside scenario range')
+
+    def scenarioIDCT(self, n):
+        if n == 'F':
+            return ([1], [1], scenarioIDCT_frame)
+        if n == 1:
+            return ([1], [1], scenarioIDCT_func)
+        raise Exception('scenarioIDCT: Outside scenario range')
+
+    def scenarioMC_func1(self, inputs):
+        return [[np.zeros(self.fs).astype(int)]]
+
+    def scenarioMC_func2(self, inputs):
+        mvl = inputs[0]
+        frame = inputs[1][0]
+        return [[motionComp(mvl, frame, self.bs)]]
+
+    def scenarioMC_frame(self, inputs):
+        mvs = inputs[0][0]
+        frame = inputs[1][0]
+        return [[motionComp(zip(mvs['pos'], mvs['motionV']), frame, self.bs)]]
+
+    def scenarioMC(self, n):
+        if n == 'I':
+            return ([0,1], [1], self.scenarioMC_func1)
+        if n == 'P':
+            return ([1,1], [1], self.scenarioMC_frame)
+        if n == 0:
+            return ([0,1], [1], self.scenarioMC_func1)
+        elif n < self.nb and n > 0:
+            return ([n,1], [1], self.scenarioMC_func2)
+        else:
+            raise Exception('scenarioMC: Outside scenario range')
+
+    def scenarioRC(self, n):
+        if n == 'F':
+            return ([1,1], [1,1], scenarioRC_frame)
+        if n == 0:
+            return ([self.nb,1], [1,1], scenarioRC_func)
+        elif n < self.nb and n > 0:
+            return ([n,1], [1,1], scenarioRC_func)
+        else:
+            raise Exception('scenarioRC: Outside scenario range')
+
+    # Output decode function for detector FD. The kernels look the scenario
+    # ids up in their scenario tables, and (id, n) selects a scenario for n
+    # firings. With frame tokens, every kernel fires once per frame. FD is
+    # incremental, so the kernels get REPEAT while the frame type and size
+    # do not change, and the function is only called when they do
+    def outDecodeFD(self, state):
+        if self.frameTokens:
+            if state == 0:
+                return [['I'], ['F'], ['I'], ['F']]
+            return [['P'], ['F'], ['P'], ['F']]
+        if state == 0:
+            return [[(0, self.nb)], [(1, self.nb)], [0], [0]]
+        elif state > 0 and state < self.nb:
+            return [[(1, state)], [(1, state)], [state], [state]]
+        else:
+            raise Exception('outDecodeFD: Outside scenario range')
+
+    def sources(self, ft, frames):
+        """
+        Returns the Sources that write the frame types ft and the block
+        records of each frame (e.g. as returned by loadInpsBinary) to the
+        input channels, as whole frames or block by block. Nodes sent to pool
+        workers are pickled, so the blocks are then listed in advance.
+        """
+        mbs = frames if self.frameTokens else iterBlocks(ft, frames)
+        if isinstance(getBackend(self.backend), PoolBackend):
+            mbs = list(mbs)
+        return [Source(ft, [self.s_ft], name = 'ft'), Source(mbs, [self.s_mb], name = 'mb')]
+
+    def run(self, ft, frames, simulate = False, backend = None, trace = False, checkpoint = None, resume = None, \
+        metrics = None):
+        """
+        Decodes the frames and returns the list of decoded frames and the
+        decoding time in seconds.
+
+        Parameters
+        ----------
+        ft : [str]
+            Frame types.
+        frames : iterable of np.ndarray
+            Block records of each frame.
+        simulate : bool (default = False)
+            Runs the model in a single process with a Simulator instead of a
+            Network.
+        backend : str or backend (default = None)
+            Execution backend of the Network.
+        trace : bool (default = False)
+            Records the firings of the Network, available in self.net.
+        checkpoint : (str, int) (default = None)
+            File name and number of frames: after reading that many frames,
+            the Network is stopped at a checkpoint written to the file, and
+            only those frames are returned.
+        resume : str (default = None)
+            Checkpoint file from which the Network is resumed. Only the
+            frames decoded after the checkpoint are returned.
+        metrics : int (default = None)
+            When given, the Network counts the tokens moved through its
+            channels and publishes them on this port (none when 0) while it
+            runs. The last metrics are available in self.net.
+        """
+        sources = self.sources(ft, frames)
+        start = time.time()
+        if simulate:
+            out = Simulator(self.nodes + sources).run()[self.s_out1]
+            return (out, time.time() - start)
+        self.net = Network(backend, trace = trace, metrics = metrics is not None)
+        self.net.add(*(self.nodes + sources))
+        if resume is not None:
+            self.net.restore(resume)
+        self.net.start()
+        if metrics:
+            self.net.publishMetrics(metrics)
+        out = []
+        while resume is not None or len(out) < len(ft):
+            if checkpoint is not None and len(out) == checkpoint[1]:
+                # The frames decoded after these ones are saved with the
+                # checkpoint
+                self.net.checkpoint(checkpoint[0])
+                break
+            frame = self.s_out1.get()
+            if frame is EOS:
+                # After a resume, the frames are read until the end of the stream
+                break
+            out.append(frame)
+        elapsed = time.time() - start
+        self.net.shutdown()
+        return (out, elapsed)
+
+
+def buildNetwork(fs = (16,16), bs = 8, frames = 10, seed = 0, frameTokens = False):
+    """
+    Returns a Network that decodes frames random frames, generated from the
+    given seed while the decoder runs. The decoded frames are written to its
+    sink channel. It is used by the launcher of the Distributed module.
+    """
+    np.random.seed(seed)
+    fs = tuple(fs)
+    model = MPEG4Model(fs, bs, frameTokens)
+    ft = genFtStream(frames, model.nb)
+    net = Network()
+    net.add(*(model.nodes + model.sources(ft, iterInpArrays(ft, fs, bs))))
+    return net
+
+
+def checkResume(fs, bs, n, frameTokens = False, backend = None, fileName = 'mpeg4.ckpt'):
+    """
+    Decodes the inputs in ft.npy and mbInputs.npy without interruption,
+    then stopping at a checkpoint after n frames and resuming from it in a
+    new model. Returns True when both give the same frames.
+    """
+    runs = []
+    for options in [{}, {'checkpoint': (fileName, n)}, {'resume': fileName}]:
+        (ft, frames) = loadInpsBinary()
+        runs.append(MPEG4Model(fs, bs, frameTokens).run(ft, frames, backend = backend, **options)[0])
+    os.remove(fileName)
+    (ref, before, after) = runs
+    return len(ref) == len(before) + len(after) and all(np.array_equal(a, b) for (a, b) in zip(ref, before + after))
+
+
+def checkFusion(fs, bs, frameTokens = False):
+    """
+    Decodes the inputs in ft.npy and mbInputs.npy with the unfused model,
+    with all nodes fused in one Cluster, and with every node but FD fused.
+    Returns True when all of them give the same frames.
+    """
+    runs = []
+    for groups in [lambda nodes: [], lambda nodes: [nodes], lambda nodes: [nodes[1:]]]:
+        (ft, frames) = loadInpsBinary()
+        model = MPEG4Model(fs, bs, frameTokens)
+        model.nodes = fuse(model.nodes, groups(model.nodes))
+        runs.append(model.run(ft, frames)[0])
+    ref = runs[0]
+    return all(len(out) == len(ref) and all(np.array_equal(a, b) for (a, b) in zip(ref, out)) for out in runs[1:])
+
+
+# each macro block is either a MacroBlock (bs x bs np.array, np.array) for I frames
+#                         or a FullB (bs x bs np.array, np.array, np.array) for P frames.
+# With frame tokens, each token of s_mb is the array of block records of a frame
 
 ################### Execute the module ####################
 
 if __name__ == '__main__':
     print("MPEG4 model Python")
 
-    args = sys.argv[1:] #args: fs[0] fs[1] bs nFrames
+    args = sys.argv[1:] #args: fs[0] fs[1] bs nFrames [traceFile] [--frame-tokens] [--text-inputs] [--inputs] [--simulate] [--memo]
+                        #      [--checkpoint=nFrames] [--resume] [--check-resume=nFrames] [--check-fusion]
+                        #      [--metrics[=port]]
+    flags = [a for a in args if a.startswith('--')]
+    args = [a for a in args if not a.startswith('--')]
 
     fs = (int(args[0]), int(args[1]))
     bs = int(args[2])
-    if fs[0] % bs != 0 or fs[1] % bs != 0:
-        raise Exception("Frame dimensions must be multiples of the block size.")
-    nb = int(fs[0]*fs[1]/(bs**2))
+    model = MPEG4Model(fs, bs, '--frame-tokens' in flags, memo = '--memo' in flags or None)
     nFrames = int(args[3])
-
-    # Generate input streams and save them
-    ft = genFtStream(nFrames,nb)
-    mbInputs = genInpStream(ft, fs, bs)
-    saveInpsToFile(ft, mbInputs)
-
-    # Put input signal in the input queues
-    s_out2.put(np.zeros(fs).astype(int))
-    for i in ft:
-        s_ft.put(i)
-    for i in mbInputs:
-        s_mb.put(i)
-
-    # Start timer
-    start = time.time()
-
-    # Start the processes
-    FD.start()
-    VLD.start()
-    IDCT.start()
-    MC.start()
-    RC.start()
-    fork_out.start()
-
-    # Get the outputs
-    out = []
-    for i in ft:
-        out.append(s_out1.get())
-
-    # Stop timer
-    end = time.time()
-    elapsed = round(end - start, 4)
+    traceFile = args[4] if len(args) > 4 and '--simulate' not in flags else None
+
+    # Generate the input streams in the binary files ft.npy and mbInputs.npy,
+    # or use the files already there with --inputs (see input_gen.py). With
+    # --text-inputs, they are also saved in the text files of the other
+    # implementations of the decoder
+    # With --checkpoint=n, the decoder stops at a checkpoint in mpeg4.ckpt
+    # after n frames, and --resume decodes the remaining frames from it, with
+    # the input files already there
+    ckpt = [('mpeg4.ckpt', int(f.split('=')[1])) for f in flags if f.startswith('--checkpoint=')]
+    resume = 'mpeg4.ckpt' if '--resume' in flags else None
+    if '--inputs' not in flags and resume is None:
+        ft = genFtStream(nFrames, model.nb)
+        saveInpsToBinary(ft, iterInpArrays(ft, fs, bs), fs, bs)
+    if '--text-inputs' in flags:
+        (ft, frames) = loadInpsBinary()
+        saveInpsToFile(ft, iterBlocks(ft, frames))
+    (ft, frames) = loadInpsBinary()
+    nFrames = len(ft)
+
+    # With --check-resume=n, a run stopped at a checkpoint after n frames and
+    # resumed must decode the frames of an uninterrupted run
+    check = [int(f.split('=')[1]) for f in flags if f.startswith('--check-resume=')]
+    if check:
+        ok = checkResume(fs, bs, check[0], '--frame-tokens' in flags)
+        print('Checkpoint after ' + str(check[0]) + ' frames and resume: ' + ('OK' if ok else 'FAILED'))
+        if not ok:
+            raise Exception('Frames decoded after a resume differ from an uninterrupted run')
+
+    # With --check-fusion, the models with fused nodes must decode the frames
+    # of the unfused one
+    if '--check-fusion' in flags:
+        ok = checkFusion(fs, bs, '--frame-tokens' in flags)
+        print('Fused models: ' + ('OK' if ok else 'FAILED'))
+        if not ok:
+            raise Exception('Frames decoded by a fused model differ from the unfused one')
+
+    # The inputs are read from the files while the decoder runs
+    # With --metrics, the channel metrics are printed at the end, and with
+    # --metrics=port they are also served on http://127.0.0.1:port/metrics
+    metrics = [int(f.split('=')[1]) if '=' in f else 0 for f in flags if f.startswith('--metrics')]
+    (out, elapsed) = model.run(ft, frames, '--simulate' in flags, trace = traceFile is not None, \
+        checkpoint = ckpt[0] if ckpt else None, resume = resume, metrics = metrics[0] if metrics else None)
+    nFrames = len(out)
+    elapsed = round(elapsed, 4)
     fps = round(nFrames/elapsed, 4)
 
-    # Terminate the processes
-    FD.terminate()
-    VLD.terminate()
-    IDCT.terminate()
-    MC.terminate()
-    RC.terminate()
-    fork_out.terminate()
-
 
 #    for i in out:
 #        print(i)
@@ -270,3 +510,14 @@ if __name__ == '__main__':
 
     print('Frame size: ' + str(fs) + '\nBlock size: ' + str(bs) + '\nNumber of frames: ' + str(nFrames) + \
         '\nTime elapsed: ' + str(elapsed) + 's' + '\nFPS: ' + str(fps))
+
+    if '--memo' in flags:
+        for k in [model.IDCT, model.MC]:
+            print(k.name + ' memo: ' + str(k.memo.stats()))
+
+    if metrics and '--simulate' not in flags:
+        print(model.net.metricsSummary())
+
+    if traceFile is not None:
+        model.net.saveTrace(traceFile)
+        print(model.net.traceSummary())
@@ -0,0 +1,109 @@
+"""
+Author: Ricardo Bonna
+Creation date: 18/oct/2026
+Module description: Benchmark of the macro block functions of the MPEG4
+example. It checks that the functions of MPEG4.py give the same outputs as
+the original pixel loop implementations, kept here as reference, and
+compares their execution times over a range of frame sizes.
+
+Usage: python bench_kernels.py [bs] [nFrames] [fs1 fs2 ...]
+"""
+
+from MPEG4 import *
+import time
+
+
+################### Reference implementations ####################
+
+def idct_ref(inp):
+    size = inp.shape
+    dct_matrix = np.zeros(size)
+    for i in range(size[0]):
+        for j in range(size[1]):
+            if i == 0:
+                dct_matrix[i,j] = 1/np.sqrt(2)
+            else:
+                dct_matrix[i,j] = np.cos((2*j+1) * i * np.pi / (2*size[0]))
+    dct_matrix = dct_matrix * np.sqrt(2/size[0])
+    return np.round(dct_matrix.transpose() @ inp @ dct_matrix).astype(int)
+
+def blockAdd_ref(block, mat):
+    pos_start = np.array([1,1])
+    b_mat = block.block
+    b_pos = block.pos-pos_start
+    b_size = b_mat.shape
+    m_size = mat.shape
+    result = np.zeros(m_size).astype(int)
+    for i in range(m_size[0]):
+        for j in range(m_size[1]):
+            if i in range(b_pos[0], b_pos[0]+b_size[0]) and j in range(b_pos[1], b_pos[1]+b_size[1]):
+                result[i,j] = mat[i,j] + b_mat[i-b_pos[0], j-b_pos[1]]
+            else:
+                result[i,j] = mat[i,j]
+    return result
+
+def motionComp_ref(mvs, x, bs):
+    x_size = x.shape
+    x = frame2mblocks((bs,bs), x)
+    mCompList1 = [MacroBlock(a.block, a.pos+b[1]) for a in x for b in mvs if np.array_equal(a.pos, b[0])]
+    mCompList2 = [a for a in x if not any(map(lambda x: np.array_equal(a.pos,x), [b[0] for b in mvs]))]
+    mCompList = mCompList1 + mCompList2
+    result = np.zeros(x_size).astype(int)
+    for i in mCompList:
+        result = blockAdd_ref(i,result)
+    return result
+
+def frameRC_ref(mbl, frame):
+    for i in mbl:
+        frame = blockAdd_ref(i,frame)
+    return frame
+
+
+################### Benchmark ####################
+
+def timeit(f, args):
+    start = time.perf_counter()
+    for a in args:
+        out = f(*a)
+    return time.perf_counter() - start
+
+def check(f, g, args):
+    for a in args:
+        if not np.array_equal(f(*a), g(*a)):
+            raise Exception(f.__name__ + ' output differs from the reference')
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    bs = int(args[0]) if len(args) > 0 else 8
+    nFrames = int(args[1]) if len(args) > 1 else 10
+    sizes = [int(a) for a in args[2:]] or [16, 32, 64]
+
+    print('function'.ljust(12) + 'fs'.rjust(6) + 'reference (s)'.rjust(16) + 'vectorized (s)'.rjust(16) + 'speedup'.rjust(10))
+    for size in sizes:
+        fs = (size, size)
+        nb = int(fs[0]*fs[1]/(bs**2))
+        ft = ['I'] + ['P' + str(np.random.randint(1, nb)) for i in range(nFrames - 1)] if nb > 1 else ['I'] * nFrames
+        mbInputs = genInpStream(ft, fs, bs)
+        frames = [(256*np.random.rand(fs[0], fs[1])).astype(int) for i in ft]
+        # Arguments of each function, one tuple per call
+        idctArgs = [(mb.block,) for mb in mbInputs]
+        mbl = []
+        rcArgs = []
+        mcArgs = []
+        k = 0
+        for t, frame in zip(ft, frames):
+            n = nb if t == 'I' else int(t[1:])
+            blocks = mbInputs[k:k+n]
+            k += n
+            rcArgs.append(([MacroBlock(idct(b.block), b.pos) for b in blocks], frame))
+            if t != 'I':
+                mcArgs.append(([(b.pos, b.motionV) for b in blocks], frame, bs))
+        for (name, f, g, fargs) in [('idct', idct, idct_ref, idctArgs), ('motionComp', motionComp, motionComp_ref, mcArgs), \
+            ('frameRC', frameRC, frameRC_ref, rcArgs)]:
+            if not fargs:
+                continue
+            check(f, g, fargs)
+            tRef = timeit(g, fargs)
+            tNew = timeit(f, fargs)
+            print(name.ljust(12) + str(size).rjust(6) + str(round(tRef, 4)).rjust(16) + str(round(tNew, 4)).rjust(16) + \
+                str(round(tRef / tNew, 1)).rjust(10))
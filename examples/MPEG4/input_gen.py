@@ -1,31 +1,74 @@
-from typing import List, Tuple
+from typing import Iterable, Iterator, List, Tuple
 import numpy as np
 import sys
 
 
 ################### Macro Block classes ####################
 
+# The classes use __slots__ and pickle as plain tuples, so that the tokens
+# are small in memory and in the channels
 class MacroBlock(object):
+    __slots__ = ('block', 'pos')
+
     def __init__(self, block, pos):
         self.block = block
         self.pos = pos
 
+    def __reduce__(self):
+        return (MacroBlock, (self.block, self.pos))
+
     def __repr__(self):
-        return 'PosB {block = fromLists ' + np.array2string(self.block, separator=', ') + ', pos = ' + str(tuple(self.pos)) + '}'
+        return 'PosB {block = fromLists ' + np.array2string(self.block, separator=', ') + ', pos = ' + str(tuple(np.asarray(self.pos).tolist())) + '}'
 
     def __str__(self):
-        return 'PosB {block = fromLists ' + np.array2string(self.block, separator=', ') + ', pos = ' + str(tuple(self.pos)) + '}'
+        return 'PosB {block = fromLists ' + np.array2string(self.block, separator=', ') + ', pos = ' + str(tuple(np.asarray(self.pos).tolist())) + '}'
 
 class FullB(MacroBlock):
+    __slots__ = ('motionV',)
+
     def __init__(self, block, pos, motionV):
         MacroBlock.__init__(self, block, pos)
         self.motionV = motionV
 
+    def __reduce__(self):
+        return (FullB, (self.block, self.pos, self.motionV))
+
     def __repr__(self):
-        return 'FullB {block = fromLists ' + np.array2string(self.block, separator=', ') + ', pos = ' + str(tuple(self.pos)) + ', motionV = ' + str(tuple(self.motionV)) + '}'
+        return 'FullB {block = fromLists ' + np.array2string(self.block, separator=', ') + ', pos = ' + str(tuple(np.asarray(self.pos).tolist())) + ', motionV = ' + str(tuple(np.asarray(self.motionV).tolist())) + '}'
 
     def __str__(self):
-        return 'FullB {block = fromLists ' + np.array2string(self.block, separator=', ') + ', pos = ' + str(tuple(self.pos)) + ', motionV = ' + str(tuple(self.motionV)) + '}'
+        return 'FullB {block = fromLists ' + np.array2string(self.block, separator=', ') + ', pos = ' + str(tuple(np.asarray(self.pos).tolist())) + ', motionV = ' + str(tuple(np.asarray(self.motionV).tolist())) + '}'
+
+
+################### Structured array blocks ####################
+
+# Returns the dtype of the records of a frame of macro blocks of bs x bs
+# pixels. The motion vector of the blocks of I frames is zero. The pixels of
+# the input blocks (0 to 255) fit in 16 bits
+def blockDtype(bs: int, pixel = np.int16) -> np.dtype:
+    return np.dtype([('block', pixel, (bs, bs)), ('pos', np.int32, 2), ('motionV', np.int32, 2)])
+
+
+# Converts an array of block records into macro blocks (MacroBlock for I
+# frames, FullB for P frames). The blocks are views of the array
+def recordsToBlocks(records: np.ndarray, intra: bool) -> List[MacroBlock]:
+    blocks = records['block']
+    pos = records['pos']
+    if intra:
+        return [MacroBlock(blocks[i], pos[i]) for i in range(len(records))]
+    mvs = records['motionV']
+    return [FullB(blocks[i], pos[i], mvs[i]) for i in range(len(records))]
+
+
+# Converts a list of macro blocks of bs x bs pixels into an array of records
+def blocksToRecords(mbl: List[MacroBlock], bs: int) -> np.ndarray:
+    records = np.zeros(len(mbl), dtype = blockDtype(bs))
+    for i, mb in enumerate(mbl):
+        records[i]['block'] = mb.block
+        records[i]['pos'] = mb.pos
+        if isinstance(mb, FullB):
+            records[i]['motionV'] = mb.motionV
+    return records
 
 
 # Split a large block into a listo of macro blocks of size d = (dr,dc) or smaller
@@ -50,48 +93,132 @@ def frame2mblocks(d: Tuple[int, int], frame: np.ndarray) -> List[MacroBlock]:
 # arguments: size = length of the output stream
 #            nb = number of blocks per frame
 def genFtStream(size: int, nb: int) -> List[str]:
-    ft = ['I']
+    return list(iterFtStream(size, nb))
+
+
+# Generator version of genFtStream
+def iterFtStream(size: int, nb: int) -> Iterator[str]:
+    yield 'I'
     for i in range(size-1):
         a = np.random.randint(0, nb)
         if a == 0:
-            ft.append('I')
+            yield 'I'
         else:
-            ft.append('P'+str(a))
-    return ft
+            yield 'P'+str(a)
 
 
-# Generates a random input stream of macro blocs based on a list of frame types
+# Generates a random input stream of macro blocks based on a list of frame
+# types, as one array of block records per frame (see blockDtype). The blocks
+# of I frames cover the frame in row order, and P frames have as many blocks
+# as given by their type, at distinct random positions
 # arguments: frameTypeList = list outputted by genFtStream
 #            fs = tuple with the frame size
 #            bs = block size
-def genInpStream(frameTypeList: List[str], fs: Tuple[int, int], bs: int) -> List[Tuple]:
-    output = []
+def genInpArrays(frameTypeList: List[str], fs: Tuple[int, int], bs: int) -> List[np.ndarray]:
+    return list(iterInpArrays(frameTypeList, fs, bs))
+
+
+# Generator version of genInpArrays, which creates each frame when it is
+# requested
+def iterInpArrays(frameTypeList: Iterable[str], fs: Tuple[int, int], bs: int) -> Iterator[np.ndarray]:
+    dtype = blockDtype(bs)
+    (nr, nc) = (fs[0] // bs, fs[1] // bs)
+    grid = np.array([(1 + i*bs, 1 + j*bs) for i in range(nr) for j in range(nc)], dtype = np.int32)
     for i in frameTypeList:
         if i == 'I':
-            output += frame2mblocks((bs,bs),(256*np.random.rand(fs[0],fs[1])).astype(int))
+            frame = (256*np.random.rand(nr*bs, nc*bs)).astype(np.int16)
+            records = np.zeros(nr*nc, dtype = dtype)
+            records['block'] = frame.reshape(nr, bs, nc, bs).transpose(0, 2, 1, 3).reshape(nr*nc, bs, bs)
+            records['pos'] = grid
         elif i[0] == 'P':
             a = int(i[1:])
-            posList = [np.array([a,b]) for a in range(1, fs[0] - bs + 2,bs) for b in range(1, fs[0] - bs + 2,bs)]
-            output += [FullB((256*np.random.rand(bs,bs)).astype(int), \
-                posList.pop(np.random.randint(0,len(posList))), \
-                (np.random.randint(2*bs+1, size=2) - bs).astype(int)) for j in range(a)]
-    return output
+            records = np.zeros(a, dtype = dtype)
+            records['block'] = (256*np.random.rand(a, bs, bs)).astype(np.int16)
+            records['pos'] = grid[np.random.choice(len(grid), a, replace = False)]
+            records['motionV'] = np.random.randint(2*bs+1, size = (a, 2)) - bs
+        yield records
+
+
+# Generates a random input stream of macro blocs based on a list of frame types
+# arguments: frameTypeList = list outputted by genFtStream
+#            fs = tuple with the frame size
+#            bs = block size
+def genInpStream(frameTypeList: List[str], fs: Tuple[int, int], bs: int) -> List[Tuple]:
+    return list(iterInpStream(frameTypeList, fs, bs))
+
+
+# Generator version of genInpStream
+def iterInpStream(frameTypeList: List[str], fs: Tuple[int, int], bs: int) -> Iterator[MacroBlock]:
+    return iterBlocks(frameTypeList, iterInpArrays(frameTypeList, fs, bs))
+
+
+# Converts a stream of frames of block records into a stream of macro blocks
+def iterBlocks(frameTypeList: Iterable[str], frames: Iterable[np.ndarray]) -> Iterator[MacroBlock]:
+    for i, records in zip(frameTypeList, frames):
+        for mb in recordsToBlocks(records, i == 'I'):
+            yield mb
 
 
 ################### Save to file ####################
 
+# Text format, read by the other implementations of the decoder. The macro
+# blocks are written one by one, so mb can be a generator
 def saveInpsToFile(ft, mb, ftFile = 'ft.inp', mbFile = 'mbInputs.inp'):
-    ft = str(ft).replace("'", '"')
-    mb = str(mb).replace('\n','')
+    ft = str(list(ft)).replace("'", '"')
     f = open(ftFile, 'w')
     f.write(ft)
     f.close()
     f = open(mbFile, 'w')
-    f.write(mb)
+    f.write('[')
+    for i, block in enumerate(mb):
+        if i > 0:
+            f.write(', ')
+        f.write(str(block).replace('\n',''))
+    f.write(']')
     f.close()
     return
 
 
+# Binary format: ftFile holds the frame types as an int32 .npy array (0 for I
+# frames, n for P frames of n blocks) and mbFile the block records of all the
+# frames in order, as a .npy array of blockDtype(bs). The frames are written
+# one by one, so frames can be a generator
+def saveInpsToBinary(ft, frames, fs, bs, ftFile = 'ft.npy', mbFile = 'mbInputs.npy'):
+    nb = (fs[0] // bs) * (fs[1] // bs)
+    codes = np.array([0 if i == 'I' else int(i[1:]) for i in ft], dtype = np.int32)
+    np.save(ftFile, codes)
+    total = int(np.where(codes == 0, nb, codes).sum())
+    out = np.lib.format.open_memmap(mbFile, mode = 'w+', dtype = blockDtype(bs), shape = (total,))
+    k = 0
+    for records in frames:
+        out[k:k+len(records)] = records
+        k += len(records)
+    if k != total:
+        raise Exception('saveInpsToBinary: the frames do not match the frame types')
+    out.flush()
+    del out
+    return
+
+
+# Reads the files written by saveInpsToBinary. Returns the list of frame
+# types and a generator of the block records of each frame. The records are
+# views of the memory-mapped mbFile, so they are read from disk when used
+def loadInpsBinary(ftFile = 'ft.npy', mbFile = 'mbInputs.npy') -> Tuple[List[str], Iterator[np.ndarray]]:
+    codes = np.load(ftFile)
+    records = np.load(mbFile, mmap_mode = 'r')
+    nb = records.shape[0] - int(codes.sum())
+    nI = int((codes == 0).sum())
+    nb = nb // nI if nI else 0
+    ft = ['I' if c == 0 else 'P' + str(c) for c in codes]
+    def frames():
+        k = 0
+        for c in codes:
+            n = nb if c == 0 else int(c)
+            yield records[k:k+n]
+            k += n
+    return (ft, frames())
+
+
 ################### Execution as main ####################
 
 if __name__ == '__main__':
@@ -101,5 +228,7 @@ if __name__ == '__main__':
     bs = int(args[2])
     nb = int(fs[0]*fs[1]/(bs**2))
     ft = genFtStream(int(args[3]), nb)
-    mb = genInpStream(ft, fs, bs)
-    saveInpsToFile(ft, mb)
+    if '--binary' in args:
+        saveInpsToBinary(ft, iterInpArrays(ft, fs, bs), fs, bs)
+    else:
+        saveInpsToFile(ft, iterInpStream(ft, fs, bs))